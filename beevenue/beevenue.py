@@ -22,6 +22,7 @@ from .flask import BeevenueFlaskImpl
 from .init import init_app as context_init_app
 from .login_manager import login_manager
 from .principal import principal
+from .redis_init import init_app as redis_init_app
 from .fast.init import init_app as fast_init_app
 from .strawberry.init import init_app as strawberry_init_app
 
@@ -62,6 +63,7 @@ def get_application(
         principal.init_app(application)
         context_init_app(application)
         db_init_app(application)
+        redis_init_app(application)
         celery_init_app(application)
 
         application.register_blueprint(auth_bp)
@@ -17,8 +17,14 @@ def init_cli(app: BeevenueFlask) -> None:
     """Initialize CLI component of the application."""
 
     @app.cli.command("warmup")
-    def _warmup() -> None:
-        g.fast.fill()
+    @click.option(
+        "--workers",
+        default=1,
+        type=click.IntRange(min=1),
+        help="How many processes load media from the database.",
+    )
+    def _warmup(workers: int) -> None:
+        g.fast.fill(workers)
 
     @app.cli.command("import")
     @click.argument("file_paths", nargs=-1, type=click.Path(exists=True))
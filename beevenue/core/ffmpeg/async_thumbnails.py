@@ -2,11 +2,12 @@ import base64
 from typing import Any, List, Optional, Tuple
 
 from flask import current_app
-from redis import Redis
+
+from beevenue.redis_init import RedisDatabase, redis_client
 
 
 def start_persisting(medium_id: int) -> None:
-    redis = Redis(host="redis", db=2)
+    redis = redis_client(RedisDatabase.TEMPORARY_THUMBNAILS)
     redis.set(f"T_{medium_id}", "")
 
 
@@ -17,7 +18,7 @@ def finish_persisting(
         "BEEVENUE_TEMPORARY_THUMBNAIL_EXPIRY_SECONDS"
     ]
 
-    redis = Redis(host="redis", db=2)
+    redis = redis_client(RedisDatabase.TEMPORARY_THUMBNAILS)
     redis_dict: Any = {}
 
     idx = 0
@@ -34,20 +35,22 @@ def finish_persisting(
 
     redis_dict[f"T_{medium_id}"] = ",".join(list(redis_dict.keys()))
 
-    redis.mset(redis_dict)
-    for key in redis_dict:
-        redis.expire(key, expiry_seconds)
+    with redis.pipeline() as pipe:
+        pipe.mset(redis_dict)
+        for key in redis_dict:
+            pipe.expire(key, expiry_seconds)
+        pipe.execute()
 
 
 def pick(medium_id: int, size_pixels: int, idx: int) -> Optional[bytes]:
-    redis = Redis(host="redis", db=2)
+    redis = redis_client(RedisDatabase.TEMPORARY_THUMBNAILS)
 
     key = f"T_{medium_id}_{size_pixels}_{idx}"
     return redis.get(key)
 
 
 def cleanup(medium_id: int) -> None:
-    redis = Redis(host="redis", db=2)
+    redis = redis_client(RedisDatabase.TEMPORARY_THUMBNAILS)
     meta_key = f"T_{medium_id}"
 
     keys_as_string = redis.get(meta_key)
@@ -70,7 +73,7 @@ def try_load(medium_id: int) -> Optional[List[str]]:
         size_pixels = thumbnail_size_pixels
         break
 
-    redis = Redis(host="redis", db=2)
+    redis = redis_client(RedisDatabase.TEMPORARY_THUMBNAILS)
 
     status = redis.get(f"T_{medium_id}")
     if status is None:
@@ -1,15 +1,15 @@
 from typing import Optional
 from uuid import uuid4, UUID
-from redis import Redis
 
 from flask import current_app
 
 from beevenue import paths
 from beevenue.flask import g
+from beevenue.redis_init import RedisDatabase, redis_client
 
 
 def request(medium_id: int) -> Optional[str]:
-    redis = Redis(host="redis", db=1)
+    redis = redis_client(RedisDatabase.OTP)
 
     tiny = g.fast.get_medium(medium_id)
     if not tiny:
@@ -32,7 +32,7 @@ def resolve_and_destroy(secret: str) -> Optional[str]:
     except ValueError:
         return None
 
-    redis = Redis(host="redis", db=1)
+    redis = redis_client(RedisDatabase.OTP)
     stored_bytes = redis.get(secret)
 
     if stored_bytes:
@@ -1,8 +1,12 @@
 from abc import ABCMeta, abstractmethod
 from re import Match
-from typing import Any, List, NamedTuple, Optional, Set
+from typing import Any, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
 
 from ...document_types import TinyMediumDocument
+from ...fast.columnar import ColumnarSnapshot
+from ...fast.types import CacheEntityKind
 
 
 class ParsableMixin(metaclass=ABCMeta):
@@ -18,6 +22,14 @@ class ParsableMixin(metaclass=ABCMeta):
 class FilteringSearchTerm(ParsableMixin, metaclass=ABCMeta):
     """Abstract base class for all search terms."""
 
+    # Rough cost of evaluating this term, relative to simply comparing
+    # some field of each medium against some value.
+    COST = 1.0
+
+    # Whether this term's results only change when media change,
+    # so they can be cached until the next generation.
+    IS_CACHEABLE = True
+
     @classmethod
     def from_match(cls, match: Match) -> "FilteringSearchTerm":
         return cls(**match.groupdict())  # type: ignore
@@ -26,6 +38,31 @@ class FilteringSearchTerm(ParsableMixin, metaclass=ABCMeta):
     def applies_to(self, medium: TinyMediumDocument) -> bool:
         """Does this FilteringSearchTerm apply to this medium?"""
 
+    def mask(self, snapshot: ColumnarSnapshot) -> Optional[np.ndarray]:
+        """Vectorized version of applies_to, for all rows of the snapshot.
+
+        Returns None if this term doesn't support that. In that case,
+        applies_to is used instead."""
+        return None
+
+    def indexed_tag(self) -> Optional[Tuple[CacheEntityKind, str]]:
+        """Tag whose ids in the tag index (if any) decide this term.
+
+        Looking it up there is much cheaper than checking all media."""
+        return None
+
+    def excluded_tag(self) -> Optional[Tuple[CacheEntityKind, str]]:
+        """Like indexed_tag, but this term applies to all media NOT in it."""
+        return None
+
+    def cost(self) -> float:
+        """Rough cost of evaluating this term (see COST)."""
+        return self.COST
+
+    def is_cacheable(self) -> bool:
+        """Can results of this term be cached (see IS_CACHEABLE)?"""
+        return self.IS_CACHEABLE
+
     def __eq__(self, other: object) -> bool:
         """Support hash-based equality."""
         return self.__hash__() == other.__hash__()
@@ -39,12 +76,51 @@ class FilteringSearchTerm(ParsableMixin, metaclass=ABCMeta):
         return hash(self.__repr__())
 
 
+# Where some row is in the order of a SortingSearchTerm:
+# Its sort key, and (to break ties) its medium id.
+SortPosition = Tuple[Any, int]
+
+# Which order a SortingSearchTerm sorts by: The name of its sort key, and
+# its direction ("asc" or "desc"). Terms with equal ones sort equally.
+SortOrderKey = Tuple[str, str]
+
+
 class SortingSearchTerm(ParsableMixin, metaclass=ABCMeta):
     """Search term which states that the output be sorted a certain way."""
 
     @abstractmethod
-    def sort(self, media: Set[TinyMediumDocument]) -> List[TinyMediumDocument]:
-        "Returns list of specified media, but now ordered by this term."
+    def window(
+        self,
+        snapshot: ColumnarSnapshot,
+        rows: np.ndarray,
+        start: int,
+        stop: int,
+    ) -> np.ndarray:
+        """Which of these rows come at positions start..stop-1 when ordered
+        by this term?
+
+        Only that window is sorted, not all rows."""
+
+    @abstractmethod
+    def page_after(
+        self,
+        snapshot: ColumnarSnapshot,
+        rows: np.ndarray,
+        position: Optional[SortPosition],
+        size: int,
+    ) -> np.ndarray:
+        """Which (at most size) of these rows come right after this position
+        when ordered by this term? If there is no position, the first ones.
+
+        Finding them costs the same, no matter how far along position is."""
+
+    @abstractmethod
+    def position(self, snapshot: ColumnarSnapshot, row: int) -> SortPosition:
+        """Where does this row come when ordered by this term?"""
+
+    @abstractmethod
+    def order_key(self) -> SortOrderKey:
+        """Which order does this term sort by?"""
 
 
 class SearchTerms(NamedTuple):
@@ -55,3 +131,11 @@ class SearchTerms(NamedTuple):
 
     def __bool__(self) -> bool:
         return bool(self.sorting) or any(self.filtering)
+
+    def cache_key(self) -> Optional[str]:
+        """Equal for all SearchTerms which find the same media (in any order).
+
+        None if these results can't be cached."""
+        if not all(term.is_cacheable() for term in self.filtering):
+            return None
+        return " ".join(sorted(repr(term) for term in self.filtering))
@@ -0,0 +1,54 @@
+"""Opaque cursors, telling the next page of search results where to start.
+
+A cursor holds the position of the last medium on the previous page, so
+clients can't (and shouldn't) do anything with it but send it back.
+It also holds the sort order it was made for, since a position in one
+order means nothing in any other."""
+
+import base64
+import binascii
+import json
+from typing import NamedTuple, Optional
+
+from .base import SortOrderKey, SortPosition
+
+
+class Cursor(NamedTuple):
+    """Decoded cursor."""
+
+    order: SortOrderKey
+    position: SortPosition
+
+
+def encode_cursor(order: SortOrderKey, position: SortPosition) -> str:
+    name, direction = order
+    key, medium_id = position
+    raw_bytes = json.dumps([name, direction, key, medium_id]).encode("utf-8")
+    # Without padding, cursors can go into URLs as they are.
+    return base64.urlsafe_b64encode(raw_bytes).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[Cursor]:
+    """Get the order and position of this cursor, or None if it isn't
+    valid."""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        raw_bytes = base64.urlsafe_b64decode((cursor + padding).encode("ascii"))
+        decoded = json.loads(raw_bytes)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+    if not isinstance(decoded, list) or len(decoded) != 4:
+        return None
+
+    name, direction, key, medium_id = decoded
+    if not isinstance(name, str) or direction not in ("asc", "desc"):
+        return None
+    if not isinstance(key, (int, float)) or not isinstance(medium_id, int):
+        return None
+    return Cursor((name, direction), (key, medium_id))
+
+
+def is_valid_cursor(cursor: str) -> bool:
+    """Is this a valid cursor (or empty, for the very first page)?"""
+    return not cursor or decode_cursor(cursor) is not None
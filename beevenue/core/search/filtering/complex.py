@@ -1,9 +1,13 @@
 from abc import ABCMeta, abstractmethod
 from datetime import date, timedelta
 from decimal import Decimal
+import operator
 from typing import Any, Callable, Dict, Generic, TypeVar
 
+import numpy as np
+
 from ....document_types import TinyMediumDocument
+from ....fast.columnar import ColumnarSnapshot
 from ..base import FilteringSearchTerm
 
 Comparable = Any
@@ -18,6 +22,16 @@ OPS: Dict[str, Callable[[Comparable, Comparable], bool]] = {
     "!=": lambda x, y: bool(x != y),
 }
 
+# Element-wise versions of OPS (for already normalized operators).
+ARRAY_OPS: Dict[str, Callable[[Any, Any], np.ndarray]] = {
+    "=": operator.eq,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "!=": operator.ne,
+}
+
 
 TNumber = TypeVar("TNumber")
 
@@ -71,6 +85,10 @@ class OperatorSearchTerm(
 
         self.number: TNumber = self.parse_number(number)
 
+    def array_op(self, left: Any, right: Any) -> np.ndarray:
+        """Like self.op, but element-wise for numpy arrays."""
+        return ARRAY_OPS[self.operator_string](left, right)
+
 
 class CountingSearchTerm(OperatorSearchTerm[int], IntComparisonMixin):
     """Search term which simply counts innate tags."""
@@ -79,6 +97,9 @@ class CountingSearchTerm(OperatorSearchTerm[int], IntComparisonMixin):
         # Note! Only count *innate* tags, not implications, aliases, etc...
         return self.op(len(medium.innate_tag_names), self.number)
 
+    def mask(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        return self.array_op(snapshot.innate.counts, self.number)
+
     def __repr__(self) -> str:
         return f"tags{self.operator_string}{self.number}"
 
@@ -86,6 +107,9 @@ class CountingSearchTerm(OperatorSearchTerm[int], IntComparisonMixin):
 class CategorySearchTerm(OperatorSearchTerm[int], IntComparisonMixin):
     """Search term which counts innate tags of a specific category."""
 
+    # Has to look at every single tag name.
+    COST = 10.0
+
     def __init__(self, category: str, *args: Any, **kwargs: Any):
         super().__init__(*args, **kwargs)
         self.category = category
@@ -99,6 +123,16 @@ class CategorySearchTerm(OperatorSearchTerm[int], IntComparisonMixin):
 
         return self.op(len(matching_tag_names), self.number)
 
+    def mask(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        matching_tag_ids = [
+            i
+            for t, i in snapshot.tag_ids_by_name.items()
+            if t.startswith(f"{self.category}:")
+        ]
+
+        counts = snapshot.innate.count_per_row(matching_tag_ids)
+        return self.array_op(counts, self.number)
+
     def __repr__(self) -> str:
         return f"{self.category}tags{self.operator_string}{self.number}"
 
@@ -114,15 +148,24 @@ class AgeSearchTerm(OperatorSearchTerm[int], IntComparisonMixin):
         "y": timedelta(weeks=52),
     }
 
+    # Results change every day, even if no media do.
+    IS_CACHEABLE = False
+
     def __init__(self, period: str, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
         self.period = period[0]
 
-    def applies_to(self, medium: TinyMediumDocument) -> bool:
-        target_date = date.today() - (
+    def _target_date(self) -> date:
+        return date.today() - (
             self.number * AgeSearchTerm.DELTA_PER_PERIOD[self.period]
         )
-        return self.op(target_date, medium.insert_date)
+
+    def applies_to(self, medium: TinyMediumDocument) -> bool:
+        return self.op(self._target_date(), medium.insert_date)
+
+    def mask(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        target_ordinal = self._target_date().toordinal()
+        return self.array_op(target_ordinal, snapshot.insert_dates)
 
     def __repr__(self) -> str:
         return f"age{self.operator_string}{self.number}{self.period}"
@@ -137,9 +180,14 @@ class FilesizeSearchTerm(OperatorSearchTerm[int], IntComparisonMixin):
         super().__init__(*args, **kwargs)
         self.unit = unit[0].lower()
 
+    def _target(self) -> int:
+        return self.number * FilesizeSearchTerm.SIZE_PER_UNIT[self.unit]
+
     def applies_to(self, medium: TinyMediumDocument) -> bool:
-        target = self.number * FilesizeSearchTerm.SIZE_PER_UNIT[self.unit]
-        return self.op(medium.filesize, target)
+        return self.op(medium.filesize, self._target())
+
+    def mask(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        return self.array_op(snapshot.filesizes, self._target())
 
     def __repr__(self) -> str:
         return f"filesize{self.operator_string}{self.number}{self.unit}"
@@ -159,6 +207,13 @@ class DimensionSearchTerm(OperatorSearchTerm[int], IntComparisonMixin):
             target = medium.height
         return self.op(target, self.number)
 
+    def mask(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        if self.dimension == "width":
+            targets = snapshot.widths
+        else:
+            targets = snapshot.heights
+        return self.array_op(targets, self.number)
+
     def __repr__(self) -> str:
         return f"{self.dimension}{self.operator_string}{self.number}"
 
@@ -168,6 +223,9 @@ class AspectRatioSearchTerm(
 ):
     """Search term which compares the aspect ratio against a decimal."""
 
+    # Divides, and compares Decimals.
+    COST = 5.0
+
     def applies_to(self, medium: TinyMediumDocument) -> bool:
         return self.op(medium.width / medium.height, self.number)
 
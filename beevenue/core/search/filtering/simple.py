@@ -2,9 +2,13 @@ from abc import ABC
 from beevenue.strawberry.rule import Rule
 from beevenue.strawberry.get import get_rules
 from re import Match
-from typing import NoReturn, Optional
+from typing import NoReturn, Optional, Tuple
+
+import numpy as np
 
 from ....document_types import TinyMediumDocument
+from ....fast.columnar import ColumnarSnapshot
+from ....fast.types import CacheEntityKind
 from ..base import FilteringSearchTerm
 
 
@@ -26,6 +30,12 @@ class PositiveSearchTerm(BasicSearchTerm):
     def applies_to(self, medium: TinyMediumDocument) -> bool:
         return self.term in medium.searchable_tag_names
 
+    def mask(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        return snapshot.tag_mask(snapshot.searchable, self.term)
+
+    def indexed_tag(self) -> Tuple[CacheEntityKind, str]:
+        return CacheEntityKind.SEARCHABLE_TAG_INDEX, self.term
+
     @classmethod
     def from_match(cls, match: Match) -> "PositiveSearchTerm":
         return PositiveSearchTerm(match.group(0))
@@ -45,6 +55,12 @@ class ExactSearchTerm(BasicSearchTerm):
     def applies_to(self, medium: TinyMediumDocument) -> bool:
         return self.term in medium.innate_tag_names
 
+    def mask(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        return snapshot.tag_mask(snapshot.innate, self.term)
+
+    def indexed_tag(self) -> Tuple[CacheEntityKind, str]:
+        return CacheEntityKind.INNATE_TAG_INDEX, self.term
+
     @classmethod
     def from_match(cls, match: Match) -> "ExactSearchTerm":
         return ExactSearchTerm(match.group(1))
@@ -66,10 +82,19 @@ class RatingSearchTerm(FilteringSearchTerm):
     def applies_to(self, medium: TinyMediumDocument) -> bool:
         return medium.rating == self.rating
 
+    def mask(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        return snapshot.rating_mask(self.rating)
+
 
 class RuleSearchTerm(FilteringSearchTerm):
     """Search term like "rule:0". Returns violating media."""
 
+    # Rules can consist of any number of arbitrary parts.
+    COST = 50.0
+
+    # Rules can change without any media changing.
+    IS_CACHEABLE = False
+
     def __init__(self, rule_index: int):
         self.rule_index = rule_index
         self.rule: Optional[Rule] = None
@@ -108,3 +133,18 @@ class Negative(FilteringSearchTerm):
 
     def applies_to(self, medium: TinyMediumDocument) -> bool:
         return not self.inner_term.applies_to(medium)
+
+    def mask(self, snapshot: ColumnarSnapshot) -> Optional[np.ndarray]:
+        inner_mask = self.inner_term.mask(snapshot)
+        if inner_mask is None:
+            return None
+        return ~inner_mask
+
+    def excluded_tag(self) -> Optional[Tuple[CacheEntityKind, str]]:
+        return self.inner_term.indexed_tag()
+
+    def cost(self) -> float:
+        return self.inner_term.cost()
+
+    def is_cacheable(self) -> bool:
+        return self.inner_term.is_cacheable()
@@ -1,4 +1,4 @@
-from typing import Generic, List, TypeVar
+from typing import Generic, List, Optional, TypeVar
 
 TItem = TypeVar("TItem")
 
@@ -10,14 +10,20 @@ class Pagination(Generic[TItem]):
         self,
         items: List[TItem],
         page_count: int,
-        page_number: int,
+        page_number: Optional[int],
         page_size: int,
+        next_cursor: Optional[str] = None,
     ):
         self.items = items
         self.page_count = page_count
+
+        # Unknown when paging by cursor.
         self.page_number = page_number
         self.page_size = page_size
 
+        # Only when paging by cursor, and there are more pages.
+        self.next_cursor = next_cursor
+
     @staticmethod
     def empty() -> "Pagination[TItem]":
         return Pagination(items=[], page_count=0, page_number=1, page_size=1)
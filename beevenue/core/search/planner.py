@@ -0,0 +1,130 @@
+"""Decides in which order filtering search terms are evaluated.
+
+Terms answered by the tag index go first, most selective tag first, since
+they are cheapest. Then all other terms follow, cheapest first. While many
+candidates are left, those are evaluated for all media at once. Once only
+a few are left, the rest is checked medium by medium, on just those.
+"""
+
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from beevenue.flask import g
+
+from ...fast.columnar import ColumnarSnapshot, TagColumn
+from ...fast.tag_index import NO_IDS, TaggedIds
+from ...fast.types import CacheEntityKind
+from .base import FilteringSearchTerm
+
+# Checking one term for one medium in Python costs about as much as
+# checking it for this many media at once in numpy.
+PER_MEDIUM_FACTOR = 50
+
+IndexedTag = Tuple[CacheEntityKind, str]
+
+
+def _column(snapshot: ColumnarSnapshot, kind: CacheEntityKind) -> TagColumn:
+    if kind == CacheEntityKind.INNATE_TAG_INDEX:
+        return snapshot.innate
+    return snapshot.searchable
+
+
+class SearchPlan:
+    """All filtering search terms, split up and ordered by how they are
+    evaluated most efficiently."""
+
+    def __init__(
+        self, snapshot: ColumnarSnapshot, terms: Iterable[FilteringSearchTerm]
+    ) -> None:
+        self.snapshot = snapshot
+
+        # Tags all results have (least common first) or don't have.
+        self.included_tags: List[IndexedTag] = []
+        self.excluded_tags: List[IndexedTag] = []
+
+        # Everything else, cheapest first.
+        self.terms: List[FilteringSearchTerm] = []
+
+        for term in terms:
+            indexed_tag = term.indexed_tag()
+            if indexed_tag is not None:
+                self.included_tags.append(indexed_tag)
+                continue
+
+            excluded_tag = term.excluded_tag()
+            if excluded_tag is not None:
+                self.excluded_tags.append(excluded_tag)
+                continue
+
+            self.terms.append(term)
+
+        self.included_tags.sort(key=self._estimated_count)
+        self.terms.sort(key=lambda t: t.cost())
+
+    def _estimated_count(self, indexed_tag: IndexedTag) -> int:
+        kind, tag_name = indexed_tag
+        column = _column(self.snapshot, kind)
+        return self.snapshot.tag_count(column, tag_name)
+
+    def _included_ids(self) -> Optional[TaggedIds]:
+        ids: Optional[TaggedIds] = None
+        for indexed_tag in self.included_tags:
+            if self._estimated_count(indexed_tag) == 0:
+                return NO_IDS
+
+            # Least common tag first, so this only ever gets smaller.
+            term_ids = g.fast.get_tagged_ids(*indexed_tag)
+            if ids is None:
+                ids = term_ids
+            else:
+                ids = np.intersect1d(ids, term_ids, assume_unique=True)
+            if len(ids) == 0:
+                return NO_IDS
+        return ids
+
+    def _is_worth_vectorizing(self, candidate_count: int) -> bool:
+        return candidate_count * PER_MEDIUM_FACTOR >= len(self.snapshot)
+
+    def run(self) -> np.ndarray:
+        """Find the rows of all media all terms apply to."""
+        snapshot = self.snapshot
+
+        ids = self._included_ids()
+        if ids is not None:
+            if len(ids) == 0:
+                return np.zeros(0, dtype=np.int64)
+            mask = np.zeros(len(snapshot), dtype=bool)
+            mask[snapshot.rows_of(ids)] = True
+        else:
+            mask = np.ones(len(snapshot), dtype=bool)
+
+        for excluded_tag in self.excluded_tags:
+            excluded_ids = g.fast.get_tagged_ids(*excluded_tag)
+            mask[snapshot.rows_of(excluded_ids)] = False
+
+        per_medium_terms: List[FilteringSearchTerm] = []
+        for i, term in enumerate(self.terms):
+            if not self._is_worth_vectorizing(int(np.count_nonzero(mask))):
+                per_medium_terms.extend(self.terms[i:])
+                break
+
+            term_mask = term.mask(snapshot)
+            if term_mask is None:
+                per_medium_terms.append(term)
+            else:
+                mask &= term_mask
+
+        rows = np.flatnonzero(mask)
+        if not per_medium_terms:
+            return rows
+
+        media = snapshot.media
+        return np.array(
+            [
+                row
+                for row in rows
+                if all(term.applies_to(media[row]) for term in per_medium_terms)
+            ],
+            dtype=np.int64,
+        )
@@ -0,0 +1,109 @@
+"""Ids of the media recent searches found, so that paging through them (or
+running a popular search again) doesn't filter all media all over again.
+Sorting them is cheap enough to be done every time.
+
+Results are kept for one generation of the cache only. Once any Command
+changes some media, they are gone. In this process, the most recently used
+ones are kept (see BEEVENUE_SEARCH_CACHE_SIZE). Optionally, they are also
+shared with all other workers via Redis (see
+BEEVENUE_SEARCH_CACHE_REDIS_SECONDS).
+"""
+
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock
+from typing import Callable, Optional
+
+from flask import current_app
+import numpy as np
+
+from beevenue.flask import g
+from beevenue.redis_init import RedisDatabase, redis_client
+
+# Medium ids, in no particular order.
+SearchResult = np.ndarray
+
+_DTYPE = np.dtype("<u4")
+
+
+class _LruCache:
+    """The most recently used search results of this process."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._results: "OrderedDict[str, SearchResult]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[SearchResult]:
+        with self._lock:
+            result = self._results.get(key, None)
+            if result is not None:
+                self._results.move_to_end(key)
+            return result
+
+    def set(self, key: str, result: SearchResult) -> None:
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+
+
+def _redis_key(generation: int, key: str) -> str:
+    digest = sha1(key.encode("utf-8")).hexdigest()
+    return f"SEARCH:{generation}:{digest}"
+
+
+def _from_redis(generation: int, key: str) -> Optional[SearchResult]:
+    raw_bytes = redis_client(RedisDatabase.CACHE).get(
+        _redis_key(generation, key)
+    )
+    if raw_bytes is None:
+        return None
+    return np.frombuffer(raw_bytes, dtype=_DTYPE)
+
+
+def _to_redis(
+    generation: int, key: str, result: SearchResult, seconds: int
+) -> None:
+    redis_client(RedisDatabase.CACHE).set(
+        _redis_key(generation, key),
+        result.astype(_DTYPE, copy=False).tobytes(),
+        ex=seconds,
+    )
+
+
+def cached(
+    key: Optional[str],
+    generation: Optional[int],
+    search: Callable[[], SearchResult],
+) -> SearchResult:
+    """Get the search result for this key, or search for it if needed.
+
+    The generation is the one of the entities the search runs on. If key
+    or generation is None, the result is never cached."""
+    size = current_app.config.get("BEEVENUE_SEARCH_CACHE_SIZE", 128)
+    if key is None or generation is None or size <= 0:
+        return search()
+
+    # Other requests might already be searching a newer generation.
+    lru_key = f"{generation}:{key}"
+
+    lru = g.fast.derive("SEARCH_RESULTS", lambda: _LruCache(size))
+    result = lru.get(lru_key)
+    if result is not None:
+        return result
+
+    seconds = current_app.config.get("BEEVENUE_SEARCH_CACHE_REDIS_SECONDS", 0)
+    if seconds > 0:
+        result = _from_redis(generation, key)
+
+    if result is None:
+        result = search()
+        if seconds > 0:
+            _to_redis(generation, key, result, seconds)
+
+    # Shared between all requests of this process, so nobody may change it.
+    result.setflags(write=False)
+    lru.set(lru_key, result)
+    return result
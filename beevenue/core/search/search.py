@@ -1,15 +1,23 @@
-from typing import List, Set
+from typing import List, Optional, Tuple
+
+import numpy as np
+from sentry_sdk import start_span
+from werkzeug.exceptions import BadRequest
 
 from beevenue.flask import g
 
 from beevenue.flask import request
 
-from ...document_types import MediumDocument, TinyMediumDocument
+from ...document_types import MediumDocument
+from ...fast.columnar import ColumnarSnapshot
 
 from .batch_search_results import BatchSearchResults
+from .cursor import decode_cursor, encode_cursor
 from .pagination import Pagination
 from .parse import parse_search_terms
-from .base import SearchTerms
+from .planner import SearchPlan
+from .result_cache import SearchResult, cached
+from .base import SearchTerms, SortingSearchTerm
 from .filtering.simple import Negative, RatingSearchTerm
 from .sorting.simple import IdSortingSearchTerm
 
@@ -37,17 +45,23 @@ def run(search_term_list: List[str]) -> Pagination[MediumDocument]:
 
 
 def _run_unpaginated(search_terms: SearchTerms) -> BatchSearchResults:
-    medium_ids = _search(search_terms)
-    return BatchSearchResults(list(g.fast.get_many(list(medium_ids))))
+    snapshot, rows = _search(search_terms)
+    sorter = _sorter(search_terms)
+
+    with start_span(op="search", description="sort"):
+        ordered_rows = sorter.window(snapshot, rows, 0, len(rows))
+
+    medium_ids = snapshot.ids[ordered_rows].tolist()
+    return BatchSearchResults(list(g.fast.get_many(medium_ids)))
 
 
 def _run_paginated(search_terms: SearchTerms) -> Pagination[MediumDocument]:
-    sorted_medium_ids = _search(search_terms)
+    snapshot, rows = _search(search_terms)
 
-    if not sorted_medium_ids:
+    if len(rows) == 0:
         return Pagination.empty()
 
-    pagination = _paginate(sorted_medium_ids)
+    pagination = _paginate(snapshot, rows, _sorter(search_terms))
     return pagination  # type: ignore
 
 
@@ -63,45 +77,59 @@ def _censor(search_terms: SearchTerms) -> SearchTerms:
     return search_terms
 
 
-def _search(search_terms: SearchTerms) -> List[int]:
+def _sorter(search_terms: SearchTerms) -> SortingSearchTerm:
+    return search_terms.sorting or IdSortingSearchTerm(is_descending=True)
+
+
+def _search(search_terms: SearchTerms) -> Tuple[ColumnarSnapshot, np.ndarray]:
+    """Find the rows of all media matching these terms, in no particular
+    order."""
     search_terms = _censor(search_terms)
+    snapshot, generation = g.fast.get_columnar_with_generation()
+
+    medium_ids = cached(
+        search_terms.cache_key(),
+        generation,
+        lambda: _filter(snapshot, search_terms),
+    )
+    return snapshot, snapshot.rows_of(medium_ids)
+
 
-    all_media = g.fast.get_all_tiny()
-    search_results: Set[TinyMediumDocument] = set()
+def _filter(
+    snapshot: ColumnarSnapshot, search_terms: SearchTerms
+) -> SearchResult:
+    with start_span(op="search", description="filter") as span:
+        rows = SearchPlan(snapshot, search_terms.filtering).run()
+        span.set_data("results", len(rows))
+    return snapshot.ids[rows]
 
-    for medium in all_media:
-        for search_term in search_terms.filtering:
-            if not search_term.applies_to(medium):
-                break
-        else:
-            search_results.add(medium)
 
-    sorter = search_terms.sorting or IdSortingSearchTerm(is_descending=True)
-    sorted_results = sorter.sort(search_results)
-    return [m.medium_id for m in sorted_results]
+def _paginate(
+    snapshot: ColumnarSnapshot, rows: np.ndarray, sorter: SortingSearchTerm
+) -> Pagination[int]:
+    page_size_arg: str = request.args.get("pageSize", type=str)  # type: ignore
+    page_size = max(min(int(page_size_arg), 100), 10)
 
+    cursor: Optional[str] = request.args.get("cursor", type=str)
+    if cursor is not None:
+        return _paginate_by_cursor(snapshot, rows, sorter, cursor, page_size)
 
-def _paginate(ids: List[int]) -> Pagination[int]:
     page_number_arg: str = request.args.get(  # type: ignore
         "pageNumber", type=str
     )
-    page_size_arg: str = request.args.get("pageSize", type=str)  # type: ignore
-
-    page_number = int(page_number_arg)
-    page_size = int(page_size_arg)
+    page_number = max(int(page_number_arg), 1)
 
-    page_number = max(page_number, 1)
-    page_size = max(min(page_size, 100), 10)
-
-    page_count = len(ids) // page_size
-    if (len(ids) % page_size) != 0:
-        page_count += 1
+    page_count = _page_count(rows, page_size)
 
     # Be nice. If the client skips too far ahead,
     # they get the last page instead.
     page_number = min(page_number, page_count)
     skip = (page_number - 1) * page_size
-    paginated_ids = ids[skip : skip + page_size]
+
+    # Only this one page needs to be sorted.
+    with start_span(op="search", description="sort"):
+        window = sorter.window(snapshot, rows, skip, skip + page_size)
+    paginated_ids = snapshot.ids[window].tolist()
 
     return Pagination(
         items=g.fast.get_many(paginated_ids),
@@ -109,3 +137,45 @@ def _paginate(ids: List[int]) -> Pagination[int]:
         page_number=page_number,
         page_size=page_size,
     )
+
+
+def _paginate_by_cursor(
+    snapshot: ColumnarSnapshot,
+    rows: np.ndarray,
+    sorter: SortingSearchTerm,
+    cursor: str,
+    page_size: int,
+) -> Pagination[int]:
+    position = None
+    if cursor:
+        decoded = decode_cursor(cursor)
+        if decoded is None or decoded.order != sorter.order_key():
+            # Somebody changed the sort order, but kept paging.
+            raise BadRequest("Cursor does not match this sort order.")
+        position = decoded.position
+
+    # One more than needed, to find out if there are more pages.
+    with start_span(op="search", description="sort"):
+        page = sorter.page_after(snapshot, rows, position, page_size + 1)
+
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = encode_cursor(
+            sorter.order_key(), sorter.position(snapshot, int(page[-1]))
+        )
+
+    return Pagination(
+        items=g.fast.get_many(snapshot.ids[page].tolist()),
+        page_count=_page_count(rows, page_size),
+        page_number=None,
+        page_size=page_size,
+        next_cursor=next_cursor,
+    )
+
+
+def _page_count(rows: np.ndarray, page_size: int) -> int:
+    page_count = len(rows) // page_size
+    if (len(rows) % page_size) != 0:
+        page_count += 1
+    return page_count
@@ -1,11 +1,77 @@
 from abc import ABCMeta, abstractmethod
 from re import Match
-from typing import Any, Callable, List, Literal, Set
+from typing import Any, List, Literal, Optional
 
-from beevenue.document_types import TinyMediumDocument
-from ..base import SortingSearchTerm
+import numpy as np
 
-SortingLambda = Callable[[TinyMediumDocument], Any]
+from beevenue.fast.columnar import ColumnarSnapshot, SortOrder
+from ..base import SortingSearchTerm, SortOrderKey, SortPosition
+
+
+# Walking a sort order, this many rows are checked at first.
+_MIN_STEP = 256
+
+# Rotation sort key of media which are 0x0. Any real ratio is larger.
+_NO_RATIO = -1.0
+
+
+def _ascending_window(
+    keys: np.ndarray, ids: np.ndarray, start: int, stop: int
+) -> np.ndarray:
+    """Positions of the entries at start..stop-1 when ordered by (key, id).
+
+    Only the entries up to stop are sorted. Finding them is O(n)."""
+    if stop < len(keys):
+        # Everything up to stop is at most this large (ties included).
+        largest = np.partition(keys, stop - 1)[stop - 1]
+        candidates = np.flatnonzero(keys <= largest)
+    else:
+        candidates = np.arange(len(keys))
+
+    order = np.lexsort((ids[candidates], keys[candidates]))
+    return candidates[order[start:stop]]
+
+
+def _first_members(
+    ordered_rows: np.ndarray, rows: np.ndarray, row_count: int, count: int
+) -> np.ndarray:
+    """The first count entries of ordered_rows which are in rows.
+
+    Stops walking ordered_rows as soon as enough have been found."""
+    is_member = np.zeros(row_count, dtype=bool)
+    is_member[rows] = True
+
+    # If members are spread out evenly, we'll find enough about here.
+    step = max(count * row_count // max(len(rows), 1), _MIN_STEP)
+
+    found: List[np.ndarray] = []
+    found_count = 0
+    begin = 0
+    while found_count < count and begin < len(ordered_rows):
+        chunk = ordered_rows[begin : begin + step]
+        members = chunk[is_member[chunk]]
+        found.append(members)
+        found_count += len(members)
+
+        begin += step
+        step *= 2
+
+    if not found:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(found)[:count]
+
+
+def _index_in(
+    order: SortOrder, ids: np.ndarray, position: SortPosition, side: str
+) -> int:
+    """Where this position would be inserted into this order."""
+    key, medium_id = position
+    first = int(np.searchsorted(order.keys, key, "left"))
+    end = int(np.searchsorted(order.keys, key, "right"))
+
+    # Within the same key, rows are ordered by id.
+    tied_ids = ids[order.rows[first:end]]
+    return first + int(np.searchsorted(tied_ids, medium_id, side))
 
 
 class ReversibleSortingSearchTerm(SortingSearchTerm, metaclass=ABCMeta):
@@ -27,35 +93,127 @@ class ReversibleSortingSearchTerm(SortingSearchTerm, metaclass=ABCMeta):
 
         return cls(is_descending, **groups)  # type: ignore
 
-    def sort(self, media: Set[TinyMediumDocument]) -> List[TinyMediumDocument]:
-        return sorted(media, key=self.sorter, reverse=self.is_descending)
+    def window(
+        self,
+        snapshot: ColumnarSnapshot,
+        rows: np.ndarray,
+        start: int,
+        stop: int,
+    ) -> np.ndarray:
+        count = len(rows)
+        stop = min(stop, count)
+        if start >= stop:
+            return np.zeros(0, dtype=np.int64)
+
+        # Walking the sort order until the window is complete takes about
+        # stop * len(snapshot) / count steps. For rare rows, it is cheaper
+        # to just look at those.
+        if stop * len(snapshot) > count * count:
+            return self._window_of_rows(snapshot, rows, start, stop)
+
+        ordered_rows = self._sort_order(snapshot).rows
+        if self.is_descending:
+            ordered_rows = ordered_rows[::-1]
+
+        return _first_members(ordered_rows, rows, len(snapshot), stop)[start:]
+
+    def page_after(
+        self,
+        snapshot: ColumnarSnapshot,
+        rows: np.ndarray,
+        position: Optional[SortPosition],
+        size: int,
+    ) -> np.ndarray:
+        if position is None:
+            return self.window(snapshot, rows, 0, size)
+
+        count = len(rows)
+        if size * len(snapshot) > count * count:
+            later = self._is_after(snapshot, rows, position)
+            return self.window(snapshot, rows[later], 0, size)
+
+        order = self._sort_order(snapshot)
+        if self.is_descending:
+            end = _index_in(order, snapshot.ids, position, "left")
+            ordered_rows = order.rows[:end][::-1]
+        else:
+            begin = _index_in(order, snapshot.ids, position, "right")
+            ordered_rows = order.rows[begin:]
+
+        return _first_members(ordered_rows, rows, len(snapshot), size)
+
+    def position(self, snapshot: ColumnarSnapshot, row: int) -> SortPosition:
+        key = self.sort_key(snapshot)[row].item()
+        return key, int(snapshot.ids[row])
+
+    def order_key(self) -> SortOrderKey:
+        return self.sort_order_name, "desc" if self.is_descending else "asc"
+
+    def _sort_order(self, snapshot: ColumnarSnapshot) -> SortOrder:
+        return snapshot.sort_order(
+            self.sort_order_name, lambda: self.sort_key(snapshot)
+        )
+
+    def _is_after(
+        self,
+        snapshot: ColumnarSnapshot,
+        rows: np.ndarray,
+        position: SortPosition,
+    ) -> np.ndarray:
+        keys = self.sort_key(snapshot)[rows]
+        ids = snapshot.ids[rows]
+        key, medium_id = position
+        if self.is_descending:
+            return (keys < key) | ((keys == key) & (ids < medium_id))
+        return (keys > key) | ((keys == key) & (ids > medium_id))
+
+    def _window_of_rows(
+        self,
+        snapshot: ColumnarSnapshot,
+        rows: np.ndarray,
+        start: int,
+        stop: int,
+    ) -> np.ndarray:
+        keys = self.sort_key(snapshot)[rows]
+        ids = snapshot.ids[rows]
+        if not self.is_descending:
+            return rows[_ascending_window(keys, ids, start, stop)]
+
+        # Descending is just ascending, read from the back.
+        count = len(rows)
+        positions = _ascending_window(keys, ids, count - stop, count - start)
+        return rows[positions[::-1]]
 
     @property
     @abstractmethod
-    def sorter(self) -> SortingLambda:
-        """Specifies which part of TinyMediumDocument to sort by."""
+    def sort_order_name(self) -> str:
+        """Name of the sort key, shared by all terms which use the same."""
+
+    @abstractmethod
+    def sort_key(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        """Specifies which column of the snapshot to sort by."""
 
 
 class IdSortingSearchTerm(ReversibleSortingSearchTerm):
     """Sorts media by their ID numbers."""
 
-    @property
-    def sorter(self) -> SortingLambda:
-        def _sorter(medium: TinyMediumDocument) -> int:
-            return medium.medium_id
+    def sort_key(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        return snapshot.ids
 
-        return _sorter
+    @property
+    def sort_order_name(self) -> str:
+        return "id"
 
 
 class FilesizeSortingSearchTerm(ReversibleSortingSearchTerm):
     """Sorts media by their filesize."""
 
-    @property
-    def sorter(self) -> SortingLambda:
-        def _sorter(medium: TinyMediumDocument) -> Any:
-            return medium.filesize
+    def sort_key(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        return snapshot.filesizes
 
-        return _sorter
+    @property
+    def sort_order_name(self) -> str:
+        return "filesize"
 
 
 class AgeSortingSearchTerm(ReversibleSortingSearchTerm):
@@ -65,12 +223,12 @@ class AgeSortingSearchTerm(ReversibleSortingSearchTerm):
         super().__init__(*args, **kwargs)
         self.is_descending = not self.is_descending
 
-    @property
-    def sorter(self) -> SortingLambda:
-        def _sorter(medium: TinyMediumDocument) -> Any:
-            return medium.medium_id
+    def sort_key(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        return snapshot.ids
 
-        return _sorter
+    @property
+    def sort_order_name(self) -> str:
+        return "id"
 
 
 class RotationSortingSearchTerm(ReversibleSortingSearchTerm):
@@ -82,14 +240,24 @@ class RotationSortingSearchTerm(ReversibleSortingSearchTerm):
         super().__init__(*args, **kwargs)
         self.rotation = kwargs["rotation"]
 
-    @property
-    def sorter(self) -> SortingLambda:
-        def _sorter(medium: TinyMediumDocument) -> Any:
+    def sort_key(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        widths = snapshot.widths.astype(np.float64)
+        heights = snapshot.heights.astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
             if self.rotation == "portrait":
-                return medium.height / medium.width
-            return medium.width / medium.height
+                ratios = heights / widths
+            else:
+                ratios = widths / heights
 
-        return _sorter
+        # Sorting (and cursors) need finite keys. Media without any extent
+        # come first, those with only one come last. Ties go by id.
+        return np.nan_to_num(
+            ratios, nan=_NO_RATIO, posinf=np.finfo(np.float64).max
+        )
+
+    @property
+    def sort_order_name(self) -> str:
+        return self.rotation
 
 
 class DimensionSortingSearchTerm(ReversibleSortingSearchTerm):
@@ -101,11 +269,11 @@ class DimensionSortingSearchTerm(ReversibleSortingSearchTerm):
         super().__init__(*args, **kwargs)
         self.dimension = kwargs["dimension"]
 
-    @property
-    def sorter(self) -> SortingLambda:
-        def _sorter(medium: TinyMediumDocument) -> Any:
-            if self.dimension == "width":
-                return medium.width
-            return medium.height
+    def sort_key(self, snapshot: ColumnarSnapshot) -> np.ndarray:
+        if self.dimension == "width":
+            return snapshot.widths
+        return snapshot.heights
 
-        return _sorter
+    @property
+    def sort_order_name(self) -> str:
+        return self.dimension
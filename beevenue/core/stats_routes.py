@@ -1,10 +1,10 @@
-from collections import defaultdict
-
 from flask import Blueprint
 from flask.json import jsonify
 
 from beevenue.flask import g
 from .. import permissions
+from ..fast.columnar import RATINGS, histogram
+from ..fast.metrics import METRICS
 
 bp = Blueprint("stats", __name__)
 
@@ -12,21 +12,24 @@ bp = Blueprint("stats", __name__)
 @bp.route("/stats", methods=["GET"])
 @permissions.is_owner
 def stats():  # type: ignore
-    all_media = g.fast.get_all_tiny()
-
-    rating_statistics = {k: 0 for k in ["s", "q", "e", "u"]}
-    tag_histogram = defaultdict(int)
-    absent_tag_histogram = defaultdict(int)
+    snapshot = g.fast.get_columnar()
 
-    for medium in all_media:
-        rating_statistics[medium.rating] += 1
-        tag_histogram[len(medium.innate_tag_names)] += 1
-        absent_tag_histogram[len(medium.absent_tag_names)] += 1
+    rating_counts = snapshot.rating_counts()
+    rating_statistics = {
+        rating: int(rating_counts[code]) for code, rating in enumerate(RATINGS)
+    }
 
     return jsonify(
         {
-            "tagHistogram": tag_histogram,
-            "absentTagHistogram": absent_tag_histogram,
+            "tagHistogram": histogram(snapshot.innate.counts),
+            "absentTagHistogram": histogram(snapshot.absent.counts),
             "byRating": rating_statistics,
         }
     )
+
+
+@bp.route("/stats/cache", methods=["GET"])
+@permissions.is_owner
+def cache_stats():  # type: ignore
+    """Hits, misses and latencies of all cache layers (of this worker)."""
+    return jsonify(METRICS.to_json())
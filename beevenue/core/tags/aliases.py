@@ -80,5 +80,10 @@ def remove_alias(name: str, alias: str) -> None:
     session.delete(current_aliases[0])
     session.commit()
     delete_orphans()
-    signals.alias_removed.send(alias)
+    signals.alias_removed.send(
+        (
+            name,
+            alias,
+        )
+    )
     return None
@@ -5,6 +5,7 @@ from sqlalchemy import select
 
 from beevenue.flask import BeevenueContext, g
 
+from ...fast.columnar import RATINGS
 from ...models import Tag, TagImplication
 from .tag_summary import TagSummary, TagSummaryEntry
 
@@ -37,12 +38,11 @@ def _load_media_counts() -> CountsType:
     i.e. d["foo"] = {"q": 2, "e": 1, "s": 0, "u": 0}
     """
 
-    all_media = g.fast.get_all_tiny()
+    snapshot = g.fast.get_columnar()
     counts: CountsType = defaultdict(lambda: defaultdict(int))
 
-    for medium in all_media:
-        for name in medium.innate_tag_names:
-            counts[name][medium.rating] += 1
+    for name, rating_counts in snapshot.innate_rating_counts().items():
+        counts[name].update(zip(RATINGS, rating_counts))
 
     return counts
 
@@ -1,55 +1,226 @@
 """Top-level access to the Flask cache."""
+from contextlib import contextmanager
+import random
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from flask import current_app
 from redis import Redis
-from typing import Any, Dict, List, Mapping, Optional, Union
+from redis.client import Pipeline
+from redis.lock import Lock
+
+from beevenue.redis_init import RedisDatabase, redis_client
+
+from ..metrics import METRICS, layer_name
+from ..types import Change, Query, SubCache
+
+from .backends import DEFAULT_BACKEND, bind_schemas
+from .changes import GENERATION_KEY, ChangeLog
+from .dictionary import TagDictionary
+
+# Held by whoever is currently refilling all layers.
+REFILL_LOCK_KEY = "REFILL_LOCK"
 
-from ..types import Query, SubCache
+# How many entities are sent to Redis per MSET.
+MSET_BATCH_SIZE = 1000
 
-from .schemas import SCHEMAS
+# Outside of batches, how many MSETs are sent per round trip.
+PIPELINE_BATCH_SIZE = 10
+
+
+def _initial_generation() -> int:
+    # If Redis lost all data, counting up from zero again might reach a
+    # generation that other layers still remember. Starting at some
+    # random point instead makes that practically impossible.
+    return random.getrandbits(48)
 
 
 class ApplicationWideCache(SubCache):
     """Access to redis cache."""
 
     def __init__(self) -> None:
-        self.redis = Redis(host="redis")
+        self.redis = redis_client(RedisDatabase.CACHE)
+        self.schemas = bind_schemas(
+            TagDictionary(self.redis),
+            current_app.config.get("BEEVENUE_CACHE_BACKEND", DEFAULT_BACKEND),
+        )
+        self.changes = ChangeLog(self.redis)
+        self._generation: Optional[int] = None
+
+        # While batching, writes are queued up in this pipeline. Until it is
+        # sent, reads have to see the pending values (None means deleted).
+        self._pipeline: Optional[Pipeline] = None
+        self._pending: Dict[str, Optional[bytes]] = {}
+        self._generation_index: Optional[int] = None
+
+    @contextmanager
+    def batch(self, atomic: bool = True) -> Iterator[None]:
+        """Send all writes as a single MULTI/EXEC when leaving this context.
+
+        If anything goes wrong, none of them are sent at all. Unless 'atomic',
+        writes are sent right away instead (see set_many)."""
+        if self._pipeline is not None or not atomic:
+            yield
+            return
+
+        with self.redis.pipeline(transaction=True) as pipe:
+            self._pipeline = pipe
+            try:
+                yield
+                results = pipe.execute()
+                if self._generation_index is not None:
+                    self._generation = int(results[self._generation_index])
+            finally:
+                self._pipeline = None
+                self._pending = {}
+                self._generation_index = None
+
+    def _writer(self) -> Redis:
+        if self._pipeline is None:
+            return self.redis
+        return self._pipeline
+
+    def generation(self) -> int:
+        """Current generation of this cache's contents.
+
+        Only loaded once, so this stays stable for the current request."""
+        if self._generation is None:
+            raw_bytes = self.redis.get(GENERATION_KEY)
+            if raw_bytes is None:
+                self._generation = self.changes.generation(
+                    _initial_generation()
+                )
+            else:
+                self._generation = int(raw_bytes)
+        return self._generation
+
+    def bump_generation(self, change: Change) -> None:
+        if self._pipeline is None:
+            self._generation = int(
+                self.changes.append(self.redis, _initial_generation(), change)
+            )
+            return
+
+        self._generation_index = len(self._pipeline)
+        self.changes.append(self._pipeline, _initial_generation(), change)
+
+    def changes_since(
+        self, generation: int, until: int
+    ) -> Optional[List[Change]]:
+        """What has changed between these two generations?
+
+        Returns None if that is unknown (e.g. because it's been too long)."""
+        return self.changes.since(generation, until)
+
+    def refill_lock(self) -> Lock:
+        """Lock to make sure only one worker refills the caches at a time.
+
+        It expires eventually, so a crashed worker can't block everyone."""
+        timeout = current_app.config.get("BEEVENUE_REFILL_LOCK_SECONDS", 600)
+        return self.redis.lock(REFILL_LOCK_KEY, timeout=timeout)
+
+    def has(self, query: Query) -> bool:
+        """Is this entity in here? Cheaper than getting it."""
+        if query.hash in self._pending:
+            return self._pending[query.hash] is not None
+        return bool(self.redis.exists(query.hash))
 
     def delete(self, *queries: Query) -> int:
-        deleted_count: int = self.redis.delete(*[q.hash for q in queries])
-        return deleted_count
+        hashes = [q.hash for q in queries]
+        if self._pipeline is None:
+            deleted_count: int = self.redis.delete(*hashes)
+            return deleted_count
+
+        self._pipeline.delete(*hashes)
+        self._pending.update({h: None for h in hashes})
+
+        # We can't know until the batch is sent, so assume all of them.
+        return len(hashes)
+
+    def _get_raw(self, hashes: List[str]) -> List[Optional[bytes]]:
+        unknown = [h for h in hashes if h not in self._pending]
+        if not unknown:
+            fetched: Dict[str, Optional[bytes]] = {}
+        elif len(unknown) == 1:
+            fetched = {unknown[0]: self.redis.get(unknown[0])}
+        else:
+            fetched = dict(zip(unknown, self.redis.mget(unknown)))
+
+        return [self._pending.get(h, fetched.get(h, None)) for h in hashes]
+
+    def _deserialize(self, query: Query, raw_bytes: bytes) -> Any:
+        tic = time.perf_counter()
+        result = self.schemas[query.kind].deserialize(raw_bytes)
+        toc = time.perf_counter()
+
+        METRICS.record_decode(
+            layer_name(self), query.kind, len(raw_bytes), toc - tic
+        )
+        return result
 
     def get(self, query: Query) -> Optional[Any]:
-        raw_bytes = self.redis.get(query.hash)
+        (raw_bytes,) = self._get_raw([query.hash])
         if raw_bytes is None:
             return None
-        result = SCHEMAS[query.kind].deserialize(raw_bytes)
-        return result
+        return self._deserialize(query, raw_bytes)
 
     def set(self, query: Query, value: Any) -> None:
-        raw_bytes = SCHEMAS[query.kind].serialize(value)
-        self.redis.set(query.hash, raw_bytes)
+        raw_bytes = self.schemas[query.kind].serialize(value)
+        self._writer().set(query.hash, raw_bytes)
+        if self._pipeline is not None:
+            self._pending[query.hash] = raw_bytes
 
     def get_many(self, queries: List[Query]) -> Dict[Query, Any]:
         if len(queries) == 0:
             return {}
 
-        raw_bytes_list = self.redis.mget([q.hash for q in queries])
+        raw_bytes_list = self._get_raw([q.hash for q in queries])
 
         result = {}
         for query, raw_bytes in zip(queries, raw_bytes_list):
-            # Should never happen
-            if raw_bytes is None:  # pragma: no cover
-                raise Exception(f"Query {query} failed catastrophically.")
+            # Missing entries are left for the layers below us.
+            if raw_bytes is None:
+                continue
 
-            result[query] = SCHEMAS[queries[0].kind].deserialize(raw_bytes)
+            value = self._deserialize(query, raw_bytes)
+            if value is not None:
+                result[query] = value
 
         return result
 
     def set_many(self, values: Dict[Query, Any]) -> None:
-        raw_bytes_dict: Mapping[
-            Union[str, bytes], Union[bytes, float, int, str]
-        ] = {
-            query.hash: SCHEMAS[query.kind].serialize(value)
-            for (query, value) in values.items()
-        }
-
-        self.redis.mset(raw_bytes_dict)
+        if len(values) == 0:
+            return
+
+        if self._pipeline is not None:
+            raw_bytes_dict: Dict[str, bytes] = {
+                query.hash: self.schemas[query.kind].serialize(value)
+                for (query, value) in values.items()
+            }
+
+            # This only keeps each command reasonably small. Redis still runs
+            # all of them in one go once the batch is sent.
+            items = list(raw_bytes_dict.items())
+            for i in range(0, len(items), MSET_BATCH_SIZE):
+                self._pipeline.mset(dict(items[i : i + MSET_BATCH_SIZE]))
+
+            self._pending.update(raw_bytes_dict)
+            return
+
+        # Otherwise, there might be lots of values (e.g. when refilling).
+        # Only serialize as many as are about to be sent.
+        with self.redis.pipeline(transaction=False) as pipe:
+            chunk: Dict[str, bytes] = {}
+            for query, value in values.items():
+                chunk[query.hash] = self.schemas[query.kind].serialize(value)
+                if len(chunk) < MSET_BATCH_SIZE:
+                    continue
+
+                pipe.mset(chunk)
+                chunk = {}
+                if len(pipe) >= PIPELINE_BATCH_SIZE:
+                    pipe.execute()
+
+            if chunk:
+                pipe.mset(chunk)
+            pipe.execute()
@@ -0,0 +1,59 @@
+"""All ways of storing entities in Redis, selected by BEEVENUE_CACHE_BACKEND.
+
+Switching backends makes all documents already stored unreadable (they are
+just cache misses then), so the cache should be refilled afterwards (e.g.
+using "flask warmup").
+
+Some backends need modules that are not in requirements.txt, but only in
+requirements.optional.txt.
+"""
+
+from importlib import import_module
+from typing import Callable, Dict, Tuple
+
+from ..types import CacheEntityKind
+from . import msgpack_schemas, schemas, struct_schemas
+from .dictionary import TagIds
+from .schemas import Schema
+
+Backend = Callable[[TagIds], Dict[CacheEntityKind, Schema]]
+
+DEFAULT_BACKEND = "capnp"
+
+BACKENDS: Dict[str, Backend] = {
+    "capnp": schemas.bind_schemas,
+    "msgpack": msgpack_schemas.bind_schemas,
+    "struct": struct_schemas.bind_schemas,
+}
+
+_OPTIONAL_MODULES: Dict[str, Tuple[str, ...]] = {
+    "msgpack": ("msgpack",),
+}
+
+
+def check_backend(backend: str) -> None:
+    """Fail unless this backend exists and all modules it needs are there."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown cache backend: {backend}")
+
+    if backend == "capnp":
+        schemas.check_encodings()
+
+    for module in _OPTIONAL_MODULES.get(backend, ()):
+        try:
+            import_module(module)
+        except ImportError as error:
+            raise ImportError(
+                f'Cache backend "{backend}" needs module "{module}" '
+                "(see requirements.optional.txt)."
+            ) from error
+
+
+def bind_schemas(
+    tags: TagIds, backend: str = DEFAULT_BACKEND
+) -> Dict[CacheEntityKind, Schema]:
+    """Get schemas of this backend for all kinds."""
+    bind = BACKENDS.get(backend, None)
+    if bind is None:
+        raise ValueError(f"Unknown cache backend: {backend}")
+    return bind(tags)
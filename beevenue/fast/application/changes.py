@@ -0,0 +1,110 @@
+from typing import Any, List, Optional
+
+from redis import Redis
+
+from ..types import Change, ChangeKind
+
+# Incremented by every Command, so other layers can tell when
+# their copies of our contents have become outdated.
+GENERATION_KEY = "GEN"
+
+# Stream of what each generation has changed. Entry "<n>-1" describes
+# what happened to get to generation n.
+CHANGES_KEY = "CHANGES"
+
+# Roughly how many changes are kept. Anyone further behind than that
+# has to start over.
+MAX_CHANGES = 10000
+
+# If the generation has been lost, the log starts over along with it.
+# (Its old entries would be in the way of the new ones.)
+_INITIALIZE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+  redis.call('SET', KEYS[1], ARGV[1])
+  redis.call('DEL', KEYS[2])
+end
+"""
+
+_INITIALIZE_SCRIPT = (
+    _INITIALIZE
+    + """
+return redis.call('GET', KEYS[1])
+"""
+)
+
+# Bumping the generation and logging why must happen atomically, or
+# somebody might miss a change.
+_BUMP_SCRIPT = (
+    _INITIALIZE
+    + """
+local generation = redis.call('INCR', KEYS[1])
+-- Lua numbers are doubles, so make sure this isn't printed as one.
+local id = string.format('%d-1', generation)
+redis.call(
+  'XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], id,
+  'k', ARGV[3], 'i', ARGV[4], 'h', ARGV[5]
+)
+return generation
+"""
+)
+
+
+class ChangeLog:
+    """Append-only log of all changes, stored in Redis."""
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+        self._initialize = redis.register_script(_INITIALIZE_SCRIPT)
+        self._bump = redis.register_script(_BUMP_SCRIPT)
+
+    def generation(self, initial: int) -> int:
+        """Current generation (which starts at 'initial' if it is new)."""
+        return int(
+            self._initialize(keys=[GENERATION_KEY, CHANGES_KEY], args=[initial])
+        )
+
+    def append(self, writer: Redis, initial: int, change: Change) -> Any:
+        """Bump the generation, logging this change as its reason.
+
+        If the generation doesn't exist yet, it starts at 'initial'.
+        Returns the new generation (or a pipeline, if writer is one)."""
+        return self._bump(
+            keys=[GENERATION_KEY, CHANGES_KEY],
+            args=[
+                initial,
+                MAX_CHANGES,
+                change.kind.value,
+                ",".join(str(i) for i in change.medium_ids),
+                ",".join(change.hashes),
+            ],
+            client=writer,
+        )
+
+    def since(self, generation: int, until: int) -> Optional[List[Change]]:
+        """All changes made after 'generation', up to and including 'until'.
+
+        Returns None if some of them are not in the log (anymore)."""
+        if until < generation:
+            return None
+
+        entries = self.redis.xrange(
+            CHANGES_KEY, min=f"{generation + 1}-1", max=f"{until}-1"
+        )
+        if len(entries) != until - generation:
+            return None
+
+        return [_decode(fields) for _, fields in entries]
+
+
+def _split(raw_bytes: bytes) -> List[str]:
+    if not raw_bytes:
+        return []
+    return raw_bytes.decode("utf-8").split(",")
+
+
+def _decode(fields: Any) -> Change:
+    return Change(
+        ChangeKind(fields[b"k"].decode("ascii")),
+        tuple(int(i) for i in _split(fields[b"i"])),
+        tuple(_split(fields[b"h"])),
+    )
@@ -0,0 +1,204 @@
+import sys
+from threading import Lock
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+)
+
+from redis import Redis
+
+# Hash mapping each tag name to its id.
+DICTIONARY_KEY = "TAGS"
+
+# Random token which changes whenever the dictionary has to start over
+# (e.g. because Redis lost its data). Ids from different epochs mean
+# different things and must never be mixed.
+EPOCH_KEY = "TAGS_EPOCH"
+
+# Ids are handed out in order and never change afterwards, even across
+# refills. Doing this in a script makes it atomic across all workers.
+_ASSIGN_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 0 then
+  redis.call('DEL', KEYS[1])
+  local now = redis.call('TIME')
+  redis.call('SET', KEYS[2], now[1] .. '.' .. now[2])
+end
+
+local ids = {}
+for i, name in ipairs(ARGV) do
+  local id = redis.call('HGET', KEYS[1], name)
+  if not id then
+    id = redis.call('HLEN', KEYS[1])
+    redis.call('HSET', KEYS[1], name, id)
+  end
+  ids[i] = tonumber(id)
+end
+
+return {redis.call('GET', KEYS[2]), ids}
+"""
+
+
+class TagDictionaryEpoch:
+    """All tag ids known to this process for one specific epoch.
+
+    Since ids are never reassigned within an epoch, this can safely be
+    shared between requests. It only ever grows."""
+
+    def __init__(self, epoch: Optional[str]) -> None:
+        self.epoch = epoch
+        self.ids: Dict[str, int] = {}
+        self.names: Dict[int, str] = {}
+
+        # All ids below this are definitely known.
+        self.complete_size = 0
+
+    def add(self, name: str, tag_id: int) -> None:
+        self.ids[name] = tag_id
+        self.names[tag_id] = name
+
+
+_CURRENT = TagDictionaryEpoch(None)
+_LOCK = Lock()
+
+
+def _decode_str(raw_bytes: bytes) -> str:
+    return raw_bytes.decode("utf-8")
+
+
+class TagDictionary:
+    """Translates between tag names and the tag ids used in Redis."""
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+        self._assign = redis.register_script(_ASSIGN_SCRIPT)
+
+    def encode(self, names: Iterable[str]) -> TagDictionaryEpoch:
+        """Make sure all these names have an id.
+
+        Returns the epoch which contains all of them."""
+        all_names = set(names)
+        current = _CURRENT
+
+        # Even if we know all names already, we need to ask Redis
+        # to make sure that we are still on the right epoch.
+        missing = sorted(n for n in all_names if n not in current.ids)
+        epoch, tag_ids = self._run_assign(missing)
+
+        if epoch != current.epoch and len(missing) < len(all_names):
+            # The ids we already knew are outdated.
+            missing = sorted(all_names)
+            epoch, tag_ids = self._run_assign(missing)
+
+        return self._update(epoch, zip(missing, tag_ids))
+
+    def _run_assign(self, names: List[str]) -> Tuple[str, List[int]]:
+        raw_epoch, tag_ids = self._assign(
+            keys=[DICTIONARY_KEY, EPOCH_KEY], args=names
+        )
+        return _decode_str(raw_epoch), tag_ids
+
+    def decode(self, epoch: str, size: int) -> Optional[TagDictionaryEpoch]:
+        """Find the epoch which knows about the names of all ids below 'size'.
+
+        Returns None if those ids belong to some outdated epoch."""
+        current = _CURRENT
+        if current.epoch == epoch and current.complete_size >= size:
+            return current
+
+        current = self._reload()
+        if current.epoch != epoch or current.complete_size < size:
+            return None
+        return current
+
+    def _reload(self) -> TagDictionaryEpoch:
+        with self.redis.pipeline() as pipe:
+            pipe.get(EPOCH_KEY)
+            pipe.hgetall(DICTIONARY_KEY)
+            raw_epoch, raw_ids = pipe.execute()
+
+        if raw_epoch is None:
+            # Nothing has been encoded yet, so nothing can be decoded.
+            return TagDictionaryEpoch(None)
+
+        current = self._update(
+            _decode_str(raw_epoch),
+            ((_decode_str(k), int(v)) for k, v in raw_ids.items()),
+        )
+        current.complete_size = max(current.complete_size, len(raw_ids))
+        return current
+
+    def _update(
+        self, epoch: str, assigned: Iterable[Tuple[str, int]]
+    ) -> TagDictionaryEpoch:
+        global _CURRENT  # pylint: disable=global-statement
+
+        with _LOCK:
+            if _CURRENT.epoch != epoch:
+                _CURRENT = TagDictionaryEpoch(epoch)
+
+            current = _CURRENT
+            for name, tag_id in assigned:
+                # Interning makes all documents share the same strings.
+                current.add(sys.intern(name), tag_id)
+
+        return current
+
+
+class TagIds(Protocol):
+    """Anything that can translate between tag names and ids."""
+
+    def encode(self, names: Iterable[str]) -> TagDictionaryEpoch:
+        ...
+
+    def decode(self, epoch: str, size: int) -> Optional[TagDictionaryEpoch]:
+        ...
+
+
+class FixedTagDictionary:
+    """Tag dictionary which only lives in memory.
+
+    Useful wherever the names are stored right next to their ids."""
+
+    EPOCH = "FIXED"
+
+    def __init__(self, names: Iterable[str] = ()) -> None:
+        self.current = TagDictionaryEpoch(self.EPOCH)
+        for name in names:
+            self.current.add(sys.intern(name), len(self.current.ids))
+        self.current.complete_size = len(self.current.ids)
+
+    def encode(self, names: Iterable[str]) -> TagDictionaryEpoch:
+        current = self.current
+        for name in sorted(set(names) - current.ids.keys()):
+            current.add(name, len(current.ids))
+        current.complete_size = len(current.ids)
+        return current
+
+    def decode(self, epoch: str, size: int) -> Optional[TagDictionaryEpoch]:
+        if epoch != self.EPOCH or size > self.current.complete_size:
+            return None
+        return self.current
+
+    def all_names(self) -> List[str]:
+        """All names, ordered by id."""
+        names = self.current.names
+        return [names[i] for i in range(len(names))]
+
+
+def decode_names(
+    dictionary: TagDictionaryEpoch, tag_ids: Iterable[int]
+) -> FrozenSet[str]:
+    names = dictionary.names
+    return frozenset(names[i] for i in tag_ids)
+
+
+def encode_names(
+    dictionary: TagDictionaryEpoch, names: Iterable[str]
+) -> List[int]:
+    ids = dictionary.ids
+    return [ids[n] for n in names]
@@ -0,0 +1,227 @@
+"""Schemas which store documents as MessagePack arrays.
+
+Fields are stored by position instead of by name, in the order of the
+constructors of IndexedMedium and TinyIndexedMedium.
+
+msgpack is an optional dependency, only imported once these are used.
+"""
+
+from datetime import date
+from importlib import import_module
+from typing import Any, Dict, List, Optional
+
+from beevenue.documents import IndexedMedium, TinyIndexedMedium
+from beevenue.document_types import MediumDocument, TinyMediumDocument
+
+from ..types import CacheEntityKind
+from .dictionary import TagIds, decode_names, encode_names
+from .schemas import (
+    MSGPACK_PREFIX,
+    PrefixedSchema,
+    SCHEMAS,
+    Schema,
+    encode_shard_tags,
+)
+
+
+class MsgpackSchema(Schema):
+    """Base class for MessagePack based schemas."""
+
+    def __init__(self) -> None:
+        self.msgpack = import_module("msgpack")
+
+    def pack(self, obj: Any) -> bytes:
+        result: bytes = self.msgpack.packb(obj, use_bin_type=True)
+        return result
+
+    def unpack(self, raw_bytes: bytes) -> Any:
+        return self.msgpack.unpackb(raw_bytes, raw=False, use_list=False)
+
+
+class FullMediumDocumentMsgpackSchema(MsgpackSchema):
+    """MessagePack based schema for MediumDocument."""
+
+    def serialize(self, obj: MediumDocument) -> bytes:
+        return self.pack(
+            (
+                obj.medium_id,
+                obj.medium_hash,
+                obj.mime_type,
+                obj.rating,
+                obj.width,
+                obj.height,
+                obj.filesize,
+                obj.insert_date.toordinal(),
+                obj.tiny_thumbnail,
+                tuple(obj.innate_tag_names),
+                tuple(obj.searchable_tag_names),
+                tuple(obj.absent_tag_names),
+            )
+        )
+
+    def deserialize(self, raw_bytes: bytes) -> MediumDocument:
+        (
+            medium_id,
+            medium_hash,
+            mime_type,
+            rating,
+            width,
+            height,
+            filesize,
+            insert_date,
+            tiny_thumbnail,
+            innate_tag_names,
+            searchable_tag_names,
+            absent_tag_names,
+        ) = self.unpack(raw_bytes)
+
+        return IndexedMedium(
+            medium_id,
+            medium_hash,
+            mime_type,
+            rating,
+            width,
+            height,
+            filesize,
+            date.fromordinal(insert_date),
+            tiny_thumbnail,
+            frozenset(innate_tag_names),
+            frozenset(searchable_tag_names),
+            frozenset(absent_tag_names),
+        )
+
+
+def _tiny_fields(tiny: TinyMediumDocument) -> List[Any]:
+    return [
+        tiny.medium_id,
+        tiny.medium_hash,
+        tiny.rating,
+        tiny.width,
+        tiny.height,
+        tiny.filesize,
+        tiny.insert_date.toordinal(),
+    ]
+
+
+class TinyMediumDocumentMsgpackSchema(MsgpackSchema):
+    """MessagePack based schema for TinyMediumDocument."""
+
+    def serialize(self, obj: TinyMediumDocument) -> bytes:
+        return self.pack(
+            (
+                *_tiny_fields(obj),
+                tuple(obj.innate_tag_names),
+                tuple(obj.searchable_tag_names),
+                tuple(obj.absent_tag_names),
+            )
+        )
+
+    def deserialize(self, raw_bytes: bytes) -> TinyMediumDocument:
+        (
+            medium_id,
+            medium_hash,
+            rating,
+            width,
+            height,
+            filesize,
+            insert_date,
+            innate_tag_names,
+            searchable_tag_names,
+            absent_tag_names,
+        ) = self.unpack(raw_bytes)
+
+        return TinyIndexedMedium(
+            medium_id,
+            medium_hash,
+            rating,
+            width,
+            height,
+            filesize,
+            date.fromordinal(insert_date),
+            frozenset(innate_tag_names),
+            frozenset(searchable_tag_names),
+            frozenset(absent_tag_names),
+        )
+
+
+class TinyShardMsgpackSchema(MsgpackSchema):
+    """MessagePack based schema for shards of TinyMediumDocuments.
+
+    Tag names are replaced by their ids in the tag dictionary."""
+
+    def __init__(self, tags: TagIds):
+        super().__init__()
+        self.tags = tags
+
+    def serialize(self, obj: List[TinyMediumDocument]) -> bytes:
+        tags, size = encode_shard_tags(self.tags, obj)
+        return self.pack(
+            (
+                tags.epoch,
+                size,
+                [
+                    (
+                        *_tiny_fields(tiny),
+                        encode_names(tags, tiny.innate_tag_names),
+                        encode_names(tags, tiny.searchable_tag_names),
+                        encode_names(tags, tiny.absent_tag_names),
+                    )
+                    for tiny in obj
+                ],
+            )
+        )
+
+    def deserialize(self, raw_bytes: bytes) -> Optional[List[Any]]:
+        epoch, size, shard = self.unpack(raw_bytes)
+
+        tags = self.tags.decode(epoch, size)
+        if tags is None:
+            # Written before the tag dictionary was reset. Useless now.
+            return None
+
+        return [
+            TinyIndexedMedium(
+                medium_id,
+                medium_hash,
+                rating,
+                width,
+                height,
+                filesize,
+                date.fromordinal(insert_date),
+                decode_names(tags, innate_tag_ids),
+                decode_names(tags, searchable_tag_ids),
+                decode_names(tags, absent_tag_ids),
+            )
+            for (
+                medium_id,
+                medium_hash,
+                rating,
+                width,
+                height,
+                filesize,
+                insert_date,
+                innate_tag_ids,
+                searchable_tag_ids,
+                absent_tag_ids,
+            ) in shard
+        ]
+
+
+def bind_schemas(tags: TagIds) -> Dict[CacheEntityKind, Schema]:
+    """Get schemas for all kinds, using this tag dictionary where needed.
+
+    Documents are stored as MessagePack, everything else is stored as usual."""
+    schemas: Dict[CacheEntityKind, Schema] = {
+        CacheEntityKind.MEDIUM_DOCUMENT: FullMediumDocumentMsgpackSchema(),
+        CacheEntityKind.MEDIUM_DOCUMENT_TINY: TinyMediumDocumentMsgpackSchema(),
+        CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD: TinyShardMsgpackSchema(
+            tags
+        ),
+    }
+    return {
+        **SCHEMAS,
+        **{
+            kind: PrefixedSchema(schema, MSGPACK_PREFIX)
+            for kind, schema in schemas.items()
+        },
+    }
@@ -1,16 +1,24 @@
 from abc import ABC, abstractmethod
 from datetime import date
+from enum import IntEnum, unique
+from functools import lru_cache
+from importlib import import_module
 import os
-from typing import Any, Dict, List
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
 
 import capnp  # type: ignore
+import numpy as np
 
 from beevenue.documents import IndexedMedium, TinyIndexedMedium
 from beevenue.document_types import MediumDocument, TinyMediumDocument
 
 from ..types import CacheEntityKind
+from .dictionary import TagDictionaryEpoch, TagIds, encode_names
+from .views import TinyMediumDocumentView
 
 
+@lru_cache(maxsize=None)
 def _camel_case(string: str) -> str:
     parts = string.split("_")
     return "".join([parts[0], *[p.title() for p in parts[1:]]])
@@ -23,14 +31,17 @@ def _path(filename: str) -> str:
 MDT_SCHEMA = capnp.load(  # pylint: disable=no-member
     _path("medium_document_tiny.capnp")
 )
-MDTA_SCHEMA = capnp.load(  # pylint: disable=no-member
-    _path("medium_document_tiny_all.capnp")
+MDTE_SCHEMA = capnp.load(  # pylint: disable=no-member
+    _path("medium_document_tiny_encoded.capnp")
 )
 MD_SCHEMA = capnp.load(  # pylint: disable=no-member
     _path("medium_document.capnp")
 )
 LISTS_SCHEMA = capnp.load(_path("lists.capnp"))  # pylint: disable=no-member
 
+# Largest value the underlying uint64 can hold.
+_UNLIMITED_TRAVERSAL = 2**64 - 1
+
 
 class Schema(ABC):
     """Base class for all schemas used for (de)serialization."""
@@ -55,6 +66,9 @@ class CapnpSchema(Schema):
     LISTS: List[str] = []
     DATES: List[str] = []
 
+    # How many words capnp may read from one message (None means default).
+    TRAVERSAL_LIMIT: Optional[int] = None
+
     @property
     @abstractmethod
     def target(self) -> TBase:
@@ -96,15 +110,28 @@ class CapnpSchema(Schema):
             field[i] = part
             i += 1
 
-    def serialize(self, obj: Any) -> bytes:
+    def build(self, obj: Any) -> TBase:
+        """Take an object, get a capnp message builder back out."""
         document = self.target.new_message()
         self.construct_document(document, obj)
-        result: bytes = document.to_bytes()
+        return document
+
+    def read(self, raw_bytes: Any, packed: bool = False) -> TBase:
+        """Take some bytes, get a capnp message reader back out."""
+        kwargs = {}
+        if self.TRAVERSAL_LIMIT is not None:
+            kwargs["traversal_limit_in_words"] = self.TRAVERSAL_LIMIT
+
+        if packed:
+            return self.target.from_bytes_packed(raw_bytes, **kwargs)
+        return self.target.from_bytes(raw_bytes, **kwargs)
+
+    def serialize(self, obj: Any) -> bytes:
+        result: bytes = self.build(obj).to_bytes()
         return result
 
     def deserialize(self, raw_bytes: bytes) -> Any:
-        obj: TBase = self.target.from_bytes(raw_bytes)
-        return self.construct_object(obj)
+        return self.construct_object(self.read(raw_bytes))
 
 
 class FullMediumDocumentSchema(CapnpSchema):
@@ -189,30 +216,72 @@ class TinyMediumDocumentSchema(CapnpSchema):
         )
 
 
-# Note: This isn't actually all that generic
-class AllMetaSchema(CapnpSchema):
-    """Cap'n Proto based schema for Lists of TinyMediumDocuments."""
+def encode_shard_tags(
+    tags: TagIds, shard: Sequence[TinyMediumDocument]
+) -> Tuple[TagDictionaryEpoch, int]:
+    """Assign ids to all tag names in this shard.
+
+    Returns the dictionary to encode them with, and how many of its ids
+    must be known to decode them again."""
+    all_names: Set[str] = set()
+    for tiny in shard:
+        all_names |= tiny.innate_tag_names
+        all_names |= tiny.searchable_tag_names
+        all_names |= tiny.absent_tag_names
+
+    dictionary = tags.encode(all_names)
+    size = 1 + max(encode_names(dictionary, all_names), default=-1)
+    return dictionary, size
+
+
+class TinyShardSchema(CapnpSchema):
+    """Cap'n Proto based schema for shards of TinyMediumDocuments.
 
-    def __init__(self, wrapped_schema: CapnpSchema):
-        self.wrapped_schema = wrapped_schema
+    Tag names are replaced by their ids in the tag dictionary."""
+
+    SIMPLE = TinyMediumDocumentSchema.SIMPLE
+    DATES = TinyMediumDocumentSchema.DATES
+
+    # The views we return keep reading from this message for as long
+    # as they are cached, so capnp must not cut them off at some point.
+    TRAVERSAL_LIMIT = _UNLIMITED_TRAVERSAL
+
+    def __init__(self, tags: TagIds):
+        self.tags = tags
 
     @property
     def target(self) -> Any:
-        return MDTA_SCHEMA.AllMediumDocumentTiny
+        return MDTE_SCHEMA.AllMediumDocumentTinyEncoded
+
+    def build(self, obj: List[TinyMediumDocument]) -> TBase:
+        tags, size = encode_shard_tags(self.tags, obj)
 
-    def serialize(self, obj: List[Any]) -> bytes:
         document = self.target.new_message()
+        document.dictionaryEpoch = tags.epoch
+        document.dictionarySize = size
+
         field = document.init("all", len(obj))
         i = 0
-        for subdocument in obj:
-            self.wrapped_schema.construct_document(field[i], subdocument)
+        for tiny in obj:
+            subdocument = field[i]
+            self.construct_document(subdocument, tiny)
+            for key, names in (
+                ("innateTagIds", tiny.innate_tag_names),
+                ("searchableTagIds", tiny.searchable_tag_names),
+                ("absentTagIds", tiny.absent_tag_names),
+            ):
+                setattr(subdocument, key, encode_names(tags, names))
             i += 1
 
-        result: bytes = document.to_bytes()
-        return result
+        return document
 
-    def construct_object(self, doc: Any) -> List[Any]:
-        return [self.wrapped_schema.construct_object(obj) for obj in doc.all]
+    def construct_object(self, doc: Any) -> Optional[List[Any]]:
+        tags = self.tags.decode(doc.dictionaryEpoch, doc.dictionarySize)
+        if tags is None:
+            # Written before the tag dictionary was reset. Useless now.
+            return None
+
+        return [TinyMediumDocumentView(tiny, tags) for tiny in doc.all]
 
 
 class StringListSchema(CapnpSchema):
@@ -233,6 +302,24 @@ class StringListSchema(CapnpSchema):
             i += 1
 
 
+class IntListSchema(CapnpSchema):
+    """Cap'n Proto based schema for simple lists of (unsigned) integers."""
+
+    @property
+    def target(self) -> Any:
+        return LISTS_SCHEMA.IntList
+
+    def construct_object(self, doc: Any) -> List[int]:
+        return list(doc.numbers)
+
+    def construct_document(self, base: Any, obj: List[int]) -> None:
+        field = base.init("numbers", len(obj))
+        i = 0
+        for number in obj:
+            field[i] = number
+            i += 1
+
+
 class AsciiStringSchema(Schema):
     """Simple schema for single ASCII string."""
 
@@ -243,18 +330,216 @@ class AsciiStringSchema(Schema):
         return raw_bytes.decode("ascii")
 
 
+class TaggedIdsSchema(Schema):
+    """Schema for sorted medium ids, stored as compressed differences.
+
+    Consecutive ids differ by little, so those compress well."""
+
+    # Changes whenever the format does. Anything else is a cache miss.
+    _FORMAT = b"\x01"
+
+    def serialize(self, obj: np.ndarray) -> bytes:
+        differences = np.diff(obj.astype("<u4"), prepend=np.uint32(0))
+        return self._FORMAT + zlib.compress(differences.tobytes())
+
+    def deserialize(self, raw_bytes: bytes) -> Optional[np.ndarray]:
+        if raw_bytes[:1] != self._FORMAT:
+            return None
+
+        differences = np.frombuffer(zlib.decompress(raw_bytes[1:]), dtype="<u4")
+        ids = np.cumsum(differences, dtype=np.uint32)
+
+        # Shared by all requests of this process, so nobody may change it.
+        ids.setflags(write=False)
+        return ids
+
+
+@unique
+class Encoding(IntEnum):
+    """How capnp messages are stored in Redis.
+
+    Every stored value starts with one byte naming its encoding, so values
+    can always be read, no matter which encoding is configured right now."""
+
+    UNPACKED = 1
+    PACKED = 2
+    PACKED_ZLIB = 3
+    PACKED_ZSTD = 4
+    PACKED_LZ4 = 5
+
+
+# First bytes of documents stored by the other backends (see backends.py).
+# They never name an Encoding, so no backend mistakes the documents of any
+# other one for its own. Those are just cache misses.
+MSGPACK_PREFIX = 0x80
+STRUCT_PREFIX = 0x81
+
+
+def _encoding_of(raw_bytes: bytes) -> Optional[Encoding]:
+    try:
+        return Encoding(raw_bytes[0])
+    except (IndexError, ValueError):
+        return None
+
+
+# Unpacked messages are read in place, which capnp only allows at word
+# boundaries. So the byte naming their encoding is padded to a full word.
+_UNPACKED_HEADER_SIZE = 8
+
+Codec = Tuple[Callable[[bytes], bytes], Callable[[Any], bytes]]
+
+
+def _zstd() -> Codec:
+    zstandard = import_module("zstandard")
+    return (
+        zstandard.ZstdCompressor().compress,
+        zstandard.ZstdDecompressor().decompress,
+    )
+
+
+def _lz4() -> Codec:
+    lz4_frame = import_module("lz4.frame")
+    return (lz4_frame.compress, lz4_frame.decompress)
+
+
+# zstd and lz4 are optional (see requirements.optional.txt). They are only
+# imported once they are used.
+_CODEC_FACTORIES: Dict[Encoding, Callable[[], Codec]] = {
+    Encoding.PACKED_ZLIB: lambda: (zlib.compress, zlib.decompress),
+    Encoding.PACKED_ZSTD: _zstd,
+    Encoding.PACKED_LZ4: _lz4,
+}
+_CODECS: Dict[Encoding, Codec] = {}
+
+
+def _codec(encoding: Encoding) -> Codec:
+    codec = _CODECS.get(encoding, None)
+    if codec is None:
+        codec = _CODECS[encoding] = _CODEC_FACTORIES[encoding]()
+    return codec
+
+
+class EncodedSchema(Schema):
+    """Stores messages of some capnp schema in one specific encoding."""
+
+    def __init__(self, schema: CapnpSchema, encoding: Encoding) -> None:
+        self.schema = schema
+        self.encoding = encoding
+
+    def serialize(self, obj: Any) -> bytes:
+        document = self.schema.build(obj)
+        if self.encoding == Encoding.UNPACKED:
+            header = bytes([self.encoding]).ljust(_UNPACKED_HEADER_SIZE, b"\0")
+            return header + document.to_bytes()
+
+        payload: bytes = document.to_bytes_packed()
+        if self.encoding in _CODEC_FACTORIES:
+            compress, _ = _codec(self.encoding)
+            payload = compress(payload)
+
+        return bytes([self.encoding]) + payload
+
+    def deserialize(self, raw_bytes: bytes) -> Any:
+        encoding = _encoding_of(raw_bytes)
+        if encoding is None:
+            # Written by some other backend (or version). Useless to us.
+            return None
+
+        if encoding == Encoding.UNPACKED:
+            payload: Any = memoryview(raw_bytes)[_UNPACKED_HEADER_SIZE:]
+        else:
+            payload = memoryview(raw_bytes)[1:]
+
+        if encoding in _CODEC_FACTORIES:
+            _, decompress = _codec(encoding)
+            payload = decompress(payload)
+
+        document = self.schema.read(
+            payload, packed=encoding != Encoding.UNPACKED
+        )
+        return self.schema.construct_object(document)
+
+
+class PrefixedSchema(Schema):
+    """Stores values of some schema behind a single byte naming it."""
+
+    def __init__(self, schema: Schema, prefix: int) -> None:
+        self.schema = schema
+        self.prefix = bytes([prefix])
+
+    def serialize(self, obj: Any) -> bytes:
+        return self.prefix + self.schema.serialize(obj)
+
+    def deserialize(self, raw_bytes: bytes) -> Any:
+        if raw_bytes[:1] != self.prefix:
+            # Written by some other backend (or version). Useless to us.
+            return None
+        return self.schema.deserialize(memoryview(raw_bytes)[1:])
+
+
+# Which encoding is used for storing which kind of entity.
+# Kinds not listed here are stored just as their schema writes them.
+ENCODINGS: Dict[CacheEntityKind, Encoding] = {
+    CacheEntityKind.MEDIUM_DOCUMENT: Encoding.PACKED_ZLIB,
+    CacheEntityKind.MEDIUM_DOCUMENT_TINY: Encoding.PACKED,
+    CacheEntityKind.MEDIUM_DOCUMENT_TINY_MANIFEST: Encoding.PACKED,
+    CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD: Encoding.PACKED_ZLIB,
+    CacheEntityKind.SEARCHABLE_TAGS: Encoding.PACKED_ZLIB,
+    CacheEntityKind.TAG_INDEX_MANIFEST: Encoding.PACKED_ZLIB,
+}
+
+
+def check_encodings() -> None:
+    """Fail unless all modules needed by ENCODINGS are there."""
+    for encoding in sorted(set(ENCODINGS.values())):
+        if encoding not in _CODEC_FACTORIES:
+            continue
+        try:
+            _codec(encoding)
+        except ImportError as error:
+            raise ImportError(
+                f"Encoding {encoding.name} needs module "
+                f'"{error.name}" (see requirements.optional.txt).'
+            ) from error
+
+
+def _encoded(kind: CacheEntityKind, schema: Schema) -> Schema:
+    encoding = ENCODINGS.get(kind, None)
+    if encoding is None or not isinstance(schema, CapnpSchema):
+        return schema
+    return EncodedSchema(schema, encoding)
+
+
 _FULL_MEDIUM_DOCUMENT_SCHEMA = FullMediumDocumentSchema()
 _TINY_MEDIUM_DOCUMENT_SCHEMA = TinyMediumDocumentSchema()
 _RATING_BY_HASH_SCHEMA = AsciiStringSchema()
 
-_ALL_TINY_MEDIUM_DOCUMENT_SCHEMA = AllMetaSchema(_TINY_MEDIUM_DOCUMENT_SCHEMA)
-
 _STRING_LIST_SCHEMA = StringListSchema()
+_INT_LIST_SCHEMA = IntListSchema()
+_TAGGED_IDS_SCHEMA = TaggedIdsSchema()
 
-SCHEMAS: Dict[CacheEntityKind, Schema] = {
+_SCHEMAS: Dict[CacheEntityKind, Schema] = {
     CacheEntityKind.MEDIUM_DOCUMENT: _FULL_MEDIUM_DOCUMENT_SCHEMA,
     CacheEntityKind.MEDIUM_DOCUMENT_TINY: _TINY_MEDIUM_DOCUMENT_SCHEMA,
-    CacheEntityKind.MEDIUM_DOCUMENT_TINY_ALL: _ALL_TINY_MEDIUM_DOCUMENT_SCHEMA,
+    CacheEntityKind.MEDIUM_DOCUMENT_TINY_MANIFEST: _INT_LIST_SCHEMA,
     CacheEntityKind.RATING_BY_HASH: _RATING_BY_HASH_SCHEMA,
     CacheEntityKind.SEARCHABLE_TAGS: _STRING_LIST_SCHEMA,
+    CacheEntityKind.INNATE_TAG_INDEX: _TAGGED_IDS_SCHEMA,
+    CacheEntityKind.SEARCHABLE_TAG_INDEX: _TAGGED_IDS_SCHEMA,
+    CacheEntityKind.TAG_INDEX_MANIFEST: _STRING_LIST_SCHEMA,
+}
+
+
+SCHEMAS: Dict[CacheEntityKind, Schema] = {
+    kind: _encoded(kind, schema) for kind, schema in _SCHEMAS.items()
 }
+
+
+def bind_schemas(tags: TagIds) -> Dict[CacheEntityKind, Schema]:
+    """Get schemas for all kinds, using this tag dictionary where needed."""
+    return {
+        **SCHEMAS,
+        CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD: _encoded(
+            CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD, TinyShardSchema(tags)
+        ),
+    }
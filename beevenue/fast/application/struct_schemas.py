@@ -0,0 +1,258 @@
+"""Schemas which pack documents into plain binary using the struct module.
+
+All numbers are little-endian. Strings and byte strings are prefixed with
+their length, lists with their number of items.
+"""
+
+from datetime import date
+import struct
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from beevenue.documents import IndexedMedium, TinyIndexedMedium
+from beevenue.document_types import MediumDocument, TinyMediumDocument
+
+from ..types import CacheEntityKind
+from .dictionary import TagIds, decode_names, encode_names
+from .schemas import (
+    PrefixedSchema,
+    SCHEMAS,
+    STRUCT_PREFIX,
+    Schema,
+    encode_shard_tags,
+)
+
+# Medium id, rating, width, height, filesize and insert date (as ordinal).
+_FIXED = struct.Struct("<IcIIQi")
+_COUNT = struct.Struct("<I")
+_SHORT_LENGTH = struct.Struct("<H")
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self.parts: List[bytes] = []
+
+    def fixed(self, obj: Any) -> None:
+        self.parts.append(
+            _FIXED.pack(
+                obj.medium_id,
+                obj.rating.encode("ascii"),
+                obj.width,
+                obj.height,
+                obj.filesize,
+                obj.insert_date.toordinal(),
+            )
+        )
+
+    def string(self, string: str) -> None:
+        encoded = string.encode("utf-8")
+        self.parts.append(_SHORT_LENGTH.pack(len(encoded)))
+        self.parts.append(encoded)
+
+    def blob(self, blob: bytes) -> None:
+        self.parts.append(_COUNT.pack(len(blob)))
+        self.parts.append(blob)
+
+    def strings(self, strings: FrozenSet[str]) -> None:
+        self.parts.append(_COUNT.pack(len(strings)))
+        for string in strings:
+            self.string(string)
+
+    def numbers(self, numbers: List[int]) -> None:
+        self.parts.append(_COUNT.pack(len(numbers)))
+        self.parts.append(struct.pack(f"<{len(numbers)}I", *numbers))
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self.parts)
+
+
+class _Reader:
+    def __init__(self, raw_bytes: bytes) -> None:
+        self.raw_bytes = raw_bytes
+        self.offset = 0
+
+    def fixed(self) -> Tuple[int, str, int, int, int, date]:
+        (
+            medium_id,
+            rating,
+            width,
+            height,
+            filesize,
+            ordinal,
+        ) = _FIXED.unpack_from(self.raw_bytes, self.offset)
+        self.offset += _FIXED.size
+        return (
+            medium_id,
+            rating.decode("ascii"),
+            width,
+            height,
+            filesize,
+            date.fromordinal(ordinal),
+        )
+
+    def _count(self) -> int:
+        (count,) = _COUNT.unpack_from(self.raw_bytes, self.offset)
+        self.offset += _COUNT.size
+        result: int = count
+        return result
+
+    def string(self) -> str:
+        (length,) = _SHORT_LENGTH.unpack_from(self.raw_bytes, self.offset)
+        start = self.offset + _SHORT_LENGTH.size
+        self.offset = start + length
+        return str(self.raw_bytes[start : self.offset], "utf-8")
+
+    def blob(self) -> bytes:
+        length = self._count()
+        start = self.offset
+        self.offset += length
+        return bytes(self.raw_bytes[start : self.offset])
+
+    def strings(self) -> FrozenSet[str]:
+        return frozenset(self.string() for _ in range(self._count()))
+
+    def numbers(self) -> Iterable[int]:
+        count = self._count()
+        result: Iterable[int] = struct.unpack_from(
+            f"<{count}I", self.raw_bytes, self.offset
+        )
+        self.offset += 4 * count
+        return result
+
+
+class FullMediumDocumentStructSchema(Schema):
+    """struct based schema for MediumDocument."""
+
+    def serialize(self, obj: MediumDocument) -> bytes:
+        writer = _Writer()
+        writer.fixed(obj)
+        writer.string(obj.medium_hash)
+        writer.string(obj.mime_type)
+        writer.blob(obj.tiny_thumbnail)
+        writer.strings(obj.innate_tag_names)
+        writer.strings(obj.searchable_tag_names)
+        writer.strings(obj.absent_tag_names)
+        return writer.to_bytes()
+
+    def deserialize(self, raw_bytes: bytes) -> MediumDocument:
+        reader = _Reader(raw_bytes)
+        medium_id, rating, width, height, filesize, insert_date = reader.fixed()
+        return IndexedMedium(
+            medium_id,
+            reader.string(),
+            reader.string(),
+            rating,
+            width,
+            height,
+            filesize,
+            insert_date,
+            reader.blob(),
+            reader.strings(),
+            reader.strings(),
+            reader.strings(),
+        )
+
+
+class TinyMediumDocumentStructSchema(Schema):
+    """struct based schema for TinyMediumDocument."""
+
+    def serialize(self, obj: TinyMediumDocument) -> bytes:
+        writer = _Writer()
+        writer.fixed(obj)
+        writer.string(obj.medium_hash)
+        writer.strings(obj.innate_tag_names)
+        writer.strings(obj.searchable_tag_names)
+        writer.strings(obj.absent_tag_names)
+        return writer.to_bytes()
+
+    def deserialize(self, raw_bytes: bytes) -> TinyMediumDocument:
+        reader = _Reader(raw_bytes)
+        medium_id, rating, width, height, filesize, insert_date = reader.fixed()
+        return TinyIndexedMedium(
+            medium_id,
+            reader.string(),
+            rating,
+            width,
+            height,
+            filesize,
+            insert_date,
+            reader.strings(),
+            reader.strings(),
+            reader.strings(),
+        )
+
+
+class TinyShardStructSchema(Schema):
+    """struct based schema for shards of TinyMediumDocuments.
+
+    Tag names are replaced by their ids in the tag dictionary."""
+
+    def __init__(self, tags: TagIds):
+        self.tags = tags
+
+    def serialize(self, obj: List[TinyMediumDocument]) -> bytes:
+        tags, size = encode_shard_tags(self.tags, obj)
+
+        writer = _Writer()
+        writer.string(tags.epoch or "")
+        writer.numbers([size, len(obj)])
+        for tiny in obj:
+            writer.fixed(tiny)
+            writer.string(tiny.medium_hash)
+            writer.numbers(encode_names(tags, tiny.innate_tag_names))
+            writer.numbers(encode_names(tags, tiny.searchable_tag_names))
+            writer.numbers(encode_names(tags, tiny.absent_tag_names))
+        return writer.to_bytes()
+
+    def deserialize(self, raw_bytes: bytes) -> Optional[List[Any]]:
+        reader = _Reader(raw_bytes)
+        epoch = reader.string()
+        size, count = reader.numbers()
+
+        tags = self.tags.decode(epoch, size)
+        if tags is None:
+            # Written before the tag dictionary was reset. Useless now.
+            return None
+
+        result = []
+        for _ in range(count):
+            (
+                medium_id,
+                rating,
+                width,
+                height,
+                filesize,
+                insert_date,
+            ) = reader.fixed()
+            result.append(
+                TinyIndexedMedium(
+                    medium_id,
+                    reader.string(),
+                    rating,
+                    width,
+                    height,
+                    filesize,
+                    insert_date,
+                    decode_names(tags, reader.numbers()),
+                    decode_names(tags, reader.numbers()),
+                    decode_names(tags, reader.numbers()),
+                )
+            )
+        return result
+
+
+def bind_schemas(tags: TagIds) -> Dict[CacheEntityKind, Schema]:
+    """Get schemas for all kinds, using this tag dictionary where needed.
+
+    Documents are packed with struct, everything else is stored as usual."""
+    schemas: Dict[CacheEntityKind, Schema] = {
+        CacheEntityKind.MEDIUM_DOCUMENT: FullMediumDocumentStructSchema(),
+        CacheEntityKind.MEDIUM_DOCUMENT_TINY: TinyMediumDocumentStructSchema(),
+        CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD: TinyShardStructSchema(tags),
+    }
+    return {
+        **SCHEMAS,
+        **{
+            kind: PrefixedSchema(schema, STRUCT_PREFIX)
+            for kind, schema in schemas.items()
+        },
+    }
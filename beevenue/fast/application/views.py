@@ -0,0 +1,68 @@
+from datetime import date
+from typing import Any, Callable, Dict
+
+from beevenue.document_types import TinyMediumDocument
+
+from .dictionary import TagDictionaryEpoch, decode_names
+
+Converter = Callable[[Any, TagDictionaryEpoch], Any]
+
+# How to materialize each field of TinyMediumDocument from a Cap'n Proto
+# MediumDocumentTinyEncoded reader.
+_CONVERTERS: Dict[str, Converter] = {
+    "medium_hash": lambda reader, _: reader.mediumHash,
+    "rating": lambda reader, _: reader.rating,
+    "width": lambda reader, _: reader.width,
+    "height": lambda reader, _: reader.height,
+    "filesize": lambda reader, _: reader.filesize,
+    "insert_date": lambda reader, _: date.fromisoformat(reader.insertDate),
+    "innate_tag_names": lambda reader, tags: decode_names(
+        tags, reader.innateTagIds
+    ),
+    "searchable_tag_names": lambda reader, tags: decode_names(
+        tags, reader.searchableTagIds
+    ),
+    "absent_tag_names": lambda reader, tags: decode_names(
+        tags, reader.absentTagIds
+    ),
+}
+
+
+class TinyMediumDocumentView(TinyMediumDocument):
+    """Tiny medium document which wraps a Cap'n Proto reader.
+
+    Fields are only materialized on first access. After that, they live
+    in the regular slots of TinyMediumDocument, so repeated access
+    is just as fast as for eagerly constructed documents.
+    """
+
+    __slots__ = ["_reader", "_tags"]
+
+    def __init__(self, reader: Any, tags: TagDictionaryEpoch) -> None:
+        self._reader = reader
+        self._tags = tags
+        self.medium_id = reader.mediumId
+
+    def __getattr__(self, name: str) -> Any:
+        # Python only calls this if the slot called "name" is still empty.
+        converter = _CONVERTERS.get(name, None)
+        if converter is None:
+            raise AttributeError(name)
+
+        value = converter(self._reader, self._tags)
+        setattr(self, name, value)
+        return value
+
+    def __hash__(self) -> int:
+        return self.medium_id
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, TinyMediumDocumentView):
+            return NotImplemented
+        return self.medium_id == other.medium_id
+
+    def __str__(self) -> str:
+        return f"<TinyMediumDocumentView {self.medium_id}>"
+
+    def __repr__(self) -> str:
+        return self.__str__()
@@ -0,0 +1,288 @@
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+import numpy as np
+
+from beevenue.document_types import TinyMediumDocument
+
+# Order in which ratings are encoded as small integers.
+RATINGS = ("s", "q", "e", "u")
+_RATING_CODES = {rating: code for code, rating in enumerate(RATINGS)}
+# Any other rating (which SQL doesn't prevent) counts as unknown.
+_UNKNOWN_RATING_CODE = _RATING_CODES["u"]
+
+
+class SortOrder(NamedTuple):
+    """All rows, ordered by some sort key (ascending), then by id."""
+
+    rows: np.ndarray
+
+    # The sort key of each of these rows, in the same order.
+    keys: np.ndarray
+
+
+class TagColumn:
+    """CSR-style encoding of one tag name set per row.
+
+    The tags of row i are tag_ids[offsets[i]:offsets[i+1]], and rows[j]
+    is the row which tag_ids[j] belongs to."""
+
+    ARRAYS = ("counts", "offsets", "tag_ids", "rows")
+
+    def __init__(
+        self,
+        tag_sets: Sequence[Iterable[str]],
+        ids_by_name: Dict[str, int],
+    ) -> None:
+        counts: List[int] = []
+        tag_ids: List[int] = []
+        for tag_set in tag_sets:
+            before = len(tag_ids)
+            tag_ids.extend(
+                ids_by_name.setdefault(name, len(ids_by_name))
+                for name in tag_set
+            )
+            counts.append(len(tag_ids) - before)
+
+        self.counts = np.array(counts, dtype=np.uint32)
+        self.offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(self.counts, out=self.offsets[1:])
+        self.tag_ids = np.array(tag_ids, dtype=np.uint32)
+        self.rows = np.repeat(
+            np.arange(len(counts), dtype=np.uint32), self.counts
+        )
+        self._tag_counts: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "TagColumn":
+        """Wrap these arrays (see ARRAYS) without copying them."""
+        column = cls.__new__(cls)
+        column.counts = arrays["counts"]
+        column.offsets = arrays["offsets"]
+        column.tag_ids = arrays["tag_ids"]
+        column.rows = arrays["rows"]
+        column._tag_counts = None
+        return column
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.ARRAYS}
+
+    def _counts(self) -> np.ndarray:
+        if self._tag_counts is None:
+            self._tag_counts = np.bincount(self.tag_ids)
+        return self._tag_counts
+
+    def tag_count(self, tag_id: int) -> int:
+        """In how many rows does this tag id occur?"""
+        tag_counts = self._counts()
+        if tag_id >= len(tag_counts):
+            return 0
+        return int(tag_counts[tag_id])
+
+    def most_common(self, count: int) -> np.ndarray:
+        """The (up to) count tag ids which occur in the most rows."""
+        tag_counts = self._counts()
+        order = np.argsort(-tag_counts, kind="stable")[:count]
+        return order[tag_counts[order] > 0]
+
+    def count_per_row(self, tag_ids: Sequence[int]) -> np.ndarray:
+        """Count how many of these tag ids each row has."""
+        hits = np.isin(self.tag_ids, tag_ids)
+        return np.bincount(self.rows[hits], minlength=len(self.counts))
+
+
+class ColumnarSnapshot:
+    """Column-wise copy of all tiny medium documents.
+
+    Row i of every column describes media[i]. This allows evaluating
+    filters and statistics over all media as vectorized operations.
+    """
+
+    # Plain columns, with one entry per row.
+    COLUMNS = (
+        "ids",
+        "ratings",
+        "widths",
+        "heights",
+        "filesizes",
+        "insert_dates",
+    )
+    TAG_COLUMNS = ("innate", "searchable", "absent")
+
+    def __init__(self, media: Sequence[TinyMediumDocument]) -> None:
+        self.media = media
+
+        self.ids = np.fromiter(
+            (m.medium_id for m in media), dtype=np.uint32, count=len(media)
+        )
+        self.ratings = np.fromiter(
+            (_RATING_CODES.get(m.rating, _UNKNOWN_RATING_CODE) for m in media),
+            dtype=np.uint8,
+            count=len(media),
+        )
+        self.widths = np.fromiter(
+            (m.width for m in media), dtype=np.uint32, count=len(media)
+        )
+        self.heights = np.fromiter(
+            (m.height for m in media), dtype=np.uint32, count=len(media)
+        )
+        self.filesizes = np.fromiter(
+            (m.filesize for m in media), dtype=np.uint64, count=len(media)
+        )
+        self.insert_dates = np.fromiter(
+            (m.insert_date.toordinal() for m in media),
+            dtype=np.int32,
+            count=len(media),
+        )
+
+        # All three tag columns share the same ids.
+        self.tag_ids_by_name: Dict[str, int] = {}
+        self.innate = TagColumn(
+            [m.innate_tag_names for m in media], self.tag_ids_by_name
+        )
+        self.searchable = TagColumn(
+            [m.searchable_tag_names for m in media], self.tag_ids_by_name
+        )
+        self.absent = TagColumn(
+            [m.absent_tag_names for m in media], self.tag_ids_by_name
+        )
+
+        self.tag_names = [""] * len(self.tag_ids_by_name)
+        for name, tag_id in self.tag_ids_by_name.items():
+            self.tag_names[tag_id] = name
+
+        self._set_up()
+
+    @classmethod
+    def from_arrays(
+        cls,
+        media: Sequence[TinyMediumDocument],
+        arrays: Dict[str, np.ndarray],
+        tag_names: List[str],
+    ) -> "ColumnarSnapshot":
+        """Wrap these arrays (see arrays()) without copying them.
+
+        The media are only read by terms which can't be vectorized, so
+        they may well be loaded lazily."""
+        snapshot = cls.__new__(cls)
+        snapshot.media = media
+        for name in cls.COLUMNS:
+            setattr(snapshot, name, arrays[name])
+
+        for column in cls.TAG_COLUMNS:
+            prefix = f"{column}."
+            column_arrays = {
+                name[len(prefix) :]: array
+                for name, array in arrays.items()
+                if name.startswith(prefix)
+            }
+            setattr(snapshot, column, TagColumn.from_arrays(column_arrays))
+
+        snapshot.tag_names = tag_names
+        snapshot.tag_ids_by_name = {
+            name: tag_id for tag_id, name in enumerate(tag_names)
+        }
+        snapshot._set_up()
+        return snapshot
+
+    def _set_up(self) -> None:
+        # All ids are smaller than this.
+        self.id_limit = int(self.ids.max()) + 1 if len(self.ids) else 0
+
+        # Built on first use.
+        self._rows_by_id: Optional[np.ndarray] = None
+        self._sort_orders: Dict[str, SortOrder] = {}
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """All columns, by name. Tag columns are named "<column>.<array>"."""
+        result = {name: getattr(self, name) for name in self.COLUMNS}
+        for column in self.TAG_COLUMNS:
+            tag_column: TagColumn = getattr(self, column)
+            for name, array in tag_column.arrays().items():
+                result[f"{column}.{name}"] = array
+        return result
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def rating_mask(self, rating: str) -> np.ndarray:
+        code = _RATING_CODES.get(rating, None)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.ratings == code
+
+    def tag_mask(self, column: TagColumn, tag_name: str) -> np.ndarray:
+        """Which rows have this tag in the given column?"""
+        tag_id = self.tag_ids_by_name.get(tag_name, None)
+        if tag_id is None:
+            return np.zeros(len(self), dtype=bool)
+        return column.count_per_row([tag_id]) > 0
+
+    def tag_count(self, column: TagColumn, tag_name: str) -> int:
+        """How many rows have this tag in the given column?"""
+        tag_id = self.tag_ids_by_name.get(tag_name, None)
+        if tag_id is None:
+            return 0
+        return column.tag_count(tag_id)
+
+    def most_common_tags(self, column: TagColumn, count: int) -> List[str]:
+        """Names of the (up to) count tags most rows have in this column."""
+        return [self.tag_names[t] for t in column.most_common(count)]
+
+    def rows_of(self, medium_ids: np.ndarray) -> np.ndarray:
+        """Find the rows of these medium ids (skipping unknown ones)."""
+        if self._rows_by_id is None:
+            rows_by_id = np.full(self.id_limit, -1, dtype=np.int64)
+            rows_by_id[self.ids] = np.arange(len(self), dtype=np.int64)
+            self._rows_by_id = rows_by_id
+
+        medium_ids = medium_ids[medium_ids < self.id_limit]
+        rows = self._rows_by_id[medium_ids]
+        return rows[rows >= 0]
+
+    def sort_order(
+        self, name: str, sort_key: Callable[[], np.ndarray]
+    ) -> SortOrder:
+        """All rows, ordered by this sort key.
+
+        Only computed once per name, since snapshots never change."""
+        order = self._sort_orders.get(name, None)
+        if order is None:
+            keys = sort_key()
+            rows = np.lexsort((self.ids, keys))
+            order = SortOrder(rows, keys[rows])
+            self._sort_orders[name] = order
+        return order
+
+    def rating_counts(self) -> np.ndarray:
+        """How many media of each rating (in order of RATINGS) exist?"""
+        return np.bincount(self.ratings, minlength=len(RATINGS))
+
+    def innate_rating_counts(self) -> Dict[str, Tuple[int, ...]]:
+        """For each innate tag, count its media per rating."""
+        row_ratings = self.ratings[self.innate.rows].astype(np.int64)
+        combined = self.innate.tag_ids.astype(np.int64) * len(RATINGS)
+        combined += row_ratings
+
+        counts = np.bincount(
+            combined, minlength=len(self.tag_names) * len(RATINGS)
+        ).reshape(-1, len(RATINGS))
+
+        used = np.flatnonzero(counts.sum(axis=1))
+        return {
+            self.tag_names[i]: tuple(int(c) for c in counts[i]) for i in used
+        }
+
+
+def histogram(values: np.ndarray) -> Dict[int, int]:
+    """Count how often each value occurs."""
+    keys, counts = np.unique(values, return_counts=True)
+    return {int(k): int(c) for k, c in zip(keys, counts)}
@@ -1,11 +1,12 @@
-from logging import debug, info
+from logging import debug, info, warning
 from typing import (
     Dict,
     FrozenSet,
+    Iterable,
     List,
     NamedTuple,
+    Optional,
     Sequence,
-    Set,
     Tuple,
 )
 import time
@@ -17,35 +18,94 @@ from beevenue.flask import g
 from beevenue.models import Tag, TagAlias
 from beevenue.document_types import MediumDocument, TinyMediumDocument
 
-from .types import CacheEntityKind, Command, Query, SubCache
+from .types import (
+    CacheEntityKind,
+    Change,
+    ChangeKind,
+    Command,
+    Query,
+    SubCache,
+)
 from .load import full_load, multi_load
+from .parallel_load import parallel_full_load
+from .snapshot import load_snapshot, sql_fingerprint, write_snapshot
+from .shards import (
+    MANIFEST_QUERY,
+    SHARD_SIZE,
+    shard_batches,
+    shard_index,
+    shard_query,
+    split_into_shards,
+)
+from .tag_index import (
+    INDEX_KINDS,
+    TagIndex,
+    TagIndexChanges,
+    build_tag_index,
+    fill_tag_index,
+    tag_index_changes,
+    update_tag_index,
+)
+
+# While refilling, how many media are written to each layer at a time.
+REFILL_BATCH_SIZE = 10 * SHARD_SIZE
 
 
 class RefillCommandAggregator(NamedTuple):
     """Aggregator class for RefillCommand."""
 
-    media: Dict[int, MediumDocument]
+    # Iterated over once per layer, so they needn't all be in memory.
+    media: Iterable[MediumDocument]
+    tag_index: TagIndex
     searchable_tag_names: FrozenSet[str]
 
 
 class RefillCommand(Command[RefillCommandAggregator]):
-    """Completely refill the caches from SQL."""
+    """Completely refill the caches from SQL.
+
+    With more than one worker, media are loaded by that many processes.
+    They are streamed to the on-disk snapshot first, and then from there
+    to each layer, one batch at a time."""
+
+    # Sending all media in a single MULTI/EXEC would block Redis for a long
+    # time. Only once they have all been written, the generation is bumped.
+    IS_ATOMIC = False
+
+    def __init__(self, workers: int = 1) -> None:
+        self.workers = workers
+
+    def _load(self) -> Iterable[MediumDocument]:
+        if self.workers > 1:
+            return parallel_full_load(self.workers)
+        return full_load()
 
     def start(self) -> RefillCommandAggregator:
         # We are the bottom layer, prev is always None.
         tic = time.perf_counter()
         info("Starting warmup.")
-        info("Loading all media.")
-        all_media = full_load()
+        fingerprint = sql_fingerprint()
+        media: Optional[Iterable[MediumDocument]] = load_snapshot(fingerprint)
+        if media is None:
+            info("Loading all media.")
+            # If they could not be written, we get them back in memory.
+            media = write_snapshot(self._load(), fingerprint)
 
-        info("Gathering searchable tag names.")
-        searchable_tag_names: Set[str] = set()
-        for medium in all_media:
-            searchable_tag_names |= medium.searchable_tag_names
+        if media is None:
+            media = load_snapshot(fingerprint)
+
+        if media is None:
+            # Somebody replaced the snapshot we just wrote.
+            warning("Loading all media again, keeping them in memory.")
+            media = list(self._load())
+
+        info("Building tag index.")
+        tag_index = build_tag_index(media)
+
+        # Every searchable tag name of any medium is in the index.
+        searchable_tag_names = tag_index[CacheEntityKind.SEARCHABLE_TAG_INDEX]
 
         agg = RefillCommandAggregator(
-            {item.medium_id: item for item in all_media},
-            frozenset(searchable_tag_names),
+            media, tag_index, frozenset(searchable_tag_names.keys())
         )
 
         toc = time.perf_counter()
@@ -61,28 +121,42 @@ class RefillCommand(Command[RefillCommandAggregator]):
             Query(CacheEntityKind.SEARCHABLE_TAGS, "ALL"),
             agg.searchable_tag_names,
         )
-        cache.set_many(
-            {
-                Query(CacheEntityKind.MEDIUM_DOCUMENT, k): v
-                for k, v in agg.media.items()
-            }
-        )
-        cache.set_many(
-            {
-                Query(CacheEntityKind.MEDIUM_DOCUMENT_TINY, k): v
-                for k, v in agg.media.items()
-            }
-        )
-        cache.set_many(
-            {
-                Query(CacheEntityKind.RATING_BY_HASH, v.medium_hash): v.rating
-                for k, v in agg.media.items()
-            }
-        )
-        cache.set(
-            Query(CacheEntityKind.MEDIUM_DOCUMENT_TINY_ALL, "ALL"),
-            list(agg.media.values()),
-        )
+
+        old_shard_indices = cache.get(MANIFEST_QUERY) or []
+        shard_indices: List[int] = []
+
+        for shards in shard_batches(agg.media, REFILL_BATCH_SIZE):
+            media = [m for shard in shards.values() for m in shard]
+            cache.set_many(
+                {
+                    Query(CacheEntityKind.MEDIUM_DOCUMENT, m.medium_id): m
+                    for m in media
+                }
+            )
+            cache.set_many(
+                {
+                    Query(CacheEntityKind.MEDIUM_DOCUMENT_TINY, m.medium_id): m
+                    for m in media
+                }
+            )
+            cache.set_many(
+                {
+                    Query(
+                        CacheEntityKind.RATING_BY_HASH, m.medium_hash
+                    ): m.rating
+                    for m in media
+                }
+            )
+            cache.set_many({shard_query(i): s for i, s in shards.items()})
+            shard_indices.extend(shards.keys())
+
+        cache.set(MANIFEST_QUERY, sorted(shard_indices))
+
+        stale_shard_indices = set(old_shard_indices) - set(shard_indices)
+        if stale_shard_indices:
+            cache.delete(*[shard_query(i) for i in stale_shard_indices])
+
+        fill_tag_index(cache, agg.tag_index)
 
         return agg
 
@@ -90,12 +164,35 @@ class RefillCommand(Command[RefillCommandAggregator]):
 REFILL = RefillCommand()
 
 
+def _tag_index_changes(
+    medium_ids: List[int], new: Sequence[TinyMediumDocument]
+) -> TagIndexChanges:
+    """Tag index changes for moving these media to their 'new' state."""
+
+    # The caches still know the old state of these media.
+    # That's the only way to tell which tags they have lost.
+    # (SQL only knows the new state, so don't ask it.)
+    old = g.fast.get_many_cached_tiny(medium_ids)
+
+    forgotten_ids = set(medium_ids) - {m.medium_id for m in old}
+    if not forgotten_ids:
+        return tag_index_changes(old, new)
+
+    # Some of them have been evicted from all caches, so they might have
+    # lost any tag. Check all tags in the index.
+    names_by_kind = {
+        kind: g.fast.get_tag_index_names(kind) for kind in INDEX_KINDS
+    }
+    return tag_index_changes(old, new, forgotten_ids, names_by_kind)
+
+
 class RefreshMediumAggregator(NamedTuple):
     """Aggregator class for RefreshMediumCommand."""
 
     old_hashes: List[str]
     fulls: List[MediumDocument]
     tinies: Sequence[TinyMediumDocument]
+    tag_index_changes: TagIndexChanges
 
 
 class RefreshMediumCommand(Command[RefreshMediumAggregator]):
@@ -104,12 +201,24 @@ class RefreshMediumCommand(Command[RefreshMediumAggregator]):
     def __init__(self, tuples: List[Tuple[int, str]]) -> None:
         self.tuples = tuples
 
+    def change(self, agg: RefreshMediumAggregator) -> Change:
+        # Replacing a file changes its hash, so both ratings have changed.
+        hashes = {t[1] for t in self.tuples}
+        hashes.update(full.medium_hash for full in agg.fulls)
+
+        return Change(
+            ChangeKind.MEDIA,
+            tuple(t[0] for t in self.tuples),
+            tuple(sorted(hashes)),
+        )
+
     def start(self) -> RefreshMediumAggregator:
         old_hashes = []
         fulls = []
         tinies: List[TinyIndexedMedium] = []
 
-        loaded_media = multi_load([t[0] for t in self.tuples])
+        medium_ids = [t[0] for t in self.tuples]
+        loaded_media = multi_load(medium_ids)
         loaded_media_dict = {m.medium_id: m for m in loaded_media}
 
         for medium_id, old_hash in self.tuples:
@@ -124,6 +233,7 @@ class RefreshMediumCommand(Command[RefreshMediumAggregator]):
             old_hashes=old_hashes,
             fulls=fulls,
             tinies=tinies,
+            tag_index_changes=_tag_index_changes(medium_ids, tinies),
         )
 
         return agg
@@ -154,53 +264,86 @@ class RefreshMediumCommand(Command[RefreshMediumAggregator]):
 
         cache.delete(*to_delete)
         cache.set_many(to_set)
+        update_tag_index(cache, agg.tag_index_changes)
 
-        with cache.modify(
-            Query(CacheEntityKind.MEDIUM_DOCUMENT_TINY_ALL, "ALL")
-        ) as modify:
-            if not modify.value:
-                # This cache doesn't care about these documents
-                return agg
+        # Only rewrite the shards which actually contain these media.
+        refreshed_shards = split_into_shards(agg.tinies)
+        current = cache.get_many(
+            [MANIFEST_QUERY, *[shard_query(i) for i in refreshed_shards]]
+        )
+
+        manifest = current.get(MANIFEST_QUERY, None)
+        if manifest is None:
+            # This cache doesn't care about these documents
+            return agg
+
+        shard_indices = set(manifest)
+        shards_to_set: Dict[Query, List[TinyMediumDocument]] = {}
 
-            new_tinies = []
+        for index, refreshed in refreshed_shards.items():
+            query = shard_query(index)
+            if index not in shard_indices:
+                shards_to_set[query] = refreshed
+                shard_indices.add(index)
+                continue
 
-            refreshed_by_id = {r.medium_id: r for r in agg.tinies}
+            shard = current.get(query, None)
+            if not shard:
+                # This cache doesn't hold this shard, so nothing is outdated.
+                continue
 
-            for tiny in modify.value:
-                new_tinies.append(refreshed_by_id.pop(tiny.medium_id, tiny))
+            shards_to_set[query] = self._refresh_shard(shard, refreshed)
 
-            modify.value = new_tinies + list(refreshed_by_id.values())
+        shards_to_set[MANIFEST_QUERY] = sorted(shard_indices)
+        cache.set_many(shards_to_set)
 
         return agg
 
+    @staticmethod
+    def _refresh_shard(
+        shard: List[TinyMediumDocument], refreshed: List[TinyMediumDocument]
+    ) -> List[TinyMediumDocument]:
+        new_tinies = []
+
+        refreshed_by_id = {r.medium_id: r for r in refreshed}
+
+        for tiny in shard:
+            new_tinies.append(refreshed_by_id.pop(tiny.medium_id, tiny))
+
+        return new_tinies + list(refreshed_by_id.values())
+
 
-class EmptyAggregator:
-    """Aggregator class holding nothing."""
+class DeleteMediumAggregator(NamedTuple):
+    """Aggregator class for DeleteMediumCommand."""
 
+    tag_index_changes: TagIndexChanges
 
-class DeleteMediumCommand(Command[EmptyAggregator]):
+
+class DeleteMediumCommand(Command[DeleteMediumAggregator]):
     """Completely delete this medium from cache."""
 
     def __init__(self, medium_id: int, medium_hash: str) -> None:
         self.medium_id = medium_id
         self.medium_hash = medium_hash
 
-    def start(self) -> EmptyAggregator:
-        # We are not a cache, so we don't need to delete anything
-        return EmptyAggregator()
+    def change(self, agg: DeleteMediumAggregator) -> Change:
+        return Change(ChangeKind.MEDIA, (self.medium_id,), (self.medium_hash,))
 
-    def next(self, cache: SubCache, agg: EmptyAggregator) -> EmptyAggregator:
+    def start(self) -> DeleteMediumAggregator:
+        # We are not a cache, so we don't need to delete anything.
+        # However, the tag index must forget about this medium.
+        return DeleteMediumAggregator(_tag_index_changes([self.medium_id], []))
 
-        with cache.modify(
-            Query(CacheEntityKind.MEDIUM_DOCUMENT_TINY_ALL, "ALL")
-        ) as modify:
-            if not modify.value:
-                # This cache doesn't care about these documents
-                return agg
+    def next(
+        self, cache: SubCache, agg: DeleteMediumAggregator
+    ) -> DeleteMediumAggregator:
+        update_tag_index(cache, agg.tag_index_changes)
 
-            modify.value = [
-                t for t in modify.value if t.medium_id != self.medium_id
-            ]
+        with cache.modify(MANIFEST_QUERY) as manifest:
+            if manifest.value is not None:
+                index = shard_index(self.medium_id)
+                if not self._remove_from_shard(cache, index):
+                    manifest.value = [i for i in manifest.value if i != index]
 
         cache.delete(
             Query(CacheEntityKind.MEDIUM_DOCUMENT_TINY, self.medium_id),
@@ -210,6 +353,27 @@ class DeleteMediumCommand(Command[EmptyAggregator]):
 
         return agg
 
+    def _remove_from_shard(self, cache: SubCache, index: int) -> bool:
+        """Remove medium from its shard. Returns if anything is left in it."""
+
+        with cache.modify(shard_query(index)) as modify:
+            if not modify.value:
+                # This cache doesn't hold this shard, so nothing is outdated.
+                return True
+
+            remaining = [
+                t for t in modify.value if t.medium_id != self.medium_id
+            ]
+
+            if remaining:
+                modify.value = remaining
+                return True
+
+            modify.value = None
+
+        cache.delete(shard_query(index))
+        return False
+
 
 class RefreshSearchableTagsAggregator(NamedTuple):
     """Aggregator class for RefreshSearchableTagsCommand."""
@@ -229,6 +393,9 @@ class RefreshSearchableTagsCommand(Command[RefreshSearchableTagsAggregator]):
 
         return RefreshSearchableTagsAggregator(frozenset(all_searchable))
 
+    def change(self, agg: RefreshSearchableTagsAggregator) -> Change:
+        return Change(ChangeKind.SEARCHABLE_TAGS)
+
     def next(
         self, cache: SubCache, agg: RefreshSearchableTagsAggregator
     ) -> RefreshSearchableTagsAggregator:
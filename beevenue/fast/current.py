@@ -1,6 +1,6 @@
 from typing import Any, Dict, Iterable, Optional
 
-from .types import Query, SubCache
+from .types import Query, SubCache, is_hit
 
 
 class CurrentRequestCache(SubCache):
@@ -13,7 +13,7 @@ class CurrentRequestCache(SubCache):
         result = 0
         for query in queries:
             popped = self.cache.pop(query.hash, None)
-            result += int(bool(popped))
+            result += int(is_hit(popped))
 
         return result
 
@@ -27,7 +27,7 @@ class CurrentRequestCache(SubCache):
         result = {
             query: subresult
             for query, subresult in subresults.items()
-            if subresult
+            if is_hit(subresult)
         }
 
         return result
@@ -1,99 +1,187 @@
-from abc import ABC, abstractmethod
-from typing import Dict, FrozenSet, Iterable, Set, Tuple
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
 
 from sqlalchemy import select
 
 from beevenue.flask import g
-from beevenue.models import TagAlias, TagImplication, Tag
+from beevenue.models import Medium, MediumTag, TagAlias, TagImplication, Tag
 
 
-class AbstractDataSource(ABC):
-    """Abstract SQL data source used to load media from SQL database.
+class ImplicationClosure:
+    """Knows all names a tag can (additionally) be found by.
+
+    These are the aliases of the tag itself, and the names and aliases of
+    all tags it implies, no matter how indirectly. They are computed once
+    per tag and then reused for all media with that tag.
 
     Used to populate caches (e.g. on initial load, or when reindexing)."""
 
-    @abstractmethod
-    def alias_names(self, tag_ids: Iterable[int]) -> Set[str]:
-        """Returns all names of aliases for the given tag_ids."""
+    def __init__(
+        self,
+        implied_by_this: Dict[int, Set[int]],
+        aliases_by_id: Dict[int, Set[str]],
+        tag_name_by_id: Dict[int, str],
+    ):
+        self.implied_by_this = implied_by_this
+        self.aliases_by_id = aliases_by_id
+        self.tag_name_by_id = tag_name_by_id
+
+        self._extra_names_by_id: Dict[int, FrozenSet[str]] = {}
 
-    @abstractmethod
-    def implied(self, tag_ids: Iterable[int]) -> Tuple[Set[int], Set[str]]:
-        """Returns ids and names of tags implied by the given tag_ids."""
+    def extra_names(self, tag_ids: Iterable[int]) -> Set[str]:
+        """Returns all additional names of the given tag_ids."""
+        result: Set[str] = set()
+        for tag_id in tag_ids:
+            result |= self._extra_names(tag_id)
+        return result
 
+    def _extra_names(self, tag_id: int) -> FrozenSet[str]:
+        cached = self._extra_names_by_id.get(tag_id, None)
+        if cached is not None:
+            return cached
 
-class MultiLoadDataSource(AbstractDataSource):
-    """Data holder for fully loading a single medium's tag metadata."""
+        names = set(self.aliases_by_id.get(tag_id, ()))
+        for implied_id in self._implied_ids(tag_id):
+            names.add(self.tag_name_by_id[implied_id])
+            names |= self.aliases_by_id.get(implied_id, set())
 
-    def __init__(self, all_tag_ids: FrozenSet[int]) -> None:
-        self.session = g.db
-        tag_aliases = self.session.execute(
-            select(TagAlias.tag_id, TagAlias.alias).filter(
-                TagAlias.tag_id.in_(all_tag_ids)
+        result = frozenset(names)
+        self._extra_names_by_id[tag_id] = result
+        return result
+
+    def _implied_ids(self, tag_id: int) -> Set[int]:
+        """Returns ids of all tags transitively implied by this tag."""
+        result: Set[int] = set()
+
+        stack = [tag_id]
+        while stack:
+            for implied_id in self.implied_by_this.get(stack.pop(), ()):
+                if implied_id not in result:
+                    result.add(implied_id)
+                    stack.append(implied_id)
+
+        return result
+
+
+def _closure(
+    implications: Iterable[Tuple[int, int]],
+    aliases: Iterable[Tuple[int, str]],
+    tag_names: Iterable[Tuple[int, str]],
+) -> ImplicationClosure:
+    # if Id=3 implies Id=5, implied_by_this[3] == set([5])
+    implied_by_this: Dict[int, Set[int]] = defaultdict(set)
+    for implying_tag_id, implied_tag_id in implications:
+        implied_by_this[implying_tag_id].add(implied_tag_id)
+
+    aliases_by_id: Dict[int, Set[str]] = defaultdict(set)
+    for tag_id, alias in aliases:
+        aliases_by_id[tag_id].add(alias)
+
+    tag_name_by_id = {tag_id: tag_name for tag_id, tag_name in tag_names}
+
+    return ImplicationClosure(
+        dict(implied_by_this), dict(aliases_by_id), tag_name_by_id
+    )
+
+
+def full_closure() -> ImplicationClosure:
+    """Load everything needed to handle any tag at all."""
+
+    session = g.db
+
+    return _closure(
+        session.execute(
+            select(
+                TagImplication.implying_tag_id, TagImplication.implied_tag_id
             )
-        ).all()
-        self.tag_alias_dict = {t.tag_id: t.alias for t in tag_aliases}
+        ).all(),
+        session.execute(select(TagAlias.tag_id, TagAlias.alias)).all(),
+        session.execute(select(Tag.id, Tag.tag)).all(),
+    )
+
+
+def closure_for(tag_ids: Iterable[int]) -> ImplicationClosure:
+    """Load only what is needed to handle these tags."""
 
-        implications = self.session.execute(
+    session = g.db
+
+    # Follow the chain of implications, one level per query.
+    implications = []
+    relevant_tag_ids = set(tag_ids)
+    frontier = set(relevant_tag_ids)
+
+    while frontier:
+        level = session.execute(
             select(
-                TagImplication.implying_tag_id,
-                TagImplication.implied_tag_id,
-            ).filter(TagImplication.implying_tag_id.in_(all_tag_ids))
+                TagImplication.implying_tag_id, TagImplication.implied_tag_id
+            ).filter(TagImplication.implying_tag_id.in_(frontier))
         ).all()
-        self.implication_dict = {
-            ti.implying_tag_id: ti.implied_tag_id for ti in implications
-        }
 
-        implied_tag_names = self.session.execute(
-            select(Tag.id, Tag.tag).filter(
-                Tag.id.in_(list(self.implication_dict.values()))
+        implications.extend(level)
+        frontier = {i.implied_tag_id for i in level} - relevant_tag_ids
+        relevant_tag_ids |= frontier
+
+    return _closure(
+        implications,
+        session.execute(
+            select(TagAlias.tag_id, TagAlias.alias).filter(
+                TagAlias.tag_id.in_(relevant_tag_ids)
             )
-        ).all()
-        self.tag_name_dict = {t.id: t.tag for t in implied_tag_names}
+        ).all(),
+        session.execute(
+            select(Tag.id, Tag.tag).filter(Tag.id.in_(relevant_tag_ids))
+        ).all(),
+    )
 
-    def alias_names(self, tag_ids: Iterable[int]) -> Set[str]:
-        result = set()
-        for tag_id in tag_ids:
-            if tag_id in self.tag_alias_dict:
-                result.add(self.tag_alias_dict[tag_id])
-        return result
 
-    def implied(self, tag_ids: Iterable[int]) -> Tuple[Set[int], Set[str]]:
-        implied_ids = set()
-        for tag_id in tag_ids:
-            if tag_id in self.implication_dict:
-                implied_ids.add(self.implication_dict[tag_id])
+def _implying_tag_ids(tag_ids: Iterable[int]) -> Set[int]:
+    """These tags, and all tags which imply them (no matter how indirectly)."""
 
-        implied_names = set()
-        for implied_id in implied_ids:
-            implied_names.add(self.tag_name_dict[implied_id])
+    session = g.db
 
-        return implied_ids, implied_names
+    # Follow the chain of implications backwards, one level per query.
+    result = set(tag_ids)
+    frontier = set(result)
 
+    while frontier:
+        implying_tag_ids = (
+            session.execute(
+                select(TagImplication.implying_tag_id).filter(
+                    TagImplication.implied_tag_id.in_(frontier)
+                )
+            )
+            .scalars()
+            .all()
+        )
 
-class FullLoadDataSource(AbstractDataSource):
-    """Data holder for fully loading multiple media's tag metadata."""
+        frontier = set(implying_tag_ids) - result
+        result |= frontier
 
-    def __init__(
-        self,
-        implied_by_this: Dict[int, Set[int]],
-        aliases_by_id: Dict[int, Set[str]],
-        tag_name_by_id: Dict[int, str],
-    ):
-        self.implied_by_this = implied_by_this
-        self.aliases_by_id = aliases_by_id
-        self.tag_name_by_id = tag_name_by_id
+    return result
 
-    def alias_names(self, tag_ids: Iterable[int]) -> Set[str]:
-        result = set()
-        for tag_id in tag_ids:
-            result |= self.aliases_by_id[tag_id]
-        return result
 
-    def implied(self, tag_ids: Iterable[int]) -> Tuple[Set[int], Set[str]]:
-        implied_ids = set()
-        for tag_id in tag_ids:
-            implied_ids |= self.implied_by_this[tag_id]
+def affected_media(tag_names: Iterable[str]) -> List[Tuple[int, str]]:
+    """(id, hash) of all media which can be found by any of these tags.
+
+    Those are all media which have the tag itself, or some tag implying it.
+    So if anything about these tags changes (e.g. their aliases), only
+    these media have to be refreshed."""
+
+    session = g.db
+
+    tag_ids = (
+        session.execute(select(Tag.id).filter(Tag.tag.in_(list(tag_names))))
+        .scalars()
+        .all()
+    )
+    if not tag_ids:
+        return []
 
-        implied_names = {self.tag_name_by_id[i] for i in implied_ids}
+    rows = session.execute(
+        select(Medium.id, Medium.hash)
+        .join(MediumTag, MediumTag.medium_id == Medium.id)
+        .filter(MediumTag.tag_id.in_(_implying_tag_ids(tag_ids)))
+        .distinct()
+    ).all()
 
-        return implied_ids, implied_names
+    return [(medium_id, medium_hash) for medium_id, medium_hash in rows]
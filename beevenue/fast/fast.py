@@ -1,22 +1,49 @@
 from beevenue.document_types import MediumDocument, TinyMediumDocument
-from typing import Any, List, Optional
+import time
+from typing import Any, Callable, FrozenSet, List, Optional, Tuple
+
+from flask import current_app
+from sentry_sdk import start_span
 
 from .application import ApplicationWideCache
-from .commands import REFILL
-from .nope import NotACache
+from .columnar import ColumnarSnapshot
+from .commands import REFILL, RefillCommand
 from .current import CurrentRequestCache
+from .metrics import METRICS, layer_name
+from .process import ProcessWideCache, TDerived
+from .ratings import RatingIndex
+from .shared import SharedMemoryCache
+from .tag_index import NO_IDS, TaggedIds
 from .types import Cache, CacheEntityKind, Command, SubCache
 from .queries import run_many_query, run_single_query
+from .sql import SqlCache
 
 
 class Fast(Cache):
     """A lasagna of caches. Falls through on miss and refills the layers."""
 
     def __init__(self) -> None:
+        self.application_wide = ApplicationWideCache()
+
+        # Optionally, all workers share tiny medium documents in memory
+        # instead of each keeping their own copy.
+        shared: List[SubCache] = []
+        excluded_kinds: Callable[[], FrozenSet[CacheEntityKind]] = frozenset
+        self.shared_memory: Optional[SharedMemoryCache] = None
+        if current_app.config.get("BEEVENUE_SHARED_MEMORY_CACHE", False):
+            self.shared_memory = SharedMemoryCache(self.application_wide)
+            shared.append(self.shared_memory)
+            excluded_kinds = self.shared_memory.held_kinds
+
+        self.process_wide = ProcessWideCache(
+            self.application_wide, excluded_kinds
+        )
         self.caches: List[SubCache] = [
             CurrentRequestCache(),
-            ApplicationWideCache(),
-            NotACache(),
+            *shared,
+            self.process_wide,
+            self.application_wide,
+            SqlCache(self.application_wide, self._refill),
         ]
 
     def _delegate_single(
@@ -30,15 +57,43 @@ class Fast(Cache):
 
         return run_many_query(self.caches, kind, keys)
 
-    def fill(self) -> None:
+    def fill(self, workers: int = 1) -> None:
+        # Wait for anybody else who is refilling right now, since they
+        # might be doing so from outdated data.
+        with self.application_wide.refill_lock():
+            self.run(RefillCommand(workers))
+
+    def _refill(self) -> None:
         self.run(REFILL)
 
+    def generation(self) -> int:
+        """Current generation of the cached entities (see Command)."""
+        return self.application_wide.generation()
+
+    def derive(self, name: str, factory: Callable[[], TDerived]) -> TDerived:
+        """Get something computed from the cached entities, once per
+        generation and process."""
+        return self.process_wide.derive(name, factory)
+
     def get_rating_by_hash(self, for_hash: str) -> str:
+        # Usually, this is answered without any network round trip.
+        rating = self.get_rating_index().get(for_hash)
+        if rating is not None:
+            return rating
+
         result: str = self._delegate_single(
             CacheEntityKind.RATING_BY_HASH, for_hash
         )
         return result
 
+    def get_rating_index(self) -> RatingIndex:
+        return self.derive(
+            "RATINGS",
+            lambda: self._from_media(
+                RatingIndex, SharedMemoryCache.rating_index
+            ),
+        )
+
     def get_all_searchable_tag_names(self) -> List[str]:
         result: List[str] = self._delegate_single(
             CacheEntityKind.SEARCHABLE_TAGS, "ALL"
@@ -63,6 +118,13 @@ class Fast(Cache):
         )
         return result
 
+    def get_many_cached_tiny(self, ids: List[int]) -> List[TinyMediumDocument]:
+        # Everything but the bottom layer, which would load from SQL.
+        result: List[TinyMediumDocument] = run_many_query(
+            self.caches[:-1], CacheEntityKind.MEDIUM_DOCUMENT_TINY, ids
+        )
+        return result
+
     def get_tiny(self, medium_id: int) -> TinyMediumDocument:
         result: TinyMediumDocument = self._delegate_single(
             CacheEntityKind.MEDIUM_DOCUMENT_TINY, medium_id
@@ -70,13 +132,99 @@ class Fast(Cache):
         return result
 
     def get_all_tiny(self) -> List[TinyMediumDocument]:
-        result: List[TinyMediumDocument] = self._delegate_single(
-            CacheEntityKind.MEDIUM_DOCUMENT_TINY_ALL, "ALL"
+        shard_indices: List[int] = (
+            self._delegate_single(
+                CacheEntityKind.MEDIUM_DOCUMENT_TINY_MANIFEST, "ALL"
+            )
+            or []
         )
-        return result
+        shards: List[List[TinyMediumDocument]] = self._delegate_many(
+            CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD, shard_indices
+        )
+        return [tiny for shard in shards for tiny in shard]
+
+    def get_tagged_ids(self, kind: CacheEntityKind, tag_name: str) -> TaggedIds:
+        result: Optional[TaggedIds] = self._delegate_single(kind, tag_name)
+        return NO_IDS if result is None else result
+
+    def get_tag_index_names(self, kind: CacheEntityKind) -> List[str]:
+        result: Optional[List[str]] = self._delegate_single(
+            CacheEntityKind.TAG_INDEX_MANIFEST, kind.value
+        )
+        return result or []
+
+    def get_columnar(self) -> ColumnarSnapshot:
+        snapshot, _ = self.get_columnar_with_generation()
+        return snapshot
+
+    def get_columnar_with_generation(
+        self,
+    ) -> Tuple[ColumnarSnapshot, Optional[int]]:
+        """The columnar snapshot, and the generation it was built at (see
+        ProcessWideCache.derive_with_generation)."""
+        return self.process_wide.derive_with_generation(
+            "COLUMNAR",
+            lambda: self._from_media(
+                ColumnarSnapshot, SharedMemoryCache.columnar
+            ),
+        )
+
+    def _from_media(
+        self,
+        build: Callable[[List[TinyMediumDocument]], TDerived],
+        from_shared_memory: Callable[[SharedMemoryCache], Optional[TDerived]],
+    ) -> TDerived:
+        """Build this from all tiny medium documents, unless shared memory
+        already holds it (in which case no documents are decoded at all)."""
+
+        def _shared() -> Optional[TDerived]:
+            if self.shared_memory is None:
+                return None
+            return from_shared_memory(self.shared_memory)
+
+        result = _shared()
+        if result is not None:
+            return result
+
+        media = self.get_all_tiny()
+
+        # Loading them might just have written them to shared memory.
+        result = _shared()
+        if result is not None:
+            return result
+        return build(media)
+
+    def preload(self) -> int:
+        """Make sure everything that most requests need is in this process.
+
+        Of the tag index, only the ids of the most common tags are loaded
+        (see BEEVENUE_PRELOAD_TAG_COUNT). Those are the ones most searches
+        ask for, and the largest ones to load on demand.
+
+        Returns how many media have been loaded."""
+        snapshot = self.get_columnar()
+        self.get_rating_index()
+
+        count = current_app.config.get("BEEVENUE_PRELOAD_TAG_COUNT", 100)
+        if count > 0:
+            for kind, column in (
+                (CacheEntityKind.INNATE_TAG_INDEX, snapshot.innate),
+                (CacheEntityKind.SEARCHABLE_TAG_INDEX, snapshot.searchable),
+            ):
+                self._delegate_many(
+                    kind, snapshot.most_common_tags(column, count)
+                )
+
+        return len(snapshot)
 
     def run(self, *commands: Command) -> None:
         for command in commands:
-            agg = None
-            for cache in reversed(self.caches):
-                agg = command.run(cache, agg)
+            name = type(command).__name__
+            with start_span(op="cache", description=f"run {name}"):
+                agg = None
+                for cache in reversed(self.caches):
+                    tic = time.perf_counter()
+                    agg = command.run(cache, agg)
+                    toc = time.perf_counter()
+
+                    METRICS.record_command(name, layer_name(cache), toc - tic)
@@ -1,4 +1,6 @@
-from typing import Any, List, Tuple
+from typing import List, Tuple
+
+from flask import current_app
 
 from beevenue.flask import g
 
@@ -6,10 +8,37 @@ from beevenue import signals
 from beevenue.models import Medium
 
 from . import commands
+from .data_source import affected_media
+
+
+def _refresh_tags(*tag_names: str) -> None:
+    """Something changed about the names these tags can be found by."""
+    affected = affected_media(tag_names)
+
+    # Refreshing lots of media one by one is slower than starting over.
+    limit = current_app.config.get("BEEVENUE_TARGETED_REFRESH_LIMIT", 1000)
+    if len(affected) > limit:
+        g.fast.fill()
+        return
+
+    if affected:
+        g.fast.run(commands.RefreshMediumCommand(affected))
+    g.fast.run(commands.REFRESH_SEARCHABLE_TAGS)
+
+
+def _tag_renamed(msg: Tuple[str, str]) -> None:
+    old_name, new_name = msg
+    _refresh_tags(old_name, new_name)
+
+
+def _alias_changed(msg: Tuple[str, str]) -> None:
+    tag_name, _ = msg
+    _refresh_tags(tag_name)
 
 
-def _nuke(*_: Any, **__: Any) -> None:
-    g.fast.run(commands.REFILL)
+def _implication_changed(msg: Tuple[str, str]) -> None:
+    implying, _ = msg
+    _refresh_tags(implying)
 
 
 def _medium_file_replaced(msg: Tuple[str, int]) -> None:
@@ -70,15 +99,15 @@ def _refresh_metadata(medium: Medium) -> None:
 
 
 def setup_signals() -> None:
-    # These actions happen so rarely, it's fine to just completely
-    # reload the cache.
-    signals.tag_renamed.connect(_nuke)
+    # These only affect the media which can be found by these tags,
+    # (unless there are so many of them that reloading everything is faster).
+    signals.tag_renamed.connect(_tag_renamed)
 
-    signals.alias_added.connect(_nuke)
-    signals.alias_removed.connect(_nuke)
+    signals.alias_added.connect(_alias_changed)
+    signals.alias_removed.connect(_alias_changed)
 
-    signals.implication_added.connect(_nuke)
-    signals.implication_removed.connect(_nuke)
+    signals.implication_added.connect(_implication_changed)
+    signals.implication_removed.connect(_implication_changed)
 
     # These are specific, but easy to update (only affect exactly
     # media documents)
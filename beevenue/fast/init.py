@@ -1,15 +1,23 @@
+import gc
+from logging import info
 from typing import Any
 
 from flask import appcontext_pushed
 
+from beevenue.db import db
 from beevenue.flask import g
+from beevenue.strawberry.get import get_rules
 
 from ..types import BeevenueFlask
+from .application.backends import check_backend, DEFAULT_BACKEND
 from .fast import Fast
 from .fast_signals import setup_signals
 
 
 def init_app(app: BeevenueFlask) -> None:
+    # Otherwise, a missing module would only fail the first request.
+    check_backend(app.config.get("BEEVENUE_CACHE_BACKEND", DEFAULT_BACKEND))
+
     _set_fast()
 
     # Only used for testing
@@ -25,6 +33,34 @@ def init_app(app: BeevenueFlask) -> None:
     app.teardown_appcontext(teardown)
 
 
+def preload(app: BeevenueFlask) -> None:  # pragma: no cover
+    """Load all commonly used entities into this process, then fork.
+
+    Meant to be called in the master process of a pre-forking server
+    (see script/gunicorn.conf.py). All workers forked afterwards start out
+    with everything already decoded, sharing those pages copy-on-write.
+    """
+    with app.app_context():
+        count = g.fast.preload()
+        info(f"Preloaded {count} media.")
+
+        # Decoding rules compiles their regexes. Preloading them resolves
+        # those to tag names.
+        rules = get_rules()
+        for rule in rules:
+            rule.preload()
+        info(f"Preloaded {len(rules)} rules.")
+
+        # Workers must not share connections with this process.
+        db.session.remove()
+        db.engine.dispose()
+
+    # Otherwise, the garbage collector would touch (and so copy) all of
+    # these objects in every worker the first time it runs.
+    gc.collect()
+    gc.freeze()
+
+
 def _set_fast(*_: Any, **__: Any) -> None:
     g.fast = Fast()
 
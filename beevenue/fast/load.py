@@ -1,122 +1,141 @@
-from collections import defaultdict, deque
-from typing import List, Sequence, Set
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
 
 from sqlalchemy import select
-from sqlalchemy.orm import joinedload
 from beevenue.flask import g
 
 from beevenue.documents import IndexedMedium
-from beevenue.models import Medium, Tag, TagAlias, TagImplication
+from beevenue.models import Medium, MediumTag, MediumTagAbsence, Tag
 from beevenue.document_types import MediumDocument
 
-from .data_source import (
-    AbstractDataSource,
-    FullLoadDataSource,
-    MultiLoadDataSource,
+from .data_source import ImplicationClosure, closure_for, full_closure
+
+# How many media to load from SQL at once.
+BATCH_SIZE = 1000
+
+_MEDIUM_COLUMNS = (
+    Medium.id,
+    Medium.hash,
+    Medium.mime_type,
+    Medium.rating,
+    Medium.width,
+    Medium.height,
+    Medium.filesize,
+    Medium.insert_date,
+    Medium.tiny_thumbnail,
 )
 
-
-def _non_innate_tags(
-    data_source: AbstractDataSource, medium: Medium
-) -> Set[str]:
-    extra: Set[str] = set()
-
-    queue: deque = deque()
-    initial_tag_ids = {t.id for t in medium.tags}
-    queue.append(initial_tag_ids)
-
-    while queue:
-        tag_ids: List[int] = queue.pop()
-        if not tag_ids:
-            continue
-
-        extra |= data_source.alias_names(tag_ids)
-
-        implied_tag_ids, implied_tag_names = data_source.implied(tag_ids)
-        extra |= implied_tag_names
-
-        queue.append(implied_tag_ids)
-
-    return extra
+# (id, name) of a tag
+TagTuple = Tuple[int, str]
 
 
 def _create_indexed_medium(
-    data_source: AbstractDataSource, medium: Medium
+    closure: ImplicationClosure,
+    row: Any,
+    tags: List[TagTuple],
+    absent_tags: List[TagTuple],
 ) -> IndexedMedium:
     # First, get innate tags. These will never change.
-    innate_tag_names = {t.tag for t in medium.tags}
+    innate_tag_names = {name for _, name in tags}
 
-    # Follow chain of implications. Gather implied tags
-    # and aliases until that queue is empty.
-    extra_searchable_tags = _non_innate_tags(data_source, medium)
+    # Aliases, implied tags, their aliases, and so on.
+    extra_searchable_tags = closure.extra_names(tag_id for tag_id, _ in tags)
 
     searchable_tag_names = innate_tag_names | extra_searchable_tags
 
-    absent_tag_names = {t.tag for t in medium.absent_tags}
+    absent_tag_names = {name for _, name in absent_tags}
 
     return IndexedMedium(
-        medium.id,
-        medium.hash,
-        medium.mime_type,
-        medium.rating,
-        medium.width,
-        medium.height,
-        medium.filesize,
-        medium.insert_date,
-        medium.tiny_thumbnail,
+        row.id,
+        row.hash,
+        row.mime_type,
+        row.rating,
+        row.width,
+        row.height,
+        row.filesize,
+        row.insert_date,
+        row.tiny_thumbnail,
         frozenset(innate_tag_names),
         frozenset(searchable_tag_names),
         frozenset(absent_tag_names),
     )
 
 
-def multi_load(medium_ids: List[int]) -> List[MediumDocument]:
-    matching_media = (
-        g.db.query(Medium)
-        .options(joinedload(Medium.tags), joinedload(Medium.absent_tags))
-        .filter(Medium.id.in_(medium_ids))
-        .all()
-    )
+def _tags_by_medium(
+    session: Any, association: Any, medium_ids: Sequence[int]
+) -> Dict[int, List[TagTuple]]:
+    """Load the tags linked to these media via this association table."""
 
-    relevant_tag_ids = set()
-    for medium in matching_media:
-        relevant_tag_ids |= {t.id for t in medium.tags}
+    rows = session.execute(
+        select(association.medium_id, Tag.id, Tag.tag)
+        .join(Tag, Tag.id == association.tag_id)
+        .filter(association.medium_id.in_(medium_ids))
+    ).all()
 
-    data_source = MultiLoadDataSource(frozenset(relevant_tag_ids))
+    result: Dict[int, List[TagTuple]] = defaultdict(list)
+    for medium_id, tag_id, tag_name in rows:
+        result[medium_id].append((tag_id, tag_name))
+    return result
 
-    return [_create_indexed_medium(data_source, m) for m in matching_media]
 
+def _load_batch(
+    session: Any, closure: ImplicationClosure, medium_rows: Sequence[Any]
+) -> List[MediumDocument]:
+    medium_ids = [row.id for row in medium_rows]
+    tags = _tags_by_medium(session, MediumTag, medium_ids)
+    absent_tags = _tags_by_medium(session, MediumTagAbsence, medium_ids)
 
-def full_load() -> Sequence[MediumDocument]:
-    session = g.db
+    return [
+        _create_indexed_medium(closure, row, tags[row.id], absent_tags[row.id])
+        for row in medium_rows
+    ]
 
-    all_media = (
-        session.query(Medium)
-        .options(joinedload(Medium.tags), joinedload(Medium.absent_tags))
+
+def multi_load(medium_ids: List[int]) -> List[MediumDocument]:
+    medium_rows = g.db.execute(
+        select(*_MEDIUM_COLUMNS).filter(Medium.id.in_(medium_ids))
+    ).all()
+
+    relevant_tag_ids = (
+        g.db.execute(
+            select(MediumTag.tag_id).filter(MediumTag.medium_id.in_(medium_ids))
+        )
+        .scalars()
         .all()
     )
 
-    all_implications = session.execute(select(TagImplication)).scalars().all()
-    all_tags = session.execute(select(Tag)).scalars().all()
+    return _load_batch(g.db, closure_for(relevant_tag_ids), medium_rows)
 
-    tag_name_by_id = {t.id: t.tag for t in all_tags}
 
-    # if Id=3 implies Id=5, implied_by_this[3] == set([5])
-    implied_by_this = defaultdict(set)
+def load_range(
+    session: Any,
+    closure: ImplicationClosure,
+    first_id: Optional[int] = None,
+    last_id: Optional[int] = None,
+) -> Iterator[MediumDocument]:
+    """Load all media in this (inclusive) range of ids, one batch at a time
+    (ordered by id). Either end may be left open.
 
-    for i in all_implications:
-        implied_by_this[i.implying_tag_id].add(i.implied_tag_id)
+    Only plain rows are loaded, so no ORM objects pile up in the session."""
 
-    all_aliases = session.execute(select(TagAlias)).scalars().all()
+    previous_id: Optional[int] = None
+    while True:
+        query = select(*_MEDIUM_COLUMNS).order_by(Medium.id).limit(BATCH_SIZE)
+        if previous_id is not None:
+            query = query.filter(Medium.id > previous_id)
+        elif first_id is not None:
+            query = query.filter(Medium.id >= first_id)
+        if last_id is not None:
+            query = query.filter(Medium.id <= last_id)
 
-    aliases_by_id = defaultdict(set)
-    for alias in all_aliases:
-        aliases_by_id[alias.tag_id].add(alias.alias)
+        medium_rows = session.execute(query).all()
+        if not medium_rows:
+            return
 
-    data_source = FullLoadDataSource(
-        implied_by_this, aliases_by_id, tag_name_by_id
-    )
+        yield from _load_batch(session, closure, medium_rows)
+        previous_id = medium_rows[-1].id
 
-    media_to_cache = [_create_indexed_medium(data_source, m) for m in all_media]
 
-    return media_to_cache
+def full_load() -> Iterator[MediumDocument]:
+    """Load all media, one batch at a time (ordered by id)."""
+    return load_range(g.db, full_closure())
@@ -0,0 +1,132 @@
+"""Counters and latencies of all cache layers.
+
+These are kept per process (so per worker), and are lost on restart.
+"""
+
+from bisect import bisect_left
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+
+from .types import CacheEntityKind, SubCache
+
+# Upper bounds (in milliseconds) of the buckets of each latency histogram.
+# Anything slower than the last one ends up in an additional bucket.
+BUCKET_BOUNDS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+
+class Latency:
+    """Histogram of how long something took."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+
+    def record(self, seconds: float) -> None:
+        milliseconds = seconds * 1000
+        self.count += 1
+        self.total_ms += milliseconds
+        self.max_ms = max(self.max_ms, milliseconds)
+        self.buckets[bisect_left(BUCKET_BOUNDS_MS, milliseconds)] += 1
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "totalMs": self.total_ms,
+            "maxMs": self.max_ms,
+            "buckets": self.buckets,
+        }
+
+
+class LayerMetrics:
+    """Everything we know about one kind of entity in one cache layer."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.lookup = Latency()
+        self.decode = Latency()
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytesRead": self.bytes_read,
+            "lookup": self.lookup.to_json(),
+            "decode": self.decode.to_json(),
+        }
+
+
+def layer_name(cache: SubCache) -> str:
+    return type(cache).__name__
+
+
+class CacheMetrics:
+    """Thread-safe collection of metrics of all layers and commands."""
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._layers: Dict[Tuple[str, CacheEntityKind], LayerMetrics] = {}
+        self._commands: Dict[Tuple[str, str], Latency] = {}
+
+    def _layer(self, layer: str, kind: CacheEntityKind) -> LayerMetrics:
+        key = (layer, kind)
+        metrics = self._layers.get(key, None)
+        if metrics is None:
+            metrics = self._layers[key] = LayerMetrics()
+        return metrics
+
+    def record_lookup(
+        self,
+        layer: str,
+        kind: CacheEntityKind,
+        hits: int,
+        misses: int,
+        seconds: float,
+    ) -> None:
+        """A layer has been asked for some entities of this kind."""
+        with self._lock:
+            metrics = self._layer(layer, kind)
+            metrics.hits += hits
+            metrics.misses += misses
+            metrics.lookup.record(seconds)
+
+    def record_decode(
+        self, layer: str, kind: CacheEntityKind, size: int, seconds: float
+    ) -> None:
+        """A layer has read (and decoded) an entity of this many bytes."""
+        with self._lock:
+            metrics = self._layer(layer, kind)
+            metrics.bytes_read += size
+            metrics.decode.record(seconds)
+
+    def record_command(self, command: str, layer: str, seconds: float) -> None:
+        """A command has been run on this layer."""
+        with self._lock:
+            key = (command, layer)
+            latency = self._commands.get(key, None)
+            if latency is None:
+                latency = self._commands[key] = Latency()
+            latency.record(seconds)
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            layers: Dict[str, Dict[str, Any]] = {}
+            for (layer, kind), metrics in self._layers.items():
+                layers.setdefault(layer, {})[kind.value] = metrics.to_json()
+
+            commands: Dict[str, Dict[str, Any]] = {}
+            for (command, layer), latency in self._commands.items():
+                commands.setdefault(command, {})[layer] = latency.to_json()
+
+            bucket_bounds: List[Any] = list(BUCKET_BOUNDS_MS)
+            return {
+                "bucketBoundsMs": bucket_bounds + [None],
+                "layers": layers,
+                "commands": commands,
+            }
+
+
+METRICS = CacheMetrics()
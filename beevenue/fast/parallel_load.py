@@ -0,0 +1,105 @@
+"""Load all media from SQL using several processes at once.
+
+Media are partitioned by ranges of their ids. Every worker process has its
+own database connection, and builds the documents of one partition at a
+time. They are then sent back to this process, which passes them on in order.
+"""
+
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from logging import info
+from multiprocessing import get_context
+import time
+from typing import Deque, Iterator, List, Optional, Sequence, Tuple
+
+from flask import current_app
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import Engine
+
+from beevenue.document_types import MediumDocument
+from beevenue.flask import g
+from beevenue.models import Medium
+
+from .data_source import ImplicationClosure, full_closure
+from .load import BATCH_SIZE, load_range
+
+# How many media make up one partition.
+PARTITION_SIZE = 10 * BATCH_SIZE
+
+# How many partitions (per worker) are loaded ahead of time.
+_AHEAD = 2
+
+# Inclusive range of medium ids.
+Partition = Tuple[int, int]
+
+# State of each worker process.
+_ENGINE: Optional[Engine] = None
+_CLOSURE: Optional[ImplicationClosure] = None
+
+
+def _init_worker(database_uri: str, closure: ImplicationClosure) -> None:
+    global _ENGINE, _CLOSURE  # pylint: disable=global-statement
+    _ENGINE = create_engine(database_uri, future=True)
+    _CLOSURE = closure
+
+
+def _load_partition(partition: Partition) -> List[MediumDocument]:
+    assert _ENGINE is not None and _CLOSURE is not None
+    with _ENGINE.connect() as connection:
+        return list(load_range(connection, _CLOSURE, *partition))
+
+
+def partitions(medium_ids: Sequence[int], size: int) -> List[Partition]:
+    """Split these (sorted) ids into ranges of up to 'size' ids each."""
+    return [
+        (medium_ids[i], medium_ids[min(i + size, len(medium_ids)) - 1])
+        for i in range(0, len(medium_ids), size)
+    ]
+
+
+def parallel_full_load(workers: int) -> Iterator[MediumDocument]:
+    """Load all media (ordered by id), using this many processes.
+
+    Only a few partitions are loaded ahead of whoever iterates over them."""
+    tic = time.perf_counter()
+
+    medium_ids = (
+        g.db.execute(select(Medium.id).order_by(Medium.id)).scalars().all()
+    )
+    todo = partitions(medium_ids, PARTITION_SIZE)
+    if not todo:
+        return
+
+    info(f"Loading {len(medium_ids)} media in {len(todo)} partitions.")
+
+    # Forked workers would share this process' database connections.
+    executor = ProcessPoolExecutor(
+        max_workers=min(workers, len(todo)),
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(
+            current_app.config["SQLALCHEMY_DATABASE_URI"],
+            full_closure(),
+        ),
+    )
+    with executor:
+        remaining = iter(todo)
+        pending: Deque["Future[List[MediumDocument]]"] = deque(
+            executor.submit(_load_partition, p)
+            for p in islice(remaining, _AHEAD * workers)
+        )
+
+        loaded_count = 0
+        for done in range(1, len(todo) + 1):
+            media = pending.popleft().result()
+            for partition in islice(remaining, 1):
+                pending.append(executor.submit(_load_partition, partition))
+
+            loaded_count += len(media)
+            toc = time.perf_counter()
+            info(
+                f"Loaded {done}/{len(todo)} partitions ({loaded_count} media)"
+                f" in {toc - tic:0.1f} s."
+            )
+            yield from media
@@ -0,0 +1,213 @@
+from threading import Lock
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+from .application import ApplicationWideCache
+from .shards import MANIFEST_QUERY, shard_index, shard_query
+from .types import CacheEntityKind, Change, ChangeKind, Query, SubCache, is_hit
+
+
+class _Derived:
+    """Things computed from the values of the store (not stored in any
+    layer), along with the generation of the values they came from.
+
+    That generation is None once this process has changed the values
+    itself, until it has caught up with the new generation."""
+
+    def __init__(self, generation: Optional[int]) -> None:
+        self.generation = generation
+        self.values: Dict[str, Any] = {}
+
+
+class _ProcessWideStore:
+    """Decoded entities of one specific cache generation."""
+
+    def __init__(self) -> None:
+        self.generation: Optional[int] = None
+        self.values: Dict[str, Any] = {}
+        self.derived = _Derived(None)
+
+
+_STORE = _ProcessWideStore()
+_STORE_LOCK = Lock()
+
+# Which media have which tags is not part of the change log,
+# so any change to media might affect any of these.
+_TAG_INDEX_PREFIXES = tuple(
+    Query(kind, "").hash
+    for kind in (
+        CacheEntityKind.INNATE_TAG_INDEX,
+        CacheEntityKind.SEARCHABLE_TAG_INDEX,
+        CacheEntityKind.TAG_INDEX_MANIFEST,
+    )
+)
+
+
+def _evict(values: Dict[str, Any], change: Change) -> None:
+    """Remove everything which this change might have affected."""
+
+    if change.kind == ChangeKind.SEARCHABLE_TAGS:
+        values.pop(Query(CacheEntityKind.SEARCHABLE_TAGS, "ALL").hash, None)
+        return
+
+    hashes = {MANIFEST_QUERY.hash}
+    for medium_id in change.medium_ids:
+        hashes.add(Query(CacheEntityKind.MEDIUM_DOCUMENT, medium_id).hash)
+        hashes.add(Query(CacheEntityKind.MEDIUM_DOCUMENT_TINY, medium_id).hash)
+        hashes.add(shard_query(shard_index(medium_id)).hash)
+    for medium_hash in change.hashes:
+        hashes.add(Query(CacheEntityKind.RATING_BY_HASH, medium_hash).hash)
+
+    for key in list(values.keys()):
+        if key in hashes or key.startswith(_TAG_INDEX_PREFIXES):
+            del values[key]
+
+
+TDerived = TypeVar("TDerived")
+
+
+class ProcessWideCache(SubCache):
+    """Keeps decoded entities around across requests, saving on round trips
+    and deserialization.
+
+    The entities are stamped with the generation of the layer below us.
+    Once per request, that generation is checked. If it changed, some other
+    worker has run a Command. Then we look up what it changed in the change
+    log, and only forget about those entities. If the log can't tell us,
+    we have to start over.
+
+    Entities of the excluded kinds are never kept, since some other layer
+    already holds them more efficiently (for as long as it does).
+    """
+
+    def __init__(
+        self,
+        upstream: ApplicationWideCache,
+        excluded_kinds: Callable[[], FrozenSet[CacheEntityKind]] = frozenset,
+    ) -> None:
+        self.upstream = upstream
+        self.excluded_kinds = excluded_kinds
+        self._generation: Optional[int] = None
+
+    def _values(self) -> Dict[str, Any]:
+        if self._generation is None:
+            generation = self.upstream.generation()
+            with _STORE_LOCK:
+                if _STORE.generation != generation:
+                    self._catch_up(generation)
+            self._generation = generation
+
+        return _STORE.values
+
+    def _catch_up(self, generation: int) -> None:
+        changes: Optional[List[Change]] = None
+        if _STORE.generation is not None:
+            changes = self.upstream.changes_since(_STORE.generation, generation)
+
+        if changes is None or any(
+            c.kind == ChangeKind.EVERYTHING for c in changes
+        ):
+            _STORE.values = {}
+        else:
+            for change in changes:
+                _evict(_STORE.values, change)
+
+        _STORE.generation = generation
+        _STORE.derived = _Derived(generation)
+
+    def _writable_values(self) -> Optional[Dict[str, Any]]:
+        values = self._values()
+
+        # Some other request in this process has moved on to a newer
+        # generation in the meantime. Whatever we are about to write
+        # might already be outdated, so we'd better not.
+        if _STORE.generation != self._generation:
+            return None
+        return values
+
+    def delete(self, *queries: Query) -> int:
+        values = self._values()
+
+        result = 0
+        for query in queries:
+            popped = values.pop(query.hash, None)
+            result += int(is_hit(popped))
+
+        return result
+
+    def get(self, query: Query) -> Optional[Any]:
+        return self._values().get(query.hash, None)
+
+    def get_many(self, queries: Iterable[Query]) -> Dict[Query, Any]:
+        values = self._values()
+        subresults = {query: values.get(query.hash, None) for query in queries}
+
+        return {
+            query: subresult
+            for query, subresult in subresults.items()
+            if is_hit(subresult)
+        }
+
+    def set(self, query: Query, value: Any) -> None:
+        self.set_many({query: value})
+
+    def set_many(self, values: Dict[Query, Any]) -> None:
+        excluded_kinds = self.excluded_kinds()
+        new_values = {
+            q.hash: v for q, v in values.items() if q.kind not in excluded_kinds
+        }
+
+        self._values()
+        # Otherwise, some other request might catch up with a newer
+        # generation between checking ours and writing.
+        with _STORE_LOCK:
+            if _STORE.generation == self._generation:
+                _STORE.values.update(new_values)
+
+    def bump_generation(self, change: Change) -> None:
+        # Our values are updated one by one, but things derived from them
+        # can't be, so just get rid of those.
+        generation: Optional[int] = None
+        if _STORE.generation == self.upstream.generation():
+            # We have already caught up with this change (e.g. on refill).
+            generation = _STORE.generation
+        _STORE.derived = _Derived(generation)
+
+    def derive(self, name: str, factory: Callable[[], TDerived]) -> TDerived:
+        """Get something computed from the cached entities.
+
+        It is only computed once per generation and then shared between
+        all requests of this process."""
+        result, _ = self.derive_with_generation(name, factory)
+        return result
+
+    def derive_with_generation(
+        self, name: str, factory: Callable[[], TDerived]
+    ) -> Tuple[TDerived, Optional[int]]:
+        """Like derive, but also tell which generation the result was
+        computed at (None if no other process knows that generation)."""
+        self._values()
+        derived = _STORE.derived
+
+        if name in derived.values:
+            result: TDerived = derived.values[name]
+            return result, derived.generation
+
+        result = factory()
+
+        # The values might have changed while computing this. Then, who
+        # knows which generation it belongs to.
+        if self._writable_values() is None or _STORE.derived is not derived:
+            return result, None
+
+        derived.values[name] = result
+        return result, derived.generation
@@ -1,5 +1,10 @@
-from typing import Any, Dict, Generic, Iterable, List, TypeVar
-from .types import CacheEntityKind, SubCache, Query
+import time
+from typing import Any, Dict, Generic, Iterable, List, Tuple, TypeVar
+
+from sentry_sdk import start_span
+
+from .metrics import METRICS, layer_name
+from .types import CacheEntityKind, SubCache, Query, is_hit
 
 
 TQueryable = TypeVar("TQueryable")
@@ -38,42 +43,48 @@ class SingleQueryHelper(Helper[Query, Any]):
         return None
 
 
-class ManyQueryHelper(Helper[List[Query], List[Any]]):
-    """Helper class for N-ary queries"""
-
-    def get(self, cache: SubCache, queriable: List[Query]) -> Dict[Query, Any]:
-        return cache.get_many(queriable)
-
-    def set(
-        self, cache: SubCache, _: List[Query], value: Dict[Query, Any]
-    ) -> None:
-        return cache.set_many(value)
-
-    def transform(self, cache_hit: Dict[Query, Any]) -> List[Any]:
-        return list(cache_hit.values())
+_SINGLE_QUERY_HELPER = SingleQueryHelper()
 
-    def miss(self) -> List[Any]:
-        return []
 
+def _record(
+    span_data: Dict[str, Any],
+    cache: SubCache,
+    kind: CacheEntityKind,
+    hits: int,
+    misses: int,
+    tic: float,
+) -> None:
+    seconds = time.perf_counter() - tic
+    layer = layer_name(cache)
 
-_SINGLE_QUERY_HELPER = SingleQueryHelper()
-_MANY_QUERY_HELPER = ManyQueryHelper()
+    METRICS.record_lookup(layer, kind, hits, misses, seconds)
+    span_data[layer] = {"hits": hits, "misses": misses, "ms": seconds * 1000}
 
 
 def _run(
     caches: Iterable[SubCache],
+    kind: CacheEntityKind,
     queriable: TQueryable,
     helper: Helper[TQueryable, TCached],
 ) -> TCached:
 
     caches_to_fill = []
 
-    for cache in caches:
-        cache_hit = helper.get(cache, queriable)
-        if not cache_hit:
-            caches_to_fill.append(cache)
-        else:
-            break
+    with start_span(op="cache", description=f"get {kind.value}") as span:
+        span_data: Dict[str, Any] = {}
+        for cache in caches:
+            tic = time.perf_counter()
+            cache_hit = helper.get(cache, queriable)
+            found = is_hit(cache_hit)
+            hits = int(found)
+            _record(span_data, cache, kind, hits, 1 - hits, tic)
+
+            if not found:
+                caches_to_fill.append(cache)
+            else:
+                break
+
+        span.set_data("layers", span_data)
 
     if cache_hit is None:
         # This may legit happen (e.g. for rating-by-hash) and is fine.
@@ -90,11 +101,40 @@ def run_single_query(
     caches: Iterable[SubCache], kind: CacheEntityKind, key: Any
 ) -> Any:
 
-    return _run(caches, Query(kind, key), _SINGLE_QUERY_HELPER)
+    return _run(caches, kind, Query(kind, key), _SINGLE_QUERY_HELPER)
 
 
 def run_many_query(
     caches: Iterable[SubCache], kind: CacheEntityKind, keys: Iterable[Any]
 ) -> List[Any]:
 
-    return _run(caches, [Query(kind, key) for key in keys], _MANY_QUERY_HELPER)
+    queries = [Query(kind, key) for key in keys]
+
+    found: Dict[Query, Any] = {}
+    missing = queries
+    caches_to_fill: List[Tuple[SubCache, List[Query]]] = []
+
+    # Every layer only gets asked for what the layers above it are missing.
+    # Otherwise, partially filled layers would hide part of the results.
+    with start_span(op="cache", description=f"get_many {kind.value}") as span:
+        span_data: Dict[str, Any] = {}
+        for cache in caches:
+            if not missing:
+                break
+
+            tic = time.perf_counter()
+            cache_hits = cache.get_many(missing) or {}
+            found.update(cache_hits)
+
+            missing = [q for q in missing if q not in cache_hits]
+            caches_to_fill.append((cache, missing))
+            _record(span_data, cache, kind, len(cache_hits), len(missing), tic)
+
+        span.set_data("layers", span_data)
+
+    for cache, missed in reversed(caches_to_fill):
+        to_fill = {q: found[q] for q in missed if q in found}
+        if to_fill:
+            cache.set_many(to_fill)
+
+    return [found[q] for q in queries if q in found]
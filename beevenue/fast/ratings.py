@@ -0,0 +1,69 @@
+from binascii import Error as BinasciiError
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from beevenue.document_types import TinyMediumDocument
+
+from .columnar import RATINGS
+
+# Media are identified by the hex digest of their MD5 checksum.
+_DIGEST_SIZE = 16
+
+
+def _digest(medium_hash: str) -> Optional[bytes]:
+    try:
+        digest = bytes.fromhex(medium_hash)
+    except (BinasciiError, ValueError):
+        return None
+
+    if len(digest) != _DIGEST_SIZE:
+        return None
+    return digest
+
+
+class RatingIndex:
+    """Rating of every medium, by its hash.
+
+    Hashes are stored as sorted raw digests, with their ratings in a
+    parallel array, so looking one up is a binary search over a few
+    bytes per medium."""
+
+    def __init__(self, media: Sequence[TinyMediumDocument]) -> None:
+        digests = []
+        ratings = []
+        for medium in media:
+            digest = _digest(medium.medium_hash)
+            if digest is None or medium.rating not in RATINGS:
+                # Looked up the slow way instead.
+                continue
+            digests.append(digest)
+            ratings.append(RATINGS.index(medium.rating))
+
+        unsorted_digests = np.array(digests, dtype=f"S{_DIGEST_SIZE}")
+        order = np.argsort(unsorted_digests, kind="stable")
+        self.digests = unsorted_digests[order]
+        self.ratings = np.array(ratings, dtype=np.uint8)[order]
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "RatingIndex":
+        """Wrap these arrays (see arrays()) without copying them."""
+        index = cls.__new__(cls)
+        index.digests = arrays["digests"]
+        index.ratings = arrays["ratings"]
+        return index
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {"digests": self.digests, "ratings": self.ratings}
+
+    def get(self, medium_hash: str) -> Optional[str]:
+        """Get the rating of the medium with this hash (if it exists)."""
+        digest = _digest(medium_hash)
+        if digest is None:
+            return None
+
+        key = np.array(digest, dtype=f"S{_DIGEST_SIZE}")
+        position = int(np.searchsorted(self.digests, key))
+        if position == len(self.digests) or self.digests[position] != key:
+            return None
+        return RATINGS[self.ratings[position]]
@@ -0,0 +1,55 @@
+from collections import defaultdict
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, TypeVar
+
+from beevenue.document_types import TinyMediumDocument
+
+from .types import CacheEntityKind, Query
+
+# How many consecutive medium ids share one shard.
+# Note: Changing this requires a complete refill of the cache.
+SHARD_SIZE = 1000
+
+MANIFEST_QUERY = Query(CacheEntityKind.MEDIUM_DOCUMENT_TINY_MANIFEST, "ALL")
+
+TDocument = TypeVar("TDocument", bound=TinyMediumDocument)
+
+
+def shard_index(medium_id: int) -> int:
+    return medium_id // SHARD_SIZE
+
+
+def shard_query(index: int) -> Query:
+    return Query(CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD, index)
+
+
+def split_into_shards(
+    media: Iterable[TDocument],
+) -> Dict[int, List[TDocument]]:
+    """Group these media by the shard they belong into."""
+
+    result: Dict[int, List[TDocument]] = defaultdict(list)
+    for medium in media:
+        result[shard_index(medium.medium_id)].append(medium)
+    return dict(result)
+
+
+def shard_batches(
+    media: Iterable[TDocument], size: int
+) -> Iterator[Dict[int, List[TDocument]]]:
+    """Group these media (ordered by id) by the shard they belong into,
+    yielding whole shards with about 'size' media at a time."""
+
+    batch: Dict[int, List[TDocument]] = {}
+    count = 0
+    for index, shard in groupby(media, lambda m: shard_index(m.medium_id)):
+        batch[index] = list(shard)
+        count += len(batch[index])
+
+        if count >= size:
+            yield batch
+            batch = {}
+            count = 0
+
+    if batch:
+        yield batch
@@ -0,0 +1,559 @@
+"""Tiny medium documents in shared memory, for all workers on this host.
+
+Every generation of the cache gets its own segment, named after it. It holds
+all shards of tiny medium documents, packed into a single buffer:
+
+* a header,
+* all tag names (the shards refer to them by their index),
+* all tag names of the columnar snapshot (by their tag id there),
+* a table with offset and length of every shard,
+* a table with name, type, offset and length of every array,
+* the shards themselves, serialized just like in Redis,
+* the arrays of the columnar snapshot and of the rating index.
+
+Workers search and count media using those arrays as they are, so they
+don't need to decode any documents for that.
+
+Segments never change after they have been written, so reading them needs
+no locking at all. Whichever worker first knows all shards of a generation
+writes its segment (usually the worker running a Command), and removes all
+older segments.
+"""
+
+from contextlib import contextmanager
+from functools import lru_cache
+import glob
+from logging import warning
+from multiprocessing import resource_tracker, shared_memory
+import os
+import struct
+from threading import Lock
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    overload,
+)
+
+import numpy as np
+
+from beevenue.document_types import TinyMediumDocument
+
+from .application import ApplicationWideCache
+from .application.dictionary import FixedTagDictionary
+from .application.schemas import LISTS_SCHEMA, TinyShardSchema
+from .columnar import ColumnarSnapshot
+from .ratings import RatingIndex
+from .types import CacheEntityKind, Change, Query, SubCache, is_hit
+
+# Increment this whenever the layout of the segments changes.
+SEGMENT_VERSION = 2
+
+# Only these kinds are held in shared memory.
+SHARED_KINDS = frozenset(
+    [
+        CacheEntityKind.MEDIUM_DOCUMENT_TINY_MANIFEST,
+        CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD,
+    ]
+)
+
+_PREFIX = "beevenue_tiny_"
+_MAGIC = b"BVSM"
+
+# Magic, version, generation, shard count, array count, and length of the
+# tag names of the shards and of the columnar snapshot.
+_HEADER = struct.Struct("<4sIQIIII")
+# Index, offset and length of a shard.
+_TABLE_ENTRY = struct.Struct("<IQI")
+# Name, dtype, offset and length (in items) of an array.
+_ARRAY_ENTRY = struct.Struct("<32s8sQQ")
+
+# Arrays start at multiples of this, so numpy can read them efficiently.
+_ALIGNMENT = 8
+
+# How many decoded shards each snapshot keeps, for terms which read media.
+_CACHED_SHARDS = 16
+
+# Where segments show up as files (on Linux, at least).
+_SEGMENT_FOLDER = "/dev/shm"
+
+Shards = Dict[int, List[TinyMediumDocument]]
+
+
+def _segment_name(generation: int) -> str:
+    return f"{_PREFIX}{generation}"
+
+
+def _untrack(memory: shared_memory.SharedMemory) -> None:
+    # Otherwise, Python removes the segment as soon as this process exits,
+    # even though other workers might still need it.
+    name = getattr(memory, "_name")
+    resource_tracker.unregister(name, "shared_memory")  # type: ignore
+
+
+def _string_list(strings: List[str]) -> bytes:
+    message = LISTS_SCHEMA.StringList.new_message()
+    field = message.init("strings", len(strings))
+    for i, string in enumerate(strings):
+        field[i] = string
+    result: bytes = message.to_bytes()
+    return result
+
+
+def _arrays(shards: Shards) -> Tuple[Dict[str, np.ndarray], List[str]]:
+    """All arrays to share, and the tag names of the columnar snapshot."""
+    ordered = [shards[i] for i in sorted(shards.keys())]
+    media = [tiny for shard in ordered for tiny in shard]
+
+    snapshot = ColumnarSnapshot(media)
+    arrays = {
+        f"columnar.{name}": array for name, array in snapshot.arrays().items()
+    }
+    for name, array in RatingIndex(media).arrays().items():
+        arrays[f"ratings.{name}"] = array
+
+    # Row of the first medium of every shard (and after the last one).
+    shard_starts = np.zeros(len(ordered) + 1, dtype=np.int64)
+    np.cumsum([len(shard) for shard in ordered], out=shard_starts[1:])
+    arrays["shard_starts"] = shard_starts
+
+    return arrays, snapshot.tag_names
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+def _pack(generation: int, shards: Shards) -> bytes:
+    tags = FixedTagDictionary()
+    schema = TinyShardSchema(tags)
+    serialized = {i: schema.serialize(s) for i, s in sorted(shards.items())}
+    names_bytes = _string_list(tags.all_names())
+
+    arrays, column_names = _arrays(shards)
+    column_names_bytes = _string_list(column_names)
+
+    offset = _HEADER.size + len(names_bytes) + len(column_names_bytes)
+    offset += _TABLE_ENTRY.size * len(serialized)
+    offset += _ARRAY_ENTRY.size * len(arrays)
+
+    table = []
+    for index, raw_bytes in serialized.items():
+        table.append(_TABLE_ENTRY.pack(index, offset, len(raw_bytes)))
+        offset += len(raw_bytes)
+
+    array_table = []
+    array_parts = []
+    for name, array in arrays.items():
+        padding = _aligned(offset) - offset
+        array_parts.append(b"\0" * padding)
+        offset += padding
+
+        array_bytes = np.ascontiguousarray(array).tobytes()
+        array_table.append(
+            _ARRAY_ENTRY.pack(
+                name.encode("ascii"),
+                array.dtype.str.encode("ascii"),
+                offset,
+                len(array),
+            )
+        )
+        array_parts.append(array_bytes)
+        offset += len(array_bytes)
+
+    header = _HEADER.pack(
+        _MAGIC,
+        SEGMENT_VERSION,
+        generation,
+        len(serialized),
+        len(arrays),
+        len(names_bytes),
+        len(column_names_bytes),
+    )
+    return b"".join(
+        [
+            header,
+            names_bytes,
+            column_names_bytes,
+            *table,
+            *array_table,
+            *serialized.values(),
+            *array_parts,
+        ]
+    )
+
+
+def _prefixed(
+    arrays: Dict[str, np.ndarray], prefix: str
+) -> Dict[str, np.ndarray]:
+    return {
+        name[len(prefix) :]: array
+        for name, array in arrays.items()
+        if name.startswith(prefix)
+    }
+
+
+class _SegmentMedia(Sequence[TinyMediumDocument]):
+    """All media of a segment, in the order of its columnar snapshot.
+
+    Shards are only decoded once some medium of theirs is asked for."""
+
+    def __init__(self, segment: "_Segment") -> None:
+        self.starts = segment.arrays["shard_starts"]
+        self.indices = segment.indices
+        self._shard = lru_cache(maxsize=_CACHED_SHARDS)(segment.shard)
+
+    def __len__(self) -> int:
+        return int(self.starts[-1])
+
+    @overload
+    def __getitem__(self, row: int) -> TinyMediumDocument:
+        ...
+
+    @overload
+    def __getitem__(self, row: slice) -> Sequence[TinyMediumDocument]:
+        ...
+
+    def __getitem__(self, row: Any) -> Any:
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+
+        position = int(np.searchsorted(self.starts, row, "right")) - 1
+        shard = self._shard(self.indices[position])
+        if shard is None:
+            raise IndexError(row)
+        return shard[row - int(self.starts[position])]
+
+
+class _Segment:
+    """All shards of one generation, read straight from shared memory."""
+
+    def __init__(self, memory: shared_memory.SharedMemory) -> None:
+        self.memory = memory
+        buffer = memory.buf
+
+        (
+            magic,
+            version,
+            generation,
+            count,
+            array_count,
+            names_size,
+            column_names_size,
+        ) = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC or version != SEGMENT_VERSION:
+            raise ValueError("Shared memory segment of a different version.")
+        self.generation = generation
+
+        names_end = _HEADER.size + names_size
+        names = LISTS_SCHEMA.StringList.from_bytes(
+            buffer[_HEADER.size : names_end]
+        )
+        self.schema = TinyShardSchema(FixedTagDictionary(names.strings))
+
+        column_names_end = names_end + column_names_size
+        column_names = LISTS_SCHEMA.StringList.from_bytes(
+            buffer[names_end:column_names_end]
+        )
+        self.column_names = list(column_names.strings)
+
+        self._locations: Dict[int, Tuple[int, int]] = {}
+        for i in range(count):
+            index, offset, length = _TABLE_ENTRY.unpack_from(
+                buffer, column_names_end + i * _TABLE_ENTRY.size
+            )
+            self._locations[index] = (offset, length)
+
+        self.indices = sorted(self._locations.keys())
+
+        # These are no copies, they read from shared memory directly.
+        self.arrays: Dict[str, np.ndarray] = {}
+        arrays_start = column_names_end + count * _TABLE_ENTRY.size
+        for i in range(array_count):
+            name, dtype, offset, length = _ARRAY_ENTRY.unpack_from(
+                buffer, arrays_start + i * _ARRAY_ENTRY.size
+            )
+            array = np.frombuffer(
+                buffer,
+                dtype=np.dtype(dtype.rstrip(b"\0").decode("ascii")),
+                count=length,
+                offset=offset,
+            )
+            # Shared with all other workers, so nobody may change it.
+            array.setflags(write=False)
+            self.arrays[name.rstrip(b"\0").decode("ascii")] = array
+
+    def shard(self, index: int) -> Optional[List[TinyMediumDocument]]:
+        """Decode this shard. Its documents are not kept by the segment."""
+        location = self._locations.get(index, None)
+        if location is None:
+            return None
+
+        offset, length = location
+        shard: Optional[List[TinyMediumDocument]] = self.schema.deserialize(
+            self.memory.buf[offset : offset + length]
+        )
+        return shard
+
+    def columnar(self) -> ColumnarSnapshot:
+        return ColumnarSnapshot.from_arrays(
+            _SegmentMedia(self),
+            _prefixed(self.arrays, "columnar."),
+            self.column_names,
+        )
+
+    def rating_index(self) -> RatingIndex:
+        return RatingIndex.from_arrays(_prefixed(self.arrays, "ratings."))
+
+    def close(self) -> bool:
+        """Stop using this segment. Returns if that was possible."""
+        self.arrays = {}
+        try:
+            self.memory.close()
+        except BufferError:
+            # Some documents or arrays from this segment are still in use.
+            return False
+        return True
+
+
+# All segments this process has attached to, by generation.
+_SEGMENTS: Dict[int, _Segment] = {}
+_SEGMENTS_LOCK = Lock()
+
+
+def _attach(generation: int) -> Optional[_Segment]:
+    segment = _SEGMENTS.get(generation, None)
+    if segment is not None:
+        return segment
+
+    with _SEGMENTS_LOCK:
+        segment = _SEGMENTS.get(generation, None)
+        if segment is not None:
+            return segment
+
+        try:
+            memory = shared_memory.SharedMemory(_segment_name(generation))
+        except FileNotFoundError:
+            return None
+        _untrack(memory)
+
+        try:
+            segment = _Segment(memory)
+        except ValueError as error:
+            warning(f"Ignoring shared memory segment: {error}")
+            memory.close()
+            return None
+
+        # Older generations will never be read again.
+        for old_generation in list(_SEGMENTS.keys()):
+            if (
+                old_generation < generation
+                and _SEGMENTS[old_generation].close()
+            ):
+                del _SEGMENTS[old_generation]
+
+        _SEGMENTS[generation] = segment
+        return segment
+
+
+# Generations whose segment couldn't be written by this process.
+_FAILED_GENERATIONS: Set[int] = set()
+
+
+def has_failed(generation: int) -> bool:
+    """Did writing the segment of this generation fail?"""
+    return generation in _FAILED_GENERATIONS
+
+
+def _publish(generation: int, shards: Shards) -> None:
+    name = _segment_name(generation)
+    if os.path.exists(os.path.join(_SEGMENT_FOLDER, name)):
+        # Some other worker was faster, so don't bother packing.
+        return
+
+    raw_bytes = _pack(generation, shards)
+
+    try:
+        memory = shared_memory.SharedMemory(
+            name, create=True, size=max(len(raw_bytes), 1)
+        )
+    except FileExistsError:
+        # Some other worker was faster.
+        return
+    except OSError as error:
+        # Most likely, shared memory is full. Not a reason to fail, though.
+        # But don't try again (and again) for this generation.
+        warning(f"Could not create shared memory segment: {error}")
+        _FAILED_GENERATIONS.clear()
+        _FAILED_GENERATIONS.add(generation)
+        return
+
+    _untrack(memory)
+    memory.buf[: len(raw_bytes)] = raw_bytes
+    memory.close()
+
+    _remove_older_than(generation)
+
+
+def _remove_older_than(generation: int) -> None:
+    # Attached workers can keep using removed segments (until they detach).
+    for path in glob.glob(os.path.join(_SEGMENT_FOLDER, f"{_PREFIX}*")):
+        name = os.path.basename(path)
+        try:
+            old_generation = int(name[len(_PREFIX) :])
+        except ValueError:
+            continue
+
+        if old_generation >= generation:
+            continue
+
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+class SharedMemoryCache(SubCache):
+    """Holds all tiny medium documents in shared memory, along with the
+    columnar snapshot and the rating index built from them.
+
+    All workers on this host read them from the very same bytes, so they
+    only take up memory once, no matter how many workers there are.
+
+    Writes are collected until all shards of the current generation are
+    known, and then written to a new segment all at once. If that fails,
+    this layer is skipped for the rest of that generation."""
+
+    def __init__(self, upstream: ApplicationWideCache) -> None:
+        self.upstream = upstream
+
+        # While running a Command: The segment it is based on.
+        self._base: Optional[_Segment] = None
+        self._is_batching = False
+
+        self._manifest: Optional[List[int]] = None
+        self._shards: Dict[int, Optional[List[TinyMediumDocument]]] = {}
+
+    def columnar(self) -> Optional[ColumnarSnapshot]:
+        """Columnar snapshot of the current generation, if it is shared."""
+        segment = None if self._is_batching else self._segment()
+        return segment.columnar() if segment else None
+
+    def rating_index(self) -> Optional[RatingIndex]:
+        """Rating index of the current generation, if it is shared."""
+        segment = None if self._is_batching else self._segment()
+        return segment.rating_index() if segment else None
+
+    def held_kinds(self) -> FrozenSet[CacheEntityKind]:
+        """Kinds this layer holds, so that the layers above needn't."""
+        if has_failed(self.upstream.generation()):
+            return frozenset()
+        return SHARED_KINDS
+
+    def _segment(self) -> Optional[_Segment]:
+        if self._is_batching:
+            return self._base
+        return _attach(self.upstream.generation())
+
+    @contextmanager
+    def batch(self, atomic: bool = True) -> Iterator[None]:
+        # By now, the layer below us has already moved on to the generation
+        # this Command produces. So it must be based on the one before.
+        self._is_batching = True
+        self._base = _attach(self.upstream.generation() - 1)
+        try:
+            yield
+        finally:
+            self._is_batching = False
+            self._base = None
+            self._manifest = None
+            self._shards = {}
+
+    def bump_generation(self, change: Change) -> None:
+        self._try_publish()
+
+    def _try_publish(self) -> None:
+        segment = self._segment()
+
+        manifest = self._manifest
+        if manifest is None and segment is not None:
+            manifest = segment.indices
+        if manifest is None:
+            return
+
+        shards: Shards = {}
+        for index in manifest:
+            if index in self._shards:
+                shard = self._shards[index]
+            elif segment is not None:
+                shard = segment.shard(index)
+            else:
+                shard = None
+
+            if shard is None:
+                # We don't know enough (yet).
+                return
+            shards[index] = shard
+
+        _publish(self.upstream.generation(), shards)
+        self._manifest = None
+        self._shards = {}
+
+    def delete(self, *queries: Query) -> int:
+        result = 0
+        for query in queries:
+            if query.kind == CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD:
+                self._shards[query.key] = None
+                result += 1
+        return result
+
+    def get(self, query: Query) -> Optional[Any]:
+        if query.kind not in SHARED_KINDS:
+            return None
+
+        segment = self._segment()
+        if query.kind == CacheEntityKind.MEDIUM_DOCUMENT_TINY_MANIFEST:
+            if self._manifest is not None:
+                return self._manifest
+            return segment.indices if segment else None
+
+        if query.key in self._shards:
+            return self._shards[query.key]
+        return segment.shard(query.key) if segment else None
+
+    def get_many(self, queries: List[Query]) -> Dict[Query, Any]:
+        result = {}
+        for query in queries:
+            value = self.get(query)
+            if is_hit(value):
+                result[query] = value
+        return result
+
+    def set(self, query: Query, value: Any) -> None:
+        self.set_many({query: value})
+
+    def set_many(self, values: Dict[Query, Any]) -> None:
+        if not self._is_batching and has_failed(self.upstream.generation()):
+            return
+
+        is_relevant = False
+        for query, value in values.items():
+            if query.kind == CacheEntityKind.MEDIUM_DOCUMENT_TINY_MANIFEST:
+                self._manifest = list(value)
+                is_relevant = True
+            elif query.kind == CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD:
+                self._shards[query.key] = value
+                is_relevant = True
+
+        # Outside of Commands, the layers below us fill us up bit by bit.
+        if is_relevant and not self._is_batching:
+            self._try_publish()
@@ -0,0 +1,216 @@
+"""On-disk snapshot of all medium documents.
+
+Loading all media from SQL is by far the slowest part of a refill. So after
+each refill, the documents are written to disk, stamped with a fingerprint
+of the SQL data they were built from. As long as that fingerprint still
+matches, the next refill (e.g. on startup) can just read them back in.
+"""
+
+import hashlib
+from logging import info, warning
+import mmap
+import os
+import struct
+from typing import Iterable, Iterator, List, Optional
+
+from sqlalchemy import select
+
+from beevenue.document_types import MediumDocument
+from beevenue.flask import g
+from beevenue.models import TableVersion
+from beevenue.paths import snapshot_path
+
+from .application.schemas import SCHEMAS
+from .types import CacheEntityKind
+
+# Increment this whenever the file format or the document schema changes.
+SNAPSHOT_VERSION = 2
+
+_MAGIC = b"BVSN"
+
+# Magic, version, fingerprint (as hex digest) and document count.
+_HEADER = struct.Struct("<4sI32sI")
+_LENGTH = struct.Struct("<I")
+
+_SCHEMA = SCHEMAS[CacheEntityKind.MEDIUM_DOCUMENT]
+
+# While writing, documents are flushed to disk this many at a time. Only
+# flushed documents can be read back if writing fails later on.
+_FLUSH_INTERVAL = 1000
+
+
+def sql_fingerprint() -> str:
+    """Hash of the versions of all SQL tables medium documents are built from.
+
+    Triggers count every change to those tables (see TableVersion), so this
+    only reads a handful of rows."""
+
+    versions = g.db.execute(
+        select(TableVersion.table_name, TableVersion.version).order_by(
+            TableVersion.table_name
+        )
+    ).all()
+
+    raw = ",".join(f"{name}={version}" for name, version in versions)
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+class SnapshotMedia:
+    """All documents of a snapshot, read from disk whenever iterated over.
+
+    They are never all in memory at once (unless somebody keeps them)."""
+
+    def __init__(self, mapped: mmap.mmap, count: int) -> None:
+        self._mapped = mapped
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[MediumDocument]:
+        offset = _HEADER.size
+        for _ in range(self._count):
+            (length,) = _LENGTH.unpack_from(self._mapped, offset)
+            offset += _LENGTH.size
+            yield _SCHEMA.deserialize(self._mapped[offset : offset + length])
+            offset += length
+
+    def close(self) -> None:
+        self._mapped.close()
+
+
+# The snapshot this process opened last. Once a newer one replaces it, it
+# is closed right away, instead of whenever it is garbage collected.
+_current: Optional[SnapshotMedia] = None
+
+
+def _replace_current(media: Optional[SnapshotMedia]) -> None:
+    global _current  # pylint: disable=global-statement,invalid-name
+
+    if _current is not None:
+        _current.close()
+    _current = media
+
+
+def load_snapshot(fingerprint: str) -> Optional[SnapshotMedia]:
+    """Open the documents on disk, if they match this fingerprint."""
+
+    path = snapshot_path()
+    if not os.path.exists(path):
+        return None
+
+    if os.path.getsize(path) < _HEADER.size:
+        warning("Ignoring truncated cache snapshot.")
+        return None
+
+    with open(path, "rb") as snapshot_file:
+        # This stays valid even if the file is replaced in the meantime.
+        mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, raw_fingerprint, count = _HEADER.unpack_from(mapped)
+    if magic != _MAGIC or version != SNAPSHOT_VERSION:
+        info("Ignoring cache snapshot of a different version.")
+        mapped.close()
+        return None
+    if raw_fingerprint.decode("ascii") != fingerprint:
+        info("Ignoring outdated cache snapshot.")
+        mapped.close()
+        return None
+
+    info(f"Opened cache snapshot of {count} media.")
+    media = SnapshotMedia(mapped, count)
+    _replace_current(media)
+    return media
+
+
+def write_snapshot(
+    media: Iterable[MediumDocument], fingerprint: str
+) -> Optional[List[MediumDocument]]:
+    """Write these documents to disk, replacing any older snapshot.
+
+    They are written one at a time, so they needn't all be in memory.
+    If writing fails, all of them are returned instead, so that nobody has
+    to load them again (None means they were written)."""
+
+    path = snapshot_path()
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    writer = _Writer(temporary_path, fingerprint)
+    remaining = iter(media)
+
+    try:
+        writer.write(remaining)
+
+        # Readers must never see a half-written snapshot.
+        os.replace(temporary_path, path)
+        _replace_current(None)
+        return None
+    except OSError as error:
+        if writer.loading:
+            raise
+
+        # Not being able to skip the next full load is no reason to fail.
+        warning(f"Could not write cache snapshot: {error}")
+        return writer.written() + list(remaining)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+class _Writer:
+    """Writes documents to a snapshot file, remembering those not flushed
+    yet, so that none of them get lost if writing fails."""
+
+    def __init__(self, path: str, fingerprint: str) -> None:
+        self.path = path
+        self.fingerprint = fingerprint
+        self.flushed_count = 0
+        self.unflushed: List[MediumDocument] = []
+        self.loading = False
+
+    def _header(self, count: int) -> bytes:
+        return _HEADER.pack(
+            _MAGIC, SNAPSHOT_VERSION, self.fingerprint.encode("ascii"), count
+        )
+
+    def write(self, media: Iterator[MediumDocument]) -> None:
+        with open(self.path, "wb") as snapshot_file:
+            snapshot_file.write(self._header(0))
+
+            while True:
+                # Failing to load is not failing to write. It's up to the
+                # caller to handle that.
+                self.loading = True
+                medium = next(media, None)
+                self.loading = False
+                if medium is None:
+                    break
+
+                self.unflushed.append(medium)
+                raw_bytes = _SCHEMA.serialize(medium)
+                snapshot_file.write(_LENGTH.pack(len(raw_bytes)))
+                snapshot_file.write(raw_bytes)
+
+                if len(self.unflushed) == _FLUSH_INTERVAL:
+                    snapshot_file.flush()
+                    self.flushed_count += len(self.unflushed)
+                    self.unflushed = []
+
+            # Only now do we know how many there are.
+            count = self.flushed_count + len(self.unflushed)
+            snapshot_file.seek(0)
+            snapshot_file.write(self._header(count))
+
+    def written(self) -> List[MediumDocument]:
+        """All documents written so far, read back from disk if flushed."""
+        if not self.flushed_count:
+            return self.unflushed
+
+        with open(self.path, "rb") as snapshot_file:
+            mapped = mmap.mmap(
+                snapshot_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        flushed = SnapshotMedia(mapped, self.flushed_count)
+        try:
+            return list(flushed) + self.unflushed
+        finally:
+            flushed.close()
@@ -0,0 +1,217 @@
+from logging import info, warning
+from math import ceil
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import current_app
+from redis.exceptions import LockError
+from sqlalchemy import select
+from werkzeug.exceptions import ServiceUnavailable
+
+from beevenue.documents import TinyIndexedMedium
+from beevenue.flask import g
+from beevenue.models import Medium
+
+from .application import ApplicationWideCache
+from .load import multi_load
+from .queries import run_single_query
+from .shards import MANIFEST_QUERY, SHARD_SIZE
+from .tag_index import INDEX_KINDS, manifest_query, tagged_ids_from
+from .types import CacheEntityKind, Query, SubCache
+
+
+def _load_media(medium_ids: List[int]) -> Dict[int, Any]:
+    return {m.medium_id: m for m in multi_load(medium_ids)}
+
+
+def _load_tinies(medium_ids: List[int]) -> Dict[int, Any]:
+    return {
+        m.medium_id: TinyIndexedMedium.from_full(m)
+        for m in multi_load(medium_ids)
+    }
+
+
+def _load_ratings(medium_hashes: List[str]) -> Dict[str, Any]:
+    rows = g.db.execute(
+        select(Medium.hash, Medium.rating).filter(
+            Medium.hash.in_(medium_hashes)
+        )
+    ).all()
+    return {medium_hash: rating for medium_hash, rating in rows}
+
+
+def _load_shards(indices: List[int]) -> Dict[int, Any]:
+    result: Dict[int, Any] = {}
+    for index in indices:
+        medium_ids = (
+            g.db.execute(
+                select(Medium.id).filter(
+                    Medium.id >= index * SHARD_SIZE,
+                    Medium.id < (index + 1) * SHARD_SIZE,
+                )
+            )
+            .scalars()
+            .all()
+        )
+
+        tinies = _load_tinies(list(medium_ids))
+        if tinies:
+            result[index] = [tinies[i] for i in sorted(tinies.keys())]
+    return result
+
+
+def _tagged_ids_loader(
+    kind: CacheEntityKind,
+) -> Callable[[List[str]], Dict[str, Any]]:
+    def _load(tag_names: List[str]) -> Dict[str, Any]:
+        # Much cheaper than finding all tags, aliases and implications
+        # in SQL again, and just as up to date.
+        snapshot = g.fast.get_columnar()
+        column = snapshot.innate
+        if kind == CacheEntityKind.SEARCHABLE_TAG_INDEX:
+            column = snapshot.searchable
+
+        result: Dict[str, Any] = {}
+        for name in tag_names:
+            ids = snapshot.ids[snapshot.tag_mask(column, name)]
+            if len(ids):
+                result[name] = tagged_ids_from(ids)
+        return result
+
+    return _load
+
+
+# These entities can be loaded one by one. Everything else is derived from
+# all media at once, so it can only be restored by refilling everything.
+_POINT_LOADERS: Dict[CacheEntityKind, Callable[[List[Any]], Dict[Any, Any]]] = {
+    CacheEntityKind.MEDIUM_DOCUMENT: _load_media,
+    CacheEntityKind.MEDIUM_DOCUMENT_TINY: _load_tinies,
+    CacheEntityKind.RATING_BY_HASH: _load_ratings,
+}
+
+
+class SqlCache(SubCache):
+    """Not really a cache, but the source of truth for all layers above it.
+
+    Single media are loaded as needed. So are single shards and tag ids
+    which the layer above us has lost (e.g. evicted under memory pressure),
+    as long as their manifest still lists them. If a manifest itself is
+    lost, most likely everything else is, too (e.g. because Redis
+    restarted). Then, we refill all layers. Only one worker does that at a
+    time. The others wait for it to finish (for a while, see
+    BEEVENUE_REFILL_WAIT_SECONDS).
+    """
+
+    def __init__(
+        self, upstream: ApplicationWideCache, refill: Callable[[], None]
+    ) -> None:
+        self.upstream = upstream
+        self.refill = refill
+
+    def delete(self, *queries: Query) -> int:
+        """Should never happen."""
+        return 0
+
+    def get(self, query: Query) -> Optional[Any]:
+        return self.get_many([query]).get(query, None)
+
+    def get_many(self, queries: List[Query]) -> Dict[Query, Any]:
+        result: Dict[Query, Any] = {}
+        if not queries:
+            return result
+
+        # All queries of a single call are always of the same kind.
+        kind = queries[0].kind
+
+        loader = _POINT_LOADERS.get(kind, None)
+        if loader is not None:
+            loaded = loader([q.key for q in queries])
+            for query in queries:
+                if query.key in loaded:
+                    result[query] = loaded[query.key]
+            return result
+
+        if kind == CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD:
+            return self._reload_listed(queries, MANIFEST_QUERY, _load_shards)
+
+        if kind in INDEX_KINDS:
+            return self._reload_listed(
+                queries, manifest_query(kind), _tagged_ids_loader(kind)
+            )
+
+        # All other kinds are manifests, which always exist.
+        self._ensure_filled(queries[0])
+        return self.upstream.get_many(queries)
+
+    def set(self, query: Query, value: Any) -> None:
+        """Should never happen."""
+
+    def set_many(self, values: Dict[Query, Any]) -> None:
+        """Should never happen."""
+
+    def _reload_listed(
+        self,
+        queries: List[Query],
+        manifest: Query,
+        load: Callable[[List[Any]], Dict[Any, Any]],
+    ) -> Dict[Query, Any]:
+        """Load whatever this manifest lists, but the layer above us lost.
+
+        Everything the manifest doesn't list just doesn't exist."""
+        # Asking all layers, since the upper ones usually hold it decoded.
+        # This refills everything, should the manifest be lost, too.
+        listed = set(
+            run_single_query(g.fast.caches, manifest.kind, manifest.key) or []
+        )
+
+        missing = [q for q in queries if q.key in listed]
+        if not missing:
+            return {}
+
+        # Maybe somebody else has restored them in the meantime.
+        result = self.upstream.get_many(missing)
+
+        keys = [q.key for q in missing if q not in result]
+        if keys:
+            kind = missing[0].kind
+            warning(f"Cache has lost {len(keys)} entities of kind {kind.name}.")
+            loaded = load(keys)
+            for query in missing:
+                if query.key in loaded:
+                    result[query] = loaded[query.key]
+
+        return result
+
+    def _ensure_filled(self, manifest: Query) -> None:
+        """Make sure the layer above us holds this manifest (again).
+
+        If it doesn't, everything is refilled. If that can't be done in
+        time, the request fails with 503 instead of pretending that
+        nothing exists."""
+        if self.upstream.has(manifest):
+            return
+
+        lock = self.upstream.refill_lock()
+        wait_seconds = current_app.config.get(
+            "BEEVENUE_REFILL_WAIT_SECONDS", 30
+        )
+        if not lock.acquire(blocking_timeout=wait_seconds):
+            # The other worker might have just finished.
+            if self.upstream.has(manifest):
+                return
+
+            warning("Gave up waiting for another worker to refill the cache.")
+            raise ServiceUnavailable(
+                "The cache is being refilled. Try again later.",
+                retry_after=ceil(wait_seconds),
+            )
+
+        try:
+            # Maybe somebody else has already done it while we were waiting.
+            if not self.upstream.has(manifest):
+                info("Cache has been lost. Refilling it.")
+                self.refill()
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                warning("Refill took longer than its lock was held.")
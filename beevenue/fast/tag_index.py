@@ -0,0 +1,221 @@
+"""For each tag name, the sorted ids of all media with that tag.
+
+Searches for tags intersect (or subtract) these instead of looking at all
+media. Ids are kept as sorted uint32 arrays, so tags which only few media
+have take up just as little memory.
+"""
+
+from array import array
+from collections import defaultdict
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+)
+
+import numpy as np
+
+from beevenue.document_types import TinyMediumDocument
+
+from .types import CacheEntityKind, Query, SubCache
+
+# Which tag names of a medium each index is built from.
+INDEX_KINDS = (
+    CacheEntityKind.INNATE_TAG_INDEX,
+    CacheEntityKind.SEARCHABLE_TAG_INDEX,
+)
+
+# Sorted, unique medium ids.
+TaggedIds = np.ndarray
+
+TagIndex = Dict[CacheEntityKind, Dict[str, TaggedIds]]
+
+NO_IDS: TaggedIds = np.zeros(0, dtype=np.uint32)
+NO_IDS.setflags(write=False)
+
+
+def tag_names_for(
+    kind: CacheEntityKind, medium: TinyMediumDocument
+) -> FrozenSet[str]:
+    if kind == CacheEntityKind.INNATE_TAG_INDEX:
+        return medium.innate_tag_names
+    return medium.searchable_tag_names
+
+
+def manifest_query(kind: CacheEntityKind) -> Query:
+    """Query for the list of all tag names which have ids of this kind."""
+    return Query(CacheEntityKind.TAG_INDEX_MANIFEST, kind.value)
+
+
+def tagged_ids_from(medium_ids: Iterable[int]) -> TaggedIds:
+    """Sorted array of these ids (without duplicates)."""
+    return np.unique(np.fromiter(medium_ids, dtype=np.uint32))
+
+
+def build_tag_index(media: Iterable[TinyMediumDocument]) -> TagIndex:
+    """Build the ids of all tag names in all indices."""
+
+    # Compact arrays, since there might be lots of ids.
+    ids_by_name: Dict[CacheEntityKind, Dict[str, "array[int]"]] = {
+        kind: defaultdict(lambda: array("I")) for kind in INDEX_KINDS
+    }
+
+    for medium in media:
+        for kind in INDEX_KINDS:
+            for name in tag_names_for(kind, medium):
+                ids_by_name[kind][name].append(medium.medium_id)
+
+    return {
+        kind: {name: tagged_ids_from(ids) for name, ids in by_name.items()}
+        for kind, by_name in ids_by_name.items()
+    }
+
+
+def fill_tag_index(cache: SubCache, index: TagIndex) -> None:
+    """Replace all tagged ids in this cache."""
+
+    for kind, by_name in index.items():
+        old_names = set(cache.get(manifest_query(kind)) or [])
+
+        cache.set_many({Query(kind, n): ids for n, ids in by_name.items()})
+        cache.set(manifest_query(kind), sorted(by_name.keys()))
+
+        stale_names = old_names - by_name.keys()
+        if stale_names:
+            cache.delete(*[Query(kind, n) for n in stale_names])
+
+
+class TagIndexChange(NamedTuple):
+    """Ids to add to and to remove from the ids of a single tag."""
+
+    added: TaggedIds
+    removed: TaggedIds
+
+
+TagIndexChanges = Dict[CacheEntityKind, Dict[str, TagIndexChange]]
+
+
+def tag_index_changes(
+    old: Iterable[TinyMediumDocument],
+    new: Iterable[TinyMediumDocument],
+    forgotten_ids: Iterable[int] = (),
+    names_by_kind: Optional[Dict[CacheEntityKind, Iterable[str]]] = None,
+) -> TagIndexChanges:
+    """Which ids have to be added or removed to go from 'old' to 'new'?
+
+    The old state of the 'forgotten_ids' is unknown. Those media might
+    have had any tag, so they are removed from all tags listed in
+    'names_by_kind' (except for the tags they still have)."""
+
+    old_by_id = {m.medium_id: m for m in old}
+    new_by_id = {m.medium_id: m for m in new}
+    forgotten = frozenset(forgotten_ids)
+
+    result: TagIndexChanges = {}
+    for kind in INDEX_KINDS:
+        added: Dict[str, List[int]] = defaultdict(list)
+        removed: Dict[str, List[int]] = defaultdict(list)
+
+        all_names: FrozenSet[str] = frozenset()
+        if forgotten and names_by_kind is not None:
+            all_names = frozenset(names_by_kind.get(kind, ()))
+
+        for medium_id in old_by_id.keys() | new_by_id.keys() | forgotten:
+            new_names: FrozenSet[str] = frozenset()
+            if medium_id in new_by_id:
+                new_names = tag_names_for(kind, new_by_id[medium_id])
+
+            old_names: FrozenSet[str] = frozenset()
+            if medium_id in old_by_id:
+                old_names = tag_names_for(kind, old_by_id[medium_id])
+            elif medium_id in forgotten:
+                # Adding an id twice doesn't hurt, so assume it had none of
+                # its current tags, but all of the others.
+                old_names = all_names - new_names
+
+            for name in new_names - old_names:
+                added[name].append(medium_id)
+            for name in old_names - new_names:
+                removed[name].append(medium_id)
+
+        result[kind] = {
+            name: TagIndexChange(
+                tagged_ids_from(added.get(name, ())),
+                tagged_ids_from(removed.get(name, ())),
+            )
+            for name in added.keys() | removed.keys()
+        }
+
+    return result
+
+
+def update_tag_index(cache: SubCache, changes: TagIndexChanges) -> None:
+    """Apply these changes to the tagged ids in this cache."""
+
+    queries: List[Query] = []
+    for kind, changes_by_name in changes.items():
+        if changes_by_name:
+            queries.append(manifest_query(kind))
+            queries.extend(Query(kind, name) for name in changes_by_name)
+
+    if not queries:
+        return
+
+    # Read everything up front, so this only takes a single round trip.
+    current = cache.get_many(queries)
+
+    to_set: Dict[Query, Any] = {}
+    to_delete: List[Query] = []
+
+    for kind, changes_by_name in changes.items():
+        if not changes_by_name:
+            continue
+
+        # Caches might hold some tags' ids without holding the manifest.
+        # They can't add new tags, but must still update the others.
+        names: Optional[Set[str]] = None
+        manifest = current.get(manifest_query(kind), None)
+        if manifest is not None:
+            names = set(manifest)
+
+        for name, change in changes_by_name.items():
+            query = Query(kind, name)
+            ids = current.get(query, None)
+
+            if ids is None:
+                if (
+                    names is not None
+                    and name not in names
+                    and len(change.added)
+                ):
+                    # Brand-new tag, so no layer can know its ids yet.
+                    to_set[query] = change.added
+                    names.add(name)
+
+                # Otherwise, this cache doesn't hold the ids of this tag.
+                continue
+
+            ids = np.setdiff1d(
+                np.union1d(ids, change.added),
+                change.removed,
+                assume_unique=True,
+            ).astype(np.uint32, copy=False)
+            if len(ids):
+                to_set[query] = ids
+                continue
+
+            to_delete.append(query)
+            if names is not None:
+                names.discard(name)
+
+        if names is not None:
+            to_set[manifest_query(kind)] = sorted(names)
+
+    cache.set_many(to_set)
+    if to_delete:
+        cache.delete(*to_delete)
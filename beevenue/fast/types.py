@@ -1,9 +1,22 @@
 from abc import ABC, abstractmethod
 from beevenue.document_types import MediumDocument, TinyMediumDocument
-from contextlib import AbstractContextManager
+from contextlib import AbstractContextManager, nullcontext
 from dataclasses import dataclass, field
 from enum import Enum, unique
-from typing import Any, Dict, Generic, List, Optional, TypeVar
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+import numpy as np
+
+from .columnar import ColumnarSnapshot
 
 
 @unique
@@ -12,9 +25,13 @@ class CacheEntityKind(str, Enum):
 
     MEDIUM_DOCUMENT = "MD"
     MEDIUM_DOCUMENT_TINY = "MDT"
-    MEDIUM_DOCUMENT_TINY_ALL = "MDTA"
+    MEDIUM_DOCUMENT_TINY_MANIFEST = "MDTM"
+    MEDIUM_DOCUMENT_TINY_SHARD = "MDTS"
     RATING_BY_HASH = "RBH"
     SEARCHABLE_TAGS = "ST"
+    INNATE_TAG_INDEX = "ITI"
+    SEARCHABLE_TAG_INDEX = "STI"
+    TAG_INDEX_MANIFEST = "TIM"
 
 
 @dataclass(unsafe_hash=True)
@@ -29,6 +46,41 @@ class Query:
         self.hash = f"{self.kind}_{self.key}"
 
 
+def is_hit(value: Any) -> bool:
+    """Does this cached value count as found? Empty values don't.
+
+    Arrays (like tagged ids) can't be asked with bool() directly."""
+    if isinstance(value, np.ndarray):
+        return value.size > 0
+    return bool(value)
+
+
+@unique
+class ChangeKind(str, Enum):
+    """What a Command has changed."""
+
+    # Some media (and everything derived from them).
+    MEDIA = "M"
+    # Only the list of all searchable tag names.
+    SEARCHABLE_TAGS = "ST"
+    # Could be anything at all.
+    EVERYTHING = "ALL"
+
+
+@dataclass(frozen=True)
+class Change:
+    """Compact record of what a Command has changed."""
+
+    kind: ChangeKind
+    medium_ids: Tuple[int, ...] = ()
+
+    # Old and new hashes of these media (so, which ratings have changed).
+    hashes: Tuple[str, ...] = ()
+
+
+EVERYTHING_CHANGED = Change(ChangeKind.EVERYTHING)
+
+
 class SubCacheModificationContext(AbstractContextManager):
     """Context manager allowing modifying a value in a cache via GET+SET."""
 
@@ -41,7 +93,7 @@ class SubCacheModificationContext(AbstractContextManager):
         return self
 
     def __exit__(self, *_: Any, **__: Any) -> None:
-        if self.value:
+        if self.value is not None:
             self.cache.set(self.query, self.value)
 
 
@@ -74,6 +126,18 @@ class SubCache(ABC):
     def set_many(self, values: Dict[Query, Any]) -> None:
         """Fill cache with these entities."""
 
+    def bump_generation(self, change: Change) -> None:
+        """Signal that a Command has just changed the contents of this cache.
+
+        Most caches don't care, so this does nothing by default."""
+
+    def batch(self, atomic: bool = True) -> ContextManager[Any]:
+        """Group all writes made within this context.
+
+        Unless 'atomic', they may become visible one part at a time.
+        Caches which can save on round trips this way should override it."""
+        return nullcontext()
+
 
 TAgg = TypeVar("TAgg")
 
@@ -81,10 +145,22 @@ TAgg = TypeVar("TAgg")
 class Command(Generic[TAgg]):
     """Command to execute on each cache. Might get and/or set!"""
 
+    # Whether all writes of this command have to become visible at once.
+    # Commands which write lots of entities shouldn't block everybody else
+    # until they are done, so they write them as they go.
+    IS_ATOMIC = True
+
     def run(self, cache: SubCache, agg: Optional[TAgg]) -> Optional[TAgg]:
         if not agg:
             return self.start()
-        return self.next(cache, agg)
+        with cache.batch(self.IS_ATOMIC):
+            result = self.next(cache, agg)
+            cache.bump_generation(self.change(agg))
+        return result
+
+    def change(self, agg: TAgg) -> Change:
+        """What this command changes. Unless overridden, that's everything."""
+        return EVERYTHING_CHANGED
 
     @abstractmethod
     def start(self) -> TAgg:
@@ -98,7 +174,7 @@ class Command(Generic[TAgg]):
 class Cache:
     """Used for type hinting."""
 
-    def fill(self) -> None:
+    def fill(self, workers: int = 1) -> None:
         """Complete fill this cache."""
 
     def get_rating_by_hash(self, for_hash: str) -> str:
@@ -116,11 +192,25 @@ class Cache:
     def get_many_tiny(self, ids: List[int]) -> List[TinyMediumDocument]:
         """Self-explanatory."""
 
+    def get_many_cached_tiny(self, ids: List[int]) -> List[TinyMediumDocument]:
+        """Like get_many_tiny, but only what the caches currently know."""
+
     def get_tiny(self, medium_id: int) -> TinyMediumDocument:
         """Self-explanatory."""
 
     def get_all_tiny(self) -> List[TinyMediumDocument]:
         """Self-explanatory."""
 
+    def get_columnar(self) -> ColumnarSnapshot:
+        """Column-wise snapshot of get_all_tiny()."""
+
+    def get_tagged_ids(
+        self, kind: CacheEntityKind, tag_name: str
+    ) -> np.ndarray:
+        """Sorted ids of all media with this tag (in this index)."""
+
+    def get_tag_index_names(self, kind: CacheEntityKind) -> List[str]:
+        """Names of all tags which have ids in this index."""
+
     def run(self, *commands: Command) -> None:
         """Run the specified commands on this cache in sequence."""
@@ -2,6 +2,8 @@
 from typing import Optional
 from datetime import date
 
+from sqlalchemy import DDL, event
+
 from .db import db
 
 
@@ -143,3 +145,54 @@ class Medium(db.Model):
         self.mime_type = mime_type
         self.hash = medium_hash
         self.rating = "u"
+
+
+class TableVersion(db.Model):
+    """Counts all changes to the tables medium documents are built from.
+
+    It is kept up to date by triggers, so changes made outside of this
+    application are counted, too."""
+
+    __tablename__ = "tableVersion"
+    table_name = db.Column(db.String(length=256), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False)
+
+
+VERSIONED_TABLES = [
+    Medium.__tablename__,
+    Tag.__tablename__,
+    TagAlias.__tablename__,
+    TagImplication.__tablename__,
+    MediumTag.__tablename__,
+    MediumTagAbsence.__tablename__,
+]
+
+# Counting starts at some random point, so that a recreated database
+# doesn't end up at the same versions as the one before.
+_BUMP_TABLE_VERSION = """
+CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO "tableVersion" (table_name, version)
+  VALUES (TG_TABLE_NAME, floor(random() * 2^48)::bigint)
+  ON CONFLICT (table_name)
+  DO UPDATE SET version = "tableVersion".version + 1;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+_VERSION_TRIGGER = """
+DROP TRIGGER IF EXISTS bump_table_version ON "{0}";
+CREATE TRIGGER bump_table_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "{0}"
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version();
+"""
+
+event.listen(
+    db.metadata,
+    "after_create",
+    DDL(
+        _BUMP_TABLE_VERSION
+        + "".join(_VERSION_TRIGGER.format(t) for t in VERSIONED_TABLES)
+    ).execute_if(dialect="postgresql"),
+)
@@ -42,6 +42,10 @@ def medium_path(filename: str) -> str:
     return os.path.join(_base_dir(), "media", filename)
 
 
+def snapshot_path() -> str:
+    return os.path.join(_base_dir(), "cache.snapshot")
+
+
 def public_otp_path(secret: str) -> str:
     return os.path.join(_public_base(), "otp", secret)
 
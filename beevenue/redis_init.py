@@ -0,0 +1,56 @@
+from enum import IntEnum, unique
+from threading import Lock
+from typing import Any, Dict
+
+from redis import ConnectionPool, Redis
+
+
+@unique
+class RedisDatabase(IntEnum):
+    """Which (logical) Redis database is used for what."""
+
+    CACHE = 0
+    OTP = 1
+    TEMPORARY_THUMBNAILS = 2
+
+
+_SETTINGS: Dict[str, Any] = {
+    "host": "redis",
+    "port": 6379,
+    "max_connections": 50,
+}
+
+# One pool per database, shared by all threads of this process.
+# (redis-py notices forks by itself and starts over in the child.)
+_POOLS: Dict[RedisDatabase, ConnectionPool] = {}
+_POOLS_LOCK = Lock()
+
+
+def init_app(app: Any) -> None:
+    _SETTINGS.update(
+        host=app.config.get("BEEVENUE_REDIS_HOST", _SETTINGS["host"]),
+        port=app.config.get("BEEVENUE_REDIS_PORT", _SETTINGS["port"]),
+        max_connections=app.config.get(
+            "BEEVENUE_REDIS_MAX_CONNECTIONS", _SETTINGS["max_connections"]
+        ),
+    )
+
+    with _POOLS_LOCK:
+        for pool in _POOLS.values():
+            pool.disconnect()
+        _POOLS.clear()
+
+
+def redis_client(database: RedisDatabase) -> Redis:
+    """Get a client for this database, backed by a shared connection pool.
+
+    Clients are cheap, so there's no need to hold on to them."""
+    pool = _POOLS.get(database, None)
+    if pool is None:
+        with _POOLS_LOCK:
+            pool = _POOLS.get(database, None)
+            if pool is None:
+                pool = ConnectionPool(db=int(database), **_SETTINGS)
+                _POOLS[database] = pool
+
+    return Redis(connection_pool=pool)
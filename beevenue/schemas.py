@@ -1,10 +1,16 @@
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from flask import jsonify, Request
-from marshmallow import fields, Schema
+from marshmallow import (
+    fields,
+    Schema,
+    ValidationError,
+    validates_schema,
+)
 
 from beevenue.flask import request
 
+from .core.search.cursor import is_valid_cursor
 from .decorators import RequirementDecorator, requires
 
 
@@ -32,11 +38,25 @@ def _requires_schema(
     return requires(validator)
 
 
+def _validate_cursor(cursor: str) -> None:
+    if not is_valid_cursor(cursor):
+        raise ValidationError("Invalid cursor.")
+
+
 class PaginationQueryParamsSchema(Schema):
-    """Query parameters required for all paginated queries."""
+    """Query parameters required for all paginated queries.
 
-    pageNumber = fields.Int(required=True)
+    Pages are either picked by their number, or by the cursor returned with
+    the previous page (which is empty for the very first page)."""
+
+    pageNumber = fields.Int()
     pageSize = fields.Int(required=True)
+    cursor = fields.String(validate=_validate_cursor)
+
+    @validates_schema
+    def validate_page(self, data: Dict[str, Any], **_: Any) -> None:
+        if "pageNumber" not in data and "cursor" not in data:
+            raise ValidationError("Either pageNumber or cursor is required.")
 
 
 paginated = requires_query_params(PaginationQueryParamsSchema())
@@ -12,6 +12,9 @@ from .violations import Violation
 class RulePart(ABC):
     """Abstract base class for all rule parts (both iffs and thens)."""
 
+    def preload(self) -> None:
+        """Load everything this part needs before checking any medium."""
+
 
 class Iff(RulePart):
     """Abstract base class for all Iff rule parts."""
@@ -59,6 +62,9 @@ class TagsRulePart(RulePart):
 
         self._load_tag_names()
 
+    def preload(self) -> None:
+        self._ensure_tag_names_loaded()
+
 
 class IffAndThen(Iff, Then):
     """Only for type hinting"""
@@ -99,14 +105,14 @@ class HasAnyTagsLike(HasAnyTagsIffAndThen):
             raise Exception("You must configure at least one LIKE expression")
 
         self.regexes = regexes
+        self.compiled_regexes = [re.compile(f"^{r}$") for r in regexes]
 
     def _load_tag_names(self) -> None:
         tag_names = set()
 
         all_tag_names = set(g.fast.get_all_searchable_tag_names())
 
-        for regex in self.regexes:
-            compiled_regex = re.compile(f"^{regex}$")
+        for compiled_regex in self.compiled_regexes:
             for tag_name in all_tag_names:
                 if compiled_regex.match(tag_name):
                     tag_names.add(tag_name)
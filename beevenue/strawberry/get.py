@@ -1,3 +1,4 @@
+import hashlib
 import random
 from typing import Dict, Generator, List, Tuple, TypedDict, Union
 
@@ -17,6 +18,10 @@ from .rule import Rule
 
 
 def get_rules() -> List[Rule]:
+    """Get all current rules.
+
+    They are only decoded once per version of the rules file and cache
+    generation, since the tag names they resolve come from the cache."""
     with start_span(op="http", description="Loading current rules"):
         rules_file_path = current_app.config["BEEVENUE_RULES_FILE"]
         with open(rules_file_path, "r") as rules_file:
@@ -24,7 +29,13 @@ def get_rules() -> List[Rule]:
 
         rules_file_json = rules_file_json or "[]"
 
-        return decode_rules_json(rules_file_json)
+        version = hashlib.md5(rules_file_json.encode("utf-8")).hexdigest()
+        rules: List[Rule] = g.fast.derive(
+            f"RULES {version}", lambda: decode_rules_json(rules_file_json)
+        )
+
+        # Shared by all requests of this process, so hand out a copy.
+        return list(rules)
 
 
 def get_violations(medium_id: int) -> ViolationsViewModel:
@@ -76,7 +87,8 @@ MediaGenerator = Generator[GeneratorResult, None, None]
 
 
 def _nsfw_generator() -> MediaGenerator:
-    all_media = g.fast.get_all_tiny()
+    # Cached documents are shared between requests, so shuffle a copy.
+    all_media = list(g.fast.get_all_tiny())
     random.shuffle(all_media)
     for medium in all_media:
         yield medium, True
@@ -28,6 +28,11 @@ class Rule:
             for violation in then.violations_for(medium):
                 yield violation
 
+    def preload(self) -> None:
+        """Load everything this rule needs before checking any medium."""
+        for part in [*self.iffs, *self.thens]:
+            part.preload()
+
     def is_violated_by(self, medium: TinyMediumDocument) -> bool:
         """Check if that medium violates this rule."""
         return bool(next(self.violations_for(medium), None))
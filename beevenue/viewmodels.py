@@ -68,6 +68,7 @@ class _PaginationSchema(Schema):
     page_count = fields.Int(data_key="pageCount")
     page_number = fields.Int(data_key="pageNumber")
     page_size = fields.Int(data_key="pageSize")
+    next_cursor = fields.String(data_key="nextCursor")
 
 
 class _TagShowSchema(Schema):
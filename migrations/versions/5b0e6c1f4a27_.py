@@ -0,0 +1,62 @@
+"""Count changes to the tables medium documents are built from.
+
+Revision ID: 5b0e6c1f4a27
+Revises: 38a2d1ad418f
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "5b0e6c1f4a27"
+down_revision = "38a2d1ad418f"
+branch_labels = None
+depends_on = None
+
+_TABLES = [
+    "medium",
+    "tag",
+    "tagAlias",
+    "tagImplication",
+    "medium_tag",
+    "mediumTagAbsence",
+]
+
+
+def upgrade():
+    op.create_table(
+        "tableVersion",
+        sa.Column("table_name", sa.String(length=256), nullable=False),
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("table_name"),
+    )
+    op.execute(
+        """
+CREATE FUNCTION bump_table_version() RETURNS trigger AS $$
+BEGIN
+  INSERT INTO "tableVersion" (table_name, version)
+  VALUES (TG_TABLE_NAME, floor(random() * 2^48)::bigint)
+  ON CONFLICT (table_name)
+  DO UPDATE SET version = "tableVersion".version + 1;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+    )
+    for table_name in _TABLES:
+        op.execute(
+            f"""
+CREATE TRIGGER bump_table_version
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON "{table_name}"
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_table_version()
+"""
+        )
+
+
+def downgrade():
+    for table_name in _TABLES:
+        op.execute(f'DROP TRIGGER bump_table_version ON "{table_name}"')
+    op.execute("DROP FUNCTION bump_table_version()")
+    op.drop_table("tableVersion")
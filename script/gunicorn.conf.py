@@ -0,0 +1,17 @@
+"""Configuration of gunicorn in production.
+
+The application is loaded (and its caches filled) once in the master
+process, before any workers are forked. That way, the very first requests
+are just as fast as all later ones.
+"""
+
+from typing import Any
+
+preload_app = True
+
+
+def when_ready(server: Any) -> None:
+    # pylint: disable=import-outside-toplevel
+    from beevenue.fast.init import preload
+
+    preload(server.app.wsgi())
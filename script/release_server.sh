@@ -11,5 +11,6 @@ BEEVENUE_CONFIG_FILE=./beevenue_config.py celery -A main.celery worker &
 
 # Some requests may run longer than the default timout of 30s
 BEEVENUE_CONFIG_FILE=./beevenue_config.py \
-    gunicorn --workers 5 --timeout 600 -b 0.0.0.0:7000 \
+    gunicorn --config ./script/gunicorn.conf.py \
+    --workers 5 --timeout 600 -b 0.0.0.0:7000 \
     "$@" main:app
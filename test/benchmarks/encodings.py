@@ -0,0 +1,67 @@
+"""Compare the encodings available for storing capnp messages in Redis.
+
+Run from the repository root with:
+
+    PYTHONPATH=. python test/benchmarks/encodings.py
+
+Prints the encoded size and decoding time of a full medium document and
+of a shard of tiny medium documents, for every available encoding.
+"""
+
+import random
+import time
+
+from beevenue.documents import TinyIndexedMedium
+from beevenue.fast.application.dictionary import FixedTagDictionary
+from beevenue.fast.application.schemas import (
+    EncodedSchema,
+    Encoding,
+    FullMediumDocumentSchema,
+    TinyShardSchema,
+)
+from beevenue.fast.shards import SHARD_SIZE
+
+# Found next to this script.
+from random_media import random_medium, random_tag_names
+
+REPETITIONS = 20
+
+
+def _measure(schema, obj):
+    raw_bytes = schema.serialize(obj)
+
+    tic = time.perf_counter()
+    for _ in range(REPETITIONS):
+        schema.deserialize(raw_bytes)
+    toc = time.perf_counter()
+
+    return len(raw_bytes), (toc - tic) / REPETITIONS * 1000
+
+
+def _run(name, schema, obj):
+    print(f"\n{name}")
+    print(f"{'encoding':<14}{'bytes':>12}{'decode ms':>12}")
+    for encoding in Encoding:
+        try:
+            size, milliseconds = _measure(EncodedSchema(schema, encoding), obj)
+        except ImportError:
+            print(f"{encoding.name:<14}{'(not installed)':>24}")
+            continue
+        print(f"{encoding.name:<14}{size:>12}{milliseconds:>12.3f}")
+
+
+def main():
+    random.seed(0)
+    tag_names = random_tag_names()
+    media = [random_medium(i, tag_names) for i in range(SHARD_SIZE)]
+
+    _run("Medium document", FullMediumDocumentSchema(), media[0])
+    _run(
+        f"Shard of {SHARD_SIZE} tiny medium documents",
+        TinyShardSchema(FixedTagDictionary()),
+        [TinyIndexedMedium.from_full(m) for m in media],
+    )
+
+
+if __name__ == "__main__":
+    main()
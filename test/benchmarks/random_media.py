@@ -0,0 +1,35 @@
+"""Random media shared by all benchmarks."""
+
+from datetime import date
+import os
+import random
+
+from beevenue.documents import IndexedMedium
+
+TAG_COUNT = 5000
+TAGS_PER_MEDIUM = 25
+# Tiny thumbnails are JPEGs, so they hardly compress at all.
+TINY_THUMBNAIL_SIZE = 700
+
+
+def random_tag_names():
+    return [f"tag{i}" for i in range(TAG_COUNT)]
+
+
+def random_medium(medium_id, tag_names):
+    innate = frozenset(random.sample(tag_names, TAGS_PER_MEDIUM))
+    implied = frozenset(random.sample(tag_names, TAGS_PER_MEDIUM // 5))
+    return IndexedMedium(
+        medium_id,
+        "%032x" % random.getrandbits(128),
+        "image/jpeg",
+        random.choice("sqe"),
+        random.randint(100, 4000),
+        random.randint(100, 4000),
+        random.randint(10_000, 10_000_000),
+        date.fromordinal(random.randint(737000, 738000)),
+        os.urandom(TINY_THUMBNAIL_SIZE),
+        innate,
+        innate | implied,
+        frozenset(random.sample(tag_names, 2)),
+    )
@@ -0,0 +1,128 @@
+"""Compare the throughput of all cache backends.
+
+Run from the repository root with:
+
+    PYTHONPATH=. python test/benchmarks/serializers.py [SIZE ...]
+
+For every backend, and every collection size (10k, 100k and 1M media by
+default), this serializes and deserializes all media as full documents,
+as tiny documents and as shards of tiny documents. Deserializing includes
+reading every field, since some schemas only decode fields on access.
+"""
+
+import itertools
+import random
+import sys
+import time
+
+from beevenue.documents import TinyIndexedMedium
+from beevenue.fast.application.backends import BACKENDS
+from beevenue.fast.application.dictionary import FixedTagDictionary
+from beevenue.fast.shards import SHARD_SIZE
+from beevenue.fast.types import CacheEntityKind
+
+# Found next to this script.
+from random_media import random_medium, random_tag_names
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+# Distinct media generated. Larger collections reuse them over and over,
+# so memory stays bounded.
+POOL_SIZE = 10_000
+
+FIELDS = [
+    "medium_id",
+    "medium_hash",
+    "rating",
+    "width",
+    "height",
+    "filesize",
+    "insert_date",
+    "innate_tag_names",
+    "searchable_tag_names",
+    "absent_tag_names",
+]
+
+
+def _touch(document):
+    for field in FIELDS:
+        getattr(document, field)
+
+
+def _measure(schema, objects, count_per_object):
+    serialize_seconds = 0.0
+    deserialize_seconds = 0.0
+    size = 0
+    for obj in objects:
+        tic = time.perf_counter()
+        raw_bytes = schema.serialize(obj)
+        toc = time.perf_counter()
+        result = schema.deserialize(raw_bytes)
+        for document in result if isinstance(result, list) else [result]:
+            _touch(document)
+        tac = time.perf_counter()
+
+        serialize_seconds += toc - tic
+        deserialize_seconds += tac - toc
+        size += len(raw_bytes)
+
+    count = len(objects) * count_per_object
+    return size, count / serialize_seconds, count / deserialize_seconds
+
+
+def _run(media, tinies, size):
+    print(f"\n{size} media")
+    print(
+        f"{'backend':<10}{'kind':<6}{'MB':>10}"
+        f"{'serialized/s':>16}{'deserialized/s':>16}"
+    )
+
+    shard_count = max(size // SHARD_SIZE, 1)
+    shards = [
+        tinies[i : i + SHARD_SIZE] for i in range(0, len(tinies), SHARD_SIZE)
+    ]
+    # Kind, objects to cycle through, how many of them, and how many
+    # media each of them holds.
+    workloads = [
+        (CacheEntityKind.MEDIUM_DOCUMENT, media, size, 1),
+        (CacheEntityKind.MEDIUM_DOCUMENT_TINY, tinies, size, 1),
+        (
+            CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD,
+            shards,
+            shard_count,
+            SHARD_SIZE,
+        ),
+    ]
+
+    for backend, bind in BACKENDS.items():
+        try:
+            schemas = bind(FixedTagDictionary())
+        except ImportError:
+            print(f"{backend:<10}(not installed)")
+            continue
+
+        for kind, pool, count, per_object in workloads:
+            objects = list(itertools.islice(itertools.cycle(pool), count))
+            total, serialized, deserialized = _measure(
+                schemas[kind], objects, per_object
+            )
+            print(
+                f"{backend:<10}{kind.value:<6}{total / 1e6:>10.1f}"
+                f"{serialized:>16.0f}{deserialized:>16.0f}"
+            )
+
+
+def main():
+    sizes = [int(s) for s in sys.argv[1:]] or DEFAULT_SIZES
+
+    random.seed(0)
+    tag_names = random_tag_names()
+    media = [random_medium(i, tag_names) for i in range(POOL_SIZE)]
+    tinies = [TinyIndexedMedium.from_full(m) for m in media]
+
+    for size in sizes:
+        _run(media, tinies, size)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+from datetime import date
 import json
 import logging
 import os
@@ -9,6 +10,7 @@ import pytest
 from sqlalchemy.sql.expression import text
 
 from beevenue.beevenue import get_application
+from beevenue.documents import TinyIndexedMedium
 
 
 def _resource(fname):
@@ -176,3 +178,33 @@ def withRules(client, path):
 
     res = client.post("/rules", json=json.loads(contents))
     assert res.status_code == 200
+
+
+def _tiny_medium(
+    medium_id,
+    *,
+    rating="s",
+    tag_names=(),
+    width=1,
+    height=1,
+    filesize=1,
+):
+    tag_names = frozenset(tag_names)
+    return TinyIndexedMedium(
+        medium_id,
+        f"{medium_id:032x}",
+        rating,
+        width,
+        height,
+        filesize,
+        date(2020, 1, 1),
+        tag_names,
+        tag_names,
+        frozenset(),
+    )
+
+
+@pytest.fixture
+def tiny_medium():
+    """Build tiny medium documents without any database."""
+    return _tiny_medium
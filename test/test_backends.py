@@ -0,0 +1,45 @@
+import pytest
+
+from beevenue.fast.application import backends, schemas, struct_schemas
+from beevenue.fast.application.dictionary import FixedTagDictionary
+from beevenue.fast.types import CacheEntityKind
+
+
+def test_documents_of_other_backends_are_cache_misses(tiny_medium):
+    tiny = tiny_medium(1, tag_names=["foo"])
+    tags = FixedTagDictionary()
+    capnp_schemas = schemas.bind_schemas(tags)
+    struct_schemas_ = struct_schemas.bind_schemas(tags)
+
+    for kind, obj in (
+        (CacheEntityKind.MEDIUM_DOCUMENT_TINY, tiny),
+        (CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD, [tiny]),
+    ):
+        capnp_bytes = capnp_schemas[kind].serialize(obj)
+        struct_bytes = struct_schemas_[kind].serialize(obj)
+
+        assert struct_schemas_[kind].deserialize(struct_bytes) == obj
+        assert struct_schemas_[kind].deserialize(capnp_bytes) is None
+        assert capnp_schemas[kind].deserialize(struct_bytes) is None
+
+
+def test_unknown_encodings_are_cache_misses():
+    schema = schemas.SCHEMAS[CacheEntityKind.MEDIUM_DOCUMENT_TINY]
+
+    assert schema.deserialize(b"\xffgarbage") is None
+    assert schema.deserialize(b"") is None
+
+
+def test_encodings_without_their_module_fail_the_check(monkeypatch):
+    def _missing():
+        raise ModuleNotFoundError("No module", name="zstandard")
+
+    kind = CacheEntityKind.MEDIUM_DOCUMENT
+    monkeypatch.setitem(schemas.ENCODINGS, kind, schemas.Encoding.PACKED_ZSTD)
+    monkeypatch.setitem(
+        schemas._CODEC_FACTORIES, schemas.Encoding.PACKED_ZSTD, _missing
+    )
+    monkeypatch.setattr(schemas, "_CODECS", {})
+
+    with pytest.raises(ImportError, match="zstandard"):
+        backends.check_backend("capnp")
@@ -1,3 +1,6 @@
+import os
+
+
 def test_cli_cannot_upload_txt(client):
     runner = client.app_under_test.test_cli_runner()
     result = runner.invoke(args=["import", "test/resources/text_file.txt"])
@@ -10,3 +13,51 @@ def test_cli_can_warmup(client):
     result = runner.invoke(args=["warmup"])
     assert result.exit_code == 0
     assert result.exception is None
+
+
+def _as_tuple(medium):
+    from beevenue.document_types import MediumDocument
+
+    return tuple(getattr(medium, name) for name in MediumDocument.__slots__)
+
+
+def test_cli_can_warmup_in_parallel(client, monkeypatch):
+    from beevenue.fast import commands
+    from beevenue.fast.load import full_load
+    from beevenue.fast.parallel_load import parallel_full_load
+    from beevenue.paths import snapshot_path
+
+    # Otherwise, media would just be read from the snapshot.
+    with client.app_under_test.app_context():
+        path = snapshot_path()
+    if os.path.exists(path):
+        os.remove(path)
+
+    loaded = []
+
+    def _parallel_full_load(workers):
+        for medium in parallel_full_load(workers):
+            loaded.append(medium)
+            yield medium
+
+    monkeypatch.setattr(commands, "parallel_full_load", _parallel_full_load)
+
+    runner = client.app_under_test.test_cli_runner()
+    result = runner.invoke(args=["warmup", "--workers", "2"])
+    assert result.exit_code == 0
+    assert result.exception is None
+
+    with client.app_under_test.app_context():
+        expected = list(full_load())
+
+    assert len(loaded) > 0
+    assert [_as_tuple(m) for m in loaded] == [_as_tuple(m) for m in expected]
+
+
+def test_partitions_cover_all_ids_in_order():
+    from beevenue.fast.parallel_load import partitions
+
+    assert partitions([], 3) == []
+    assert partitions([1, 2], 3) == [(1, 2)]
+    assert partitions([1, 2, 5, 8, 9, 13, 21], 3) == [(1, 5), (8, 13), (21, 21)]
+    assert partitions([1, 2, 5, 8, 9, 13], 3) == [(1, 5), (8, 13)]
@@ -30,3 +30,17 @@ def test_can_list_all_media_as_nsfw_admin(client, asAdmin, nsfw):
     assert "pageCount" in json_result
     assert "pageNumber" in json_result
     assert "pageSize" in json_result
+
+
+def test_can_list_media_by_cursor(client, asAdmin, nsfw):
+    res = client.get("/media?cursor=&pageSize=10", follow_redirects=True)
+    assert res.status_code == 200
+    json_result = res.get_json()
+    assert len(json_result["items"]) == 10
+    assert json_result["nextCursor"]
+
+    cursor = json_result["nextCursor"]
+    res = client.get(f"/media?cursor={cursor}&pageSize=10")
+    assert res.status_code == 200
+    next_ids = {item["id"] for item in res.get_json()["items"]}
+    assert not next_ids & {item["id"] for item in json_result["items"]}
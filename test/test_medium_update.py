@@ -164,3 +164,38 @@ def test_cant_have_tag_present_and_implied_tag_absent(client, asAdmin):
     res = client.get("/medium/13")
     new_model = res.get_json()
     assert "u:peter.pan" not in new_model["absentTags"]
+
+
+def test_updated_tags_are_searchable_right_away(client, asAdmin, nsfw):
+    # Warm up all caches first, so they have something to invalidate.
+    res = client.get("/search?q=A&pageNumber=1&pageSize=10")
+    assert res.status_code == 200
+
+    res = client.patch(
+        "/medium/3/metadata",
+        json={"rating": "e", "tags": ["freshly_added_tag"], "absentTags": []},
+    )
+    assert res.status_code == 200
+
+    res = client.get("/search?q=freshly_added_tag&pageNumber=1&pageSize=10")
+    assert res.status_code == 200
+    assert [i["id"] for i in res.get_json()["items"]] == [3]
+
+
+def test_updated_tags_are_searchable_by_indirect_implications(
+    client, asAdmin, nsfw
+):
+    res = client.patch("/tag/A/implications/B")
+    assert res.status_code == 200
+    res = client.patch("/tag/B/implications/C")
+    assert res.status_code == 200
+
+    res = client.patch(
+        "/medium/3/metadata",
+        json={"rating": "e", "tags": ["A"], "absentTags": []},
+    )
+    assert res.status_code == 200
+
+    res = client.get("/search?q=C&pageNumber=1&pageSize=10")
+    assert res.status_code == 200
+    assert 3 in [i["id"] for i in res.get_json()["items"]]
@@ -213,3 +213,141 @@ def test_search_spammy_filter_tests(client, asUser, filterAndExpectedCount):
     print(result)
 
     assert len(result["items"]) == expectedCount
+
+
+def test_search_survives_cache_loss(client, asUser):
+    from beevenue.redis_init import RedisDatabase, redis_client
+
+    redis_client(RedisDatabase.CACHE).flushdb()
+
+    res = _when_searching(client, "filesize<2m", page_size=20)
+    assert res.status_code == 200
+    assert len(res.get_json()["items"]) == 14
+
+
+def test_search_results_are_fresh_after_medium_update(client, asAdmin, nsfw):
+    res = _when_searching(client, "some_new_tag")
+    assert res.status_code == 200
+    assert res.get_json()["items"] == []
+
+    res = client.patch(
+        "/medium/3/metadata",
+        json={"rating": "q", "tags": ["some_new_tag"], "absentTags": []},
+    )
+    assert res.status_code == 200
+
+    res = _when_searching(client, "some_new_tag")
+    assert res.status_code == 200
+    assert [item["id"] for item in res.get_json()["items"]] == [3]
+
+
+def _forget(kind, key):
+    from beevenue.fast import process
+    from beevenue.fast.types import Query
+    from beevenue.redis_init import RedisDatabase, redis_client
+
+    query = Query(kind, key)
+    redis_client(RedisDatabase.CACHE).delete(query.hash)
+    process._STORE.values.pop(query.hash, None)
+    process._STORE.derived.values.clear()
+
+
+def _forget_tiny(medium_id):
+    from beevenue.fast.types import CacheEntityKind
+
+    _forget(CacheEntityKind.MEDIUM_DOCUMENT_TINY, medium_id)
+
+
+def test_search_forgets_removed_tag_of_evicted_medium(client, asAdmin, nsfw):
+    res = client.patch(
+        "/medium/3/metadata",
+        json={"rating": "q", "tags": ["some_new_tag"], "absentTags": []},
+    )
+    assert res.status_code == 200
+
+    # Nobody remembers which tags medium 3 had before.
+    _forget_tiny(3)
+
+    res = client.patch(
+        "/medium/3/metadata",
+        json={"rating": "q", "tags": ["other_new_tag"], "absentTags": []},
+    )
+    assert res.status_code == 200
+
+    res = _when_searching(client, "some_new_tag")
+    assert res.status_code == 200
+    assert res.get_json()["items"] == []
+
+    res = _when_searching(client, "-some_new_tag", page_size=100)
+    assert res.status_code == 200
+    assert 3 in [item["id"] for item in res.get_json()["items"]]
+
+
+def test_search_restores_evicted_shard_and_tag_ids(client, asAdmin, nsfw):
+    from beevenue.fast.types import CacheEntityKind
+
+    res = client.patch(
+        "/medium/3/metadata",
+        json={"rating": "q", "tags": ["evicted_tag"], "absentTags": []},
+    )
+    assert res.status_code == 200
+
+    res = _when_searching(client, "tags>=0", page_size=100)
+    all_ids = [item["id"] for item in res.get_json()["items"]]
+    assert 3 in all_ids
+
+    # Redis evicted some keys (e.g. under memory pressure).
+    _forget(CacheEntityKind.MEDIUM_DOCUMENT_TINY_SHARD, 0)
+    _forget(CacheEntityKind.INNATE_TAG_INDEX, "evicted_tag")
+    _forget(CacheEntityKind.SEARCHABLE_TAG_INDEX, "evicted_tag")
+
+    res = _when_searching(client, "tags>=0", page_size=100)
+    assert res.status_code == 200
+    assert [item["id"] for item in res.get_json()["items"]] == all_ids
+
+    res = _when_searching(client, "evicted_tag")
+    assert res.status_code == 200
+    assert [item["id"] for item in res.get_json()["items"]] == [3]
+
+
+def test_paging_by_cursor_finds_same_media_as_by_number(client, asAdmin, nsfw):
+    res = _when_searching(client, "sort:filesize_asc")
+    assert res.status_code == 200
+    page_count = res.get_json()["pageCount"]
+
+    by_number = []
+    for page_number in range(1, page_count + 1):
+        res = _when_searching(client, "sort:filesize_asc", page_number)
+        by_number += [item["id"] for item in res.get_json()["items"]]
+
+    by_cursor = []
+    cursor = ""
+    while cursor is not None:
+        q = parse.urlencode(
+            {"q": "sort:filesize_asc", "cursor": cursor, "pageSize": 10}
+        )
+        res = client.get(f"/search?{q}")
+        assert res.status_code == 200
+        by_cursor += [item["id"] for item in res.get_json()["items"]]
+        cursor = res.get_json()["nextCursor"]
+
+    assert by_cursor == by_number
+
+
+def test_cannot_page_by_cursor_of_other_sort_order(client, asAdmin, nsfw):
+    q = parse.urlencode(
+        {"q": "sort:filesize_asc", "pageSize": 10, "cursor": ""}
+    )
+    cursor = client.get(f"/search?{q}").get_json()["nextCursor"]
+    assert cursor is not None
+
+    for sort in ("sort:filesize_desc", "sort:width_asc"):
+        q = parse.urlencode({"q": sort, "cursor": cursor, "pageSize": 10})
+        res = client.get(f"/search?{q}")
+        assert res.status_code == 400
+
+
+def test_cannot_search_with_invalid_cursor(client, asUser):
+    q = parse.urlencode({"q": "A", "cursor": "foo", "pageSize": 10})
+    res = client.get(f"/search?{q}")
+    assert res.status_code == 400
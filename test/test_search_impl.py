@@ -1,5 +1,19 @@
+import numpy as np
+
 from beevenue.core.search.base import FilteringSearchTerm
-from beevenue.core.search.filtering.simple import PositiveSearchTerm
+from beevenue.core.search.filtering.complex import CategorySearchTerm
+from beevenue.core.search.filtering.simple import (
+    PositiveSearchTerm,
+    RatingSearchTerm,
+)
+from beevenue.core.search.planner import SearchPlan
+from beevenue.core.search.cursor import decode_cursor, encode_cursor
+from beevenue.core.search.sorting.simple import (
+    FilesizeSortingSearchTerm,
+    RotationSortingSearchTerm,
+)
+from beevenue.fast.columnar import ColumnarSnapshot
+from beevenue.fast.ratings import RatingIndex
 
 
 def test_terms_are_compared_by_value():
@@ -12,3 +26,92 @@ def test_terms_are_compared_by_value():
     are_equal = x == y
     assert are_equal
     assert hash(x) == hash(y)
+
+
+def test_search_plan_orders_terms_by_selectivity_and_cost(tiny_medium):
+    snapshot = ColumnarSnapshot(
+        [
+            tiny_medium(1, tag_names=["common", "rare"]),
+            tiny_medium(2, tag_names=["common"]),
+        ]
+    )
+    category = CategorySearchTerm("c", "=", "1")
+    rating = RatingSearchTerm("s")
+
+    plan = SearchPlan(
+        snapshot,
+        [
+            category,
+            PositiveSearchTerm("common"),
+            rating,
+            PositiveSearchTerm("rare"),
+        ],
+    )
+
+    assert [name for _, name in plan.included_tags] == ["rare", "common"]
+    assert plan.terms == [rating, category]
+
+
+def test_most_common_tags_come_first(tiny_medium):
+    snapshot = ColumnarSnapshot(
+        [
+            tiny_medium(1, tag_names=["a", "b", "c"]),
+            tiny_medium(2, tag_names=["b", "c"]),
+            tiny_medium(3, tag_names=["c"]),
+        ]
+    )
+
+    assert snapshot.most_common_tags(snapshot.innate, 2) == ["c", "b"]
+    assert snapshot.most_common_tags(snapshot.absent, 2) == []
+
+
+def test_sorting_pages_match_full_sort(tiny_medium):
+    snapshot = ColumnarSnapshot(
+        [tiny_medium(i, filesize=i % 4) for i in range(1, 30)]
+    )
+    rows = np.arange(len(snapshot))
+    sorter = FilesizeSortingSearchTerm(is_descending=True)
+
+    everything = sorter.window(snapshot, rows, 0, len(rows))
+    pages = [
+        sorter.window(snapshot, rows, start, start + 10)
+        for start in range(0, len(rows), 10)
+    ]
+
+    assert np.array_equal(np.concatenate(pages), everything)
+    assert list(snapshot.filesizes[everything]) == sorted(
+        snapshot.filesizes, reverse=True
+    )
+
+
+def test_media_without_extent_can_be_sorted_by_rotation(tiny_medium):
+    snapshot = ColumnarSnapshot(
+        [
+            tiny_medium(1, width=2, height=1),
+            tiny_medium(2, width=0, height=0),
+            tiny_medium(3, width=0, height=5),
+            tiny_medium(4, width=1, height=2),
+        ]
+    )
+    rows = np.arange(len(snapshot))
+    sorter = RotationSortingSearchTerm(False, rotation="portrait")
+
+    window = sorter.window(snapshot, rows, 0, 2)
+    assert list(snapshot.ids[window]) == [2, 1]
+
+    position = sorter.position(snapshot, int(window[-1]))
+    cursor = decode_cursor(encode_cursor(sorter.order_key(), position))
+    assert cursor == (("portrait", "asc"), position)
+    page = sorter.page_after(snapshot, rows, position, 10)
+    assert list(snapshot.ids[page]) == [4, 3]
+
+
+def test_unknown_ratings_are_tolerated(tiny_medium):
+    media = [tiny_medium(1, rating="q"), tiny_medium(2, rating="x")]
+    snapshot = ColumnarSnapshot(media)
+    index = RatingIndex(media)
+
+    assert list(snapshot.ids[snapshot.rating_mask("u")]) == [2]
+    assert index.get(media[0].medium_hash) == "q"
+    # Left to slower lookups, which know the actual rating.
+    assert index.get(media[1].medium_hash) is None
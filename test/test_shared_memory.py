@@ -0,0 +1,104 @@
+import os
+from types import SimpleNamespace
+
+from beevenue.fast import shared
+from beevenue.fast.application.schemas import TinyShardSchema
+from beevenue.fast.shared import SHARED_KINDS, SharedMemoryCache
+from beevenue.fast.shards import MANIFEST_QUERY, shard_query
+
+# Far beyond any generation a real cache would be at.
+_GENERATION = 2**62
+
+
+def _cache(generation):
+    upstream = SimpleNamespace(generation=lambda: generation)
+    return SharedMemoryCache(upstream)
+
+
+def _fill(cache, tiny_medium):
+    cache.set_many(
+        {
+            MANIFEST_QUERY: [0],
+            shard_query(0): [tiny_medium(1), tiny_medium(2)],
+        }
+    )
+
+
+def test_full_shared_memory_is_only_tried_once(monkeypatch, tiny_medium):
+    attempts = []
+
+    def _full(name, create=False, size=0):
+        if not create:
+            raise FileNotFoundError(name)
+        attempts.append(name)
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(shared.shared_memory, "SharedMemory", _full)
+
+    cache = _cache(_GENERATION)
+    _fill(cache, tiny_medium)
+    assert len(attempts) == 1
+    assert shared.has_failed(_GENERATION)
+
+    # Now, the layers above have to hold the shards instead.
+    assert cache.held_kinds() == frozenset()
+
+    cache = _cache(_GENERATION)
+    _fill(cache, tiny_medium)
+    assert len(attempts) == 1
+
+    # The next generation gets another chance.
+    assert _cache(_GENERATION + 1).held_kinds() == SHARED_KINDS
+
+
+def test_existing_segment_is_not_packed_again(
+    monkeypatch, tmp_path, tiny_medium
+):
+    generation = _GENERATION + 2
+    (tmp_path / f"beevenue_tiny_{generation}").write_bytes(b"")
+    monkeypatch.setattr(shared, "_SEGMENT_FOLDER", str(tmp_path))
+
+    packed = []
+    monkeypatch.setattr(shared, "_pack", lambda *args: packed.append(args))
+
+    _fill(_cache(generation), tiny_medium)
+    assert packed == []
+    assert not shared.has_failed(generation)
+
+
+def test_other_workers_decode_no_documents(monkeypatch, tiny_medium):
+    generation = _GENERATION + 4
+    shards = {
+        0: [
+            tiny_medium(1, tag_names=["foo"]),
+            tiny_medium(2, rating="q", tag_names=["foo", "bar"], filesize=2),
+        ],
+        1: [tiny_medium(1001, rating="e", tag_names=["bar"], filesize=1001)],
+    }
+    shared._publish(generation, shards)
+
+    try:
+        # Pretend to be some other worker, which can't decode anything.
+        def _no_decoding(*_):
+            raise AssertionError("Decoded a shard.")
+
+        monkeypatch.setattr(TinyShardSchema, "deserialize", _no_decoding)
+
+        cache = _cache(generation)
+        snapshot = cache.columnar()
+        ratings = cache.rating_index()
+
+        assert snapshot.ids.tolist() == [1, 2, 1001]
+        assert snapshot.filesizes.tolist() == [1, 2, 1001]
+        assert snapshot.tag_count(snapshot.innate, "bar") == 2
+        assert snapshot.tag_count(snapshot.searchable, "foo") == 2
+        assert snapshot.rating_counts().tolist() == [1, 1, 1, 0]
+        assert ratings.get(f"{1001:032x}") == "e"
+
+        # Only reading the media themselves decodes their shard.
+        monkeypatch.undo()
+        assert snapshot.media[2].medium_id == 1001
+    finally:
+        os.unlink(
+            os.path.join(shared._SEGMENT_FOLDER, f"beevenue_tiny_{generation}")
+        )
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from beevenue.fast import snapshot
+
+
+def _failing_media():
+    raise RuntimeError("Loading failed")
+    yield
+
+
+def test_failed_snapshot_leaves_no_temporary_file(monkeypatch, tmp_path):
+    path = tmp_path / "cache.snapshot"
+    monkeypatch.setattr(snapshot, "snapshot_path", lambda: str(path))
+
+    with pytest.raises(RuntimeError):
+        snapshot.write_snapshot(_failing_media(), "0" * 32)
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_empty_snapshot_can_be_read_back(monkeypatch, tmp_path):
+    path = tmp_path / "cache.snapshot"
+    monkeypatch.setattr(snapshot, "snapshot_path", lambda: str(path))
+
+    snapshot.write_snapshot([], "0" * 32)
+
+    assert os.listdir(tmp_path) == ["cache.snapshot"]
+    assert list(snapshot.load_snapshot("0" * 32)) == []
+    assert snapshot.load_snapshot("1" * 32) is None
+
+
+class _TextSchema:
+    """Stores numbers as text, running out of space at 'last' (if given)."""
+
+    def __init__(self, last=None):
+        self.last = last
+
+    def serialize(self, number):
+        if number == self.last:
+            raise OSError("No space left on device")
+        return str(number).encode("ascii")
+
+    @staticmethod
+    def deserialize(raw_bytes):
+        return int(bytes(raw_bytes))
+
+
+def test_failed_snapshot_returns_all_media(monkeypatch, tmp_path):
+    path = tmp_path / "cache.snapshot"
+    monkeypatch.setattr(snapshot, "snapshot_path", lambda: str(path))
+    monkeypatch.setattr(snapshot, "_SCHEMA", _TextSchema(last=5))
+    monkeypatch.setattr(snapshot, "_FLUSH_INTERVAL", 2)
+
+    def _media():
+        yield from range(1, 8)
+
+    assert snapshot.write_snapshot(_media(), "0" * 32) == list(range(1, 8))
+    assert os.listdir(tmp_path) == []
+
+
+def test_snapshot_is_closed_once_replaced(monkeypatch, tmp_path):
+    path = tmp_path / "cache.snapshot"
+    monkeypatch.setattr(snapshot, "snapshot_path", lambda: str(path))
+    monkeypatch.setattr(snapshot, "_SCHEMA", _TextSchema())
+
+    snapshot.write_snapshot([1, 2], "0" * 32)
+    old = snapshot.load_snapshot("0" * 32)
+    assert list(old) == [1, 2]
+
+    snapshot.write_snapshot([3], "1" * 32)
+
+    with pytest.raises(ValueError):
+        list(old)
@@ -1,3 +1,17 @@
 def test_stats(client, asAdmin):
     res = client.get("/stats")
     assert res.status_code == 200
+
+
+def test_cache_stats(client, asAdmin):
+    client.get("/stats")
+
+    res = client.get("/stats/cache")
+    assert res.status_code == 200
+    assert "layers" in res.get_json()
+    assert "commands" in res.get_json()
+
+
+def test_cache_stats_are_owner_only(client, asUser):
+    res = client.get("/stats/cache")
+    assert res.status_code == 403
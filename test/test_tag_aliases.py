@@ -30,3 +30,19 @@ def test_cant_add_duplicate_alias_to_multiple_tags(client, asAdmin):
 def test_cant_add_alias_with_current_tag_name(client, asAdmin):
     res = client.post("/tag/c:tinkerbell/aliases/c:peter")
     assert res.status_code == 400
+
+
+def test_media_are_searchable_by_alias_of_implied_tag(client, asAdmin, nsfw):
+    def _search_ids():
+        res = client.get("/search?q=c:pan&pageNumber=1&pageSize=10")
+        assert res.status_code == 200
+        return [i["id"] for i in res.get_json()["items"]]
+
+    # c:tinkerbell implies u:peter.pan
+    res = client.post("/tag/u:peter.pan/aliases/c:pan")
+    assert res.status_code == 200
+    assert 4 in _search_ids()
+
+    res = client.delete("/tag/u:peter.pan/aliases/c:pan")
+    assert res.status_code == 200
+    assert 4 not in _search_ids()
@@ -48,3 +48,19 @@ def test_removing_implication_for_missing_tag_succeeds(client, asAdmin):
 def test_removing_missing_implication_succeeds(client, asAdmin):
     res = client.delete("/tag/c:tinkerbell/implications/A")
     assert res.status_code == 200
+
+
+def test_removed_implication_is_not_searchable(client, asAdmin, nsfw):
+    def _search_ids():
+        res = client.get("/search?q=A&pageNumber=1&pageSize=10")
+        assert res.status_code == 200
+        return [i["id"] for i in res.get_json()["items"]]
+
+    # Medium 2 has tag C, but not tag A.
+    res = client.patch("/tag/C/implications/A")
+    assert res.status_code == 200
+    assert 2 in _search_ids()
+
+    res = client.delete("/tag/C/implications/A")
+    assert res.status_code == 200
+    assert 2 not in _search_ids()
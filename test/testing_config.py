@@ -5,6 +5,7 @@ SQLALCHEMY_DATABASE_URI = "postgresql://testing:testing@pg:5432/testing"
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
 CELERY_BROKER_URL = "redis://redis:6379/4"
+BEEVENUE_REDIS_HOST = "redis"
 
 COMMIT_ID = "TESTING"
 SENTRY_DSN = "https://examplePublicKey@o0.ingest.sentry.io/0"